@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Therapist, Patient, Appointment
+from .models import Therapist, Patient, Appointment, AppointmentSeries, ArchivedAppointment, WorkingHours
 
 # Register your models here.
 admin.site.register(Therapist)
 admin.site.register(Patient)
 admin.site.register(Appointment)
+admin.site.register(AppointmentSeries)
+admin.site.register(ArchivedAppointment)
+admin.site.register(WorkingHours)
 
@@ -0,0 +1,142 @@
+import hashlib
+
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from .counters import get_versions
+from .forms import AppointmentFilterForm
+from .middleware import query_budget
+from .models import Appointment, ArchivedAppointment, Patient, Therapist
+from .pagination import keyset_paginate
+
+PAGE_SIZE = 50
+
+
+def therapist_data(therapist):
+    return {
+        'id': therapist.therapist_id,
+        'name': therapist.name,
+        'contact': therapist.contact,
+        'specialization': therapist.specialization,
+        'availability': therapist.availability,
+    }
+
+
+def patient_data(patient):
+    return {
+        'id': patient.patient_id,
+        'name': patient.name,
+        'date_of_birth': patient.date_of_birth,
+        'gender': patient.gender,
+        'contact': patient.contact,
+    }
+
+
+def appointment_data(appointment):
+    return {
+        'id': appointment.appointment_id,
+        'therapist': appointment.therapist_id,
+        'therapist_name': appointment.therapist.name if appointment.therapist else None,
+        'patient': appointment.patient_id,
+        'patient_name': appointment.patient.name if appointment.patient else None,
+        'date': appointment.date,
+        'time': appointment.time,
+        'service': appointment.service,
+        'status': appointment.status,
+    }
+
+
+# Which version stamps a response depends on: appointments embed therapist
+# and patient names, so a rename has to change their ETag too
+RESOURCES = {
+    'therapists': {
+        'queryset': lambda: Therapist.objects.all(),
+        'serialize': therapist_data,
+        'keyset': ('therapist_id',),
+        'depends_on': ['therapists'],
+    },
+    'patients': {
+        'queryset': lambda: Patient.objects.all(),
+        'serialize': patient_data,
+        'keyset': ('patient_id',),
+        'depends_on': ['patients'],
+    },
+    'appointments': {
+        'queryset': lambda: Appointment.objects.select_related('therapist', 'patient'),
+        # Where the detail view looks for an id that is not in queryset
+        'archive': lambda: ArchivedAppointment.objects.select_related('therapist', 'patient'),
+        'serialize': appointment_data,
+        'keyset': ('date', 'time', 'appointment_id'),
+        'depends_on': ['appointments', 'therapists', 'patients'],
+    },
+}
+
+
+def _versions(request, kind):
+    # Looked up once per request and shared by the ETag and Last-Modified checks
+    if not hasattr(request, '_api_versions'):
+        request._api_versions = get_versions(RESOURCES[kind]['depends_on'])
+    return request._api_versions
+
+
+def resource_etag(request, kind, pk=None):
+    if kind not in RESOURCES:
+        return None
+    versions = sorted(_versions(request, kind).items())
+    stamp = ';'.join(f'{name}={value}@{updated}' for name, (value, updated) in versions)
+    # The same URL at the same versions always renders the same bytes, so the ETag is strong
+    return hashlib.sha1(f'{request.get_full_path()}|{stamp}'.encode()).hexdigest()
+
+
+def resource_last_modified(request, kind, pk=None):
+    if kind not in RESOURCES:
+        return None
+    stamps = [updated for value, updated in _versions(request, kind).values() if updated is not None]
+    return max(stamps) if stamps else None
+
+
+def _page_url(request, key, cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[key] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+@query_budget(2)
+@require_safe
+@condition(etag_func=resource_etag, last_modified_func=resource_last_modified)
+def resource_list(request, kind):
+    if kind not in RESOURCES:
+        raise Http404("No such resource")
+    resource = RESOURCES[kind]
+    queryset = resource['queryset']()
+    if kind == 'appointments':
+        filter_form = AppointmentFilterForm(request.GET)
+        if not filter_form.is_valid():
+            return JsonResponse({'errors': filter_form.errors}, status=400)
+        queryset = filter_form.filter_queryset(queryset)
+
+    page = keyset_paginate(queryset, resource['keyset'], after=request.GET.get('after'),
+                           before=request.GET.get('before'), per_page=PAGE_SIZE)
+    return JsonResponse({
+        'results': [resource['serialize'](obj) for obj in page.object_list],
+        'next': _page_url(request, 'after', page.next_cursor) if page.has_next else None,
+        'previous': _page_url(request, 'before', page.previous_cursor) if page.has_previous else None,
+    })
+
+
+# One more for an archived appointment
+@query_budget(3)
+@require_safe
+@condition(etag_func=resource_etag, last_modified_func=resource_last_modified)
+def resource_detail(request, kind, pk):
+    if kind not in RESOURCES:
+        raise Http404("No such resource")
+    resource = RESOURCES[kind]
+    obj = resource['queryset']().filter(pk=pk).first()
+    if obj is None and 'archive' in resource:
+        obj = resource['archive']().filter(pk=pk).first()
+    if obj is None:
+        raise Http404("No such object")
+    return JsonResponse(resource['serialize'](obj))
@@ -0,0 +1,73 @@
+"""
+Moves closed appointments out of the hot Appointment table into
+ArchivedAppointment, so the list pages, filters and indexes only deal
+with current bookings. Archived rows keep their ids, still count in the
+counters and the daily rollup, and are found by the detail and export
+views.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Value
+from django.utils import timezone
+
+from .counters import bump_version
+from .models import Appointment, ArchivedAppointment
+
+CLOSED_STATUSES = ['Completed', 'Canceled']
+FIELDS = ['appointment_id', 'therapist_id', 'patient_id', 'status', 'date', 'time', 'service']
+BATCH_SIZE = 5000
+
+
+def archive_cutoff(older_than_days=None, today=None):
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'APPOINTMENT_ARCHIVE_AFTER_DAYS', 365)
+    return (today or timezone.localdate()) - timedelta(days=older_than_days)
+
+
+def archivable(cutoff):
+    # A range on appt_status_date_time_idx for each closed status
+    return Appointment.objects.filter(status__in=CLOSED_STATUSES, date__lt=cutoff).order_by()
+
+
+def _move(ids, archived_at):
+    rows = (Appointment.objects.filter(pk__in=ids).order_by()
+            .annotate(archived_at_value=Value(archived_at, output_field=DateTimeField()))
+            .values(*FIELDS, 'archived_at_value'))
+    select, params = rows.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(ArchivedAppointment._meta.get_field(name).column)
+                        for name in [*FIELDS, 'archived_at'])
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {quote(ArchivedAppointment._meta.db_table)} ({columns}) {select}', params)
+        # Plain DELETE: the rows still exist for the counters and the rollup, so no post_delete bookkeeping
+        cursor.execute(f'DELETE FROM {quote(Appointment._meta.db_table)} '
+                       f'WHERE {quote(Appointment._meta.pk.column)} IN ({placeholders})', ids)
+
+
+def archive_appointments(older_than_days=None, today=None, batch_size=BATCH_SIZE, limit=None, progress=None):
+    """
+    Move Completed and Canceled appointments dated more than
+    older_than_days ago (APPOINTMENT_ARCHIVE_AFTER_DAYS by default) to the
+    archive, batch_size rows per transaction so writers are never held up
+    for long. Returns the number of rows moved.
+    """
+    candidates = archivable(archive_cutoff(older_than_days, today))
+    archived_at = timezone.now()
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic():
+            ids = list(candidates.values_list('pk', flat=True)[:size])
+            if ids:
+                _move(ids, archived_at)
+        if not ids:
+            break
+        moved += len(ids)
+        if progress:
+            progress(moved)
+    if moved:
+        bump_version('appointments')
+    return moved
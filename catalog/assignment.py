@@ -0,0 +1,190 @@
+"""
+Batch assignment of therapists to pending appointments booked without
+one. An appointment can go to any therapist whose specialization is its
+service and who has a FreeSlot at its date and time, so availability,
+working hours and existing bookings are already accounted for. The
+earliest appointments are matched first, each to the least loaded
+candidate, where load is the therapist's pending appointments from today
+on plus what this run has given them.
+"""
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import CharField, Q, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import counters, stats
+from .models import Appointment, AppointmentDailyStat, FreeSlot, Therapist
+
+NO_SERVICE = 'no service'
+NO_FREE_THERAPIST = 'no free therapist'
+
+# Therapists per specialization whose free slots are read at first; doubled each time more are needed
+FIRST_TRANCHE = 64
+
+
+def unassigned_appointments(now=None):
+    """Appointments without a therapist that have not started yet, earliest first."""
+    now = timezone.localtime(now)
+    upcoming = Q(date__gt=now.date()) | Q(date=now.date(), time__gte=now.time())
+    # A range on appt_therapist_date_time_idx. Filtering on status as well would let SQLite, which has no
+    # statistics to go by, pick appt_status_date_time_idx and read every upcoming pending appointment instead.
+    return (Appointment.objects.filter(upcoming, therapist__isnull=True, date__gte=now.date(), time__isnull=False)
+            .order_by('date', 'time', 'appointment_id'))
+
+
+def therapist_loads(today=None):
+    """Pending appointments from today on per therapist, read from the daily rollup rather than counted."""
+    rows = (AppointmentDailyStat.objects.filter(therapist__isnull=False, status='Pending',
+                                                date__gte=today or timezone.localdate())
+            .values('therapist_id').annotate(total=Sum('count')).values_list('therapist_id', 'total'))
+    return Counter(dict(rows))
+
+
+class _Candidates:
+    """
+    The free therapists for each (service, date, time) of a batch, in a
+    heap keyed on load. With thousands of therapists most of them may be
+    free at any one time, so free slots are read least loaded therapist
+    first and only as far as needed: a pick is final once it beats the
+    load every therapist not read yet started with, since loads only go
+    up. Dates and times are kept as text, as read from the database.
+    """
+
+    def __init__(self, rows, load):
+        self.load = load
+        self.wanted = {(service, str(day), str(at)) for pk, service, day, at in rows}
+        self.first = min(row[2] for row in rows)
+        self.last = max(row[2] for row in rows)
+        self.order = defaultdict(list)
+        therapists = (Therapist.objects.filter(specialization__in={row[1] for row in rows})
+                      .exclude(availability='B').values_list('pk', 'specialization'))
+        for pk, specialization in therapists:
+            self.order[specialization].append(pk)
+        for pks in self.order.values():
+            pks.sort(key=lambda pk: (load[pk], pk))
+        self.read = Counter()
+        self.tranche = defaultdict(lambda: FIRST_TRANCHE)
+        self.heaps = defaultdict(list)
+
+    def _read_more(self, specialization):
+        done = self.read[specialization]
+        pks = self.order[specialization][done:done + self.tranche[specialization]]
+        self.read[specialization] += len(pks)
+        self.tranche[specialization] *= 2
+        # One range per therapist on unique_free_slot; scanning it beats a lookup per wanted date and time
+        free = (FreeSlot.objects.filter(therapist_id__in=pks, date__gte=self.first, date__lte=self.last).order_by()
+                .values_list('pk', 'therapist_id', Cast('date', CharField()), Cast('time', CharField())))
+        sql, params = free.query.sql_with_params()
+        with connection.cursor() as cursor:
+            # Straight off the cursor: there can be hundreds of thousands of these
+            cursor.execute(sql, params)
+            for slot, therapist_id, day, at in cursor.cursor:
+                key = (specialization, day, at)
+                if key in self.wanted:
+                    heapq.heappush(self.heaps[key], (self.load[therapist_id], therapist_id, slot))
+
+    def _unread_floor(self, specialization):
+        # Therapists not read yet have been given nothing, so their load is still where the order put them
+        pks = self.order[specialization]
+        if self.read[specialization] < len(pks):
+            pk = pks[self.read[specialization]]
+            return (self.load[pk], pk)
+        return None
+
+    def take(self, key):
+        """Remove and return (therapist id, free slot id) for the least loaded therapist free at key, or None."""
+        heap = self.heaps[key]
+        while True:
+            # Entries for therapists given work since they were pushed move down to their current load
+            while heap and heap[0][0] != self.load[heap[0][1]]:
+                queued_load, therapist_id, slot = heapq.heappop(heap)
+                heapq.heappush(heap, (self.load[therapist_id], therapist_id, slot))
+            floor = self._unread_floor(key[0])
+            if floor is None or (heap and heap[0][:2] < floor):
+                break
+            self._read_more(key[0])
+        if not heap:
+            return None
+        queued_load, therapist_id, slot = heapq.heappop(heap)
+        return therapist_id, slot
+
+
+def plan_assignments(limit=None, now=None):
+    """
+    Work out who should take each unassigned appointment without changing
+    anything. Returns a dict with the assignments as (appointment id,
+    therapist id, date, time), the free slot each one takes, the
+    appointments left over with the reason, and the resulting load of
+    every therapist given work.
+    """
+    # Streamed, so that limit also stops the read rather than only trimming it
+    unassigned = unassigned_appointments(now).values_list('pk', 'service', 'date', 'time', 'status')
+    pending = (row[:4] for row in unassigned.iterator() if row[4] == 'Pending')
+    rows = list(islice(pending, limit))
+    plan = {'assignments': [], 'slots': {}, 'unassigned': {}, 'load': {}}
+    matchable = [row for row in rows if row[1]]
+    for pk, service, day, at in rows:
+        if not service:
+            plan['unassigned'][pk] = NO_SERVICE
+    if not matchable:
+        return plan
+
+    load = therapist_loads(timezone.localdate(now))
+    candidates = _Candidates(matchable, load)
+    for pk, service, day, at in matchable:
+        picked = candidates.take((service, str(day), str(at)))
+        if picked is None:
+            plan['unassigned'][pk] = NO_FREE_THERAPIST
+            continue
+        therapist_id, slot = picked
+        load[therapist_id] += 1
+        plan['assignments'].append((pk, therapist_id, day, at))
+        plan['slots'][pk] = slot
+
+    plan['load'] = {therapist_id: load[therapist_id] for pk, therapist_id, day, at in plan['assignments']}
+    return plan
+
+
+def assign_therapists(limit=None, now=None, dry_run=False):
+    """
+    Plan and apply the assignments, with one UPDATE per therapist. An
+    appointment assigned or a slot booked by someone else in the meantime
+    is left out and reported under 'conflicts' rather than overwritten.
+    With dry_run the plan is returned without applying it.
+    """
+    plan = plan_assignments(limit, now)
+    plan.update(assigned=0, conflicts=[])
+    if dry_run or not plan['assignments']:
+        return plan
+
+    by_therapist = defaultdict(list)
+    for pk, therapist_id, day, at in plan['assignments']:
+        by_therapist[therapist_id].append(pk)
+    # Still pending, but put so that SQLite seeks on the primary key rather than on appt_status_date_time_idx
+    still_open = Appointment.objects.exclude(status__in=['Completed', 'Canceled'])
+    with transaction.atomic():
+        for therapist_id, pks in by_therapist.items():
+            try:
+                with transaction.atomic():
+                    updated = still_open.filter(pk__in=pks, therapist__isnull=True).update(therapist_id=therapist_id)
+            except IntegrityError:
+                # One of the slots was booked since the free-slot index was read
+                plan['conflicts'].extend(pks)
+                continue
+            if updated < len(pks):
+                taken = set(Appointment.objects.filter(pk__in=pks).exclude(therapist_id=therapist_id)
+                            .values_list('pk', flat=True))
+                plan['conflicts'].extend(pk for pk in pks if pk in taken)
+            plan['assigned'] += updated
+
+        # What the post_save receivers would have done for each appointment
+        conflicts = set(plan['conflicts'])
+        done = [row for row in plan['assignments'] if row[0] not in conflicts]
+        FreeSlot.objects.filter(pk__in=[plan['slots'][row[0]] for row in done]).delete()
+        stats.rebuild_appointment_stats({row[1] for row in done} | {None}, {row[2] for row in done})
+        counters.bump_version('appointments')
+    return plan
@@ -0,0 +1,139 @@
+"""
+Async versions of the catalog read views, for serving under ASGI
+(merakitherapy/asgi.py). They render the same templates as the views in
+catalog/views.py but await the ORM instead of holding a worker thread.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from .cache import aversion_stamp
+from .counters import aget_counts
+from .forms import AppointmentFilterForm, PatientAgeForm
+from .middleware import query_budget
+from .models import Appointment, ArchivedAppointment, Patient, Therapist
+from .pagination import akeyset_paginate
+from .search import search
+from .stats import adashboard_stats
+from .views import (AppointmentListView, age_distribution, dashboard_range, gender_distribution,
+                    most_chosen_specialization_queryset)
+
+
+async def _render(request, template_name, context):
+    # Resolve the lazy request.user first, the base template checks it
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
+
+async def _get_or_404(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.verbose_name} found matching the query")
+
+
+def _page_query(request, key, cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[key] = cursor
+    return query.urlencode()
+
+
+@query_budget(4)
+async def appointment_list(request):
+    filter_form = AppointmentFilterForm(request.GET)
+    queryset = Appointment.objects.select_related('therapist', 'patient')
+    # Validating the therapist choice looks it up, which is a blocking query
+    if await sync_to_async(filter_form.is_valid)():
+        queryset = filter_form.filter_queryset(queryset)
+
+    page = await akeyset_paginate(queryset, AppointmentListView.keyset_fields,
+                                  after=request.GET.get('after'), before=request.GET.get('before'),
+                                  per_page=AppointmentListView.page_size)
+
+    # Load the therapist choices here so rendering the form does not query
+    therapist = filter_form.fields['therapist']
+    therapist.choices = [('', therapist.empty_label)] + [(obj.pk, str(obj)) async for obj in therapist.queryset]
+
+    context = {
+        'appointments': page.object_list,
+        'filter_form': filter_form,
+        'page': page,
+        'row_version': await aversion_stamp(AppointmentListView.row_version_kinds),
+    }
+    if page.has_next:
+        context['next_query'] = _page_query(request, 'after', page.next_cursor)
+    if page.has_previous:
+        context['previous_query'] = _page_query(request, 'before', page.previous_cursor)
+    return await _render(request, 'catalog/appointment_list.html', context)
+
+
+@query_budget(2)
+async def appointment_detail(request, pk):
+    appointment = await Appointment.objects.select_related('therapist', 'patient').filter(pk=pk).afirst()
+    if appointment is None:
+        appointment = await _get_or_404(ArchivedAppointment.objects.select_related('therapist', 'patient'), pk)
+    return await _render(request, 'catalog/appointment_detail.html', {'appointment': appointment})
+
+
+async def _search_list(request, kind, queryset):
+    query = request.GET.get('q', '').strip()
+    if query:
+        # The search index is queried with raw SQL, which has no async API
+        return await sync_to_async(search)(kind, query, limit=50)
+    return [obj async for obj in queryset.aiterator()]
+
+
+@query_budget(3)
+async def patient_list(request):
+    age_form = PatientAgeForm(request.GET)
+    queryset = Patient.objects.all()
+    if age_form.is_valid():
+        queryset = queryset.age_between(age_form.cleaned_data['min_age'], age_form.cleaned_data['max_age'])
+    context = {
+        'patients': await _search_list(request, 'patients', queryset),
+        'age_form': age_form,
+        'row_version': await aversion_stamp(('patients',)),
+    }
+    return await _render(request, 'catalog/patient_list.html', context)
+
+
+@query_budget(1)
+async def patient_detail(request, pk):
+    patient = await _get_or_404(Patient.objects.with_age(), pk)
+    return await _render(request, 'catalog/patient_detail.html', {'patient': patient})
+
+
+@query_budget(3)
+async def therapist_list(request):
+    context = {
+        'therapists': await _search_list(request, 'therapists', Therapist.objects.all()),
+        'row_version': await aversion_stamp(('therapists',)),
+    }
+    return await _render(request, 'catalog/therapist_list.html', context)
+
+
+@query_budget(1)
+async def therapist_detail(request, pk):
+    therapist = await _get_or_404(Therapist.objects.all(), pk)
+    return await _render(request, 'catalog/therapist_detail.html', {'therapist': therapist})
+
+
+@query_budget(4)
+async def therapist_dashboard(request):
+    counts = await aget_counts()
+    range_form, date_from, date_to = dashboard_range(request)
+
+    context = {
+        'num_patients': counts['patients'],
+        'num_appointments': counts['appointments'],
+        'gender_distribution': gender_distribution(counts),
+        'age_distribution': age_distribution(await Patient.objects.aage_bands()),
+        'most_chosen_specialization': await most_chosen_specialization_queryset().afirst(),
+        'range_form': range_form,
+        'date_from': date_from,
+        'date_to': date_to,
+        'appointment_stats': await adashboard_stats(date_from, date_to),
+    }
+    return await _render(request, 'catalog/therapist_dashboard.html', context)
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, FreeSlot, Therapist, WorkingHours
+
+# Length of one bookable slot and how far ahead the index is kept
+SLOT_LENGTH = timedelta(hours=1)
+HORIZON_DAYS = 90
+
+
+def _slot_starts(day, hours):
+    for block in hours:
+        start = datetime.combine(day, block.start_time)
+        end = datetime.combine(day, block.end_time)
+        while start + SLOT_LENGTH <= end:
+            yield start
+            start += SLOT_LENGTH
+
+
+def _booked_ranges(therapist_id, start_day, end_day):
+    booked = defaultdict(list)
+    appointments = (Appointment.objects
+                    .filter(therapist_id=therapist_id, date__gte=start_day, date__lte=end_day, time__isnull=False)
+                    .exclude(status='Canceled')
+                    .values_list('date', 'time'))
+    for day, time in appointments:
+        start = datetime.combine(day, time)
+        booked[day].append((start, start + SLOT_LENGTH))
+    return booked
+
+
+def compute_free_slots(therapist, start_day, end_day):
+    """Return unsaved FreeSlots for therapist between start_day and end_day inclusive."""
+    if therapist.availability == 'B':
+        return []
+    hours_by_weekday = defaultdict(list)
+    for block in WorkingHours.objects.filter(therapist=therapist):
+        hours_by_weekday[block.weekday].append(block)
+    if not hours_by_weekday:
+        return []
+
+    now = timezone.localtime().replace(tzinfo=None)
+    booked = _booked_ranges(therapist.pk, start_day, end_day)
+    slots = []
+    day = start_day
+    while day <= end_day:
+        for start in _slot_starts(day, hours_by_weekday[day.weekday()]):
+            end = start + SLOT_LENGTH
+            if start < now or any(b_start < end and start < b_end for b_start, b_end in booked[day]):
+                continue
+            slots.append(FreeSlot(therapist=therapist, specialization=therapist.specialization,
+                                  date=day, time=start.time()))
+        day += timedelta(days=1)
+    return slots
+
+
+def refresh_free_slots(therapist, start_day=None, end_day=None):
+    """Recompute the free slots of one therapist for a range of days."""
+    today = timezone.localdate()
+    start_day = max(start_day or today, today)
+    end_day = min(end_day or today + timedelta(days=HORIZON_DAYS), today + timedelta(days=HORIZON_DAYS))
+    with transaction.atomic():
+        FreeSlot.objects.filter(therapist=therapist, date__gte=start_day, date__lte=end_day).delete()
+        if start_day <= end_day:
+            FreeSlot.objects.bulk_create(compute_free_slots(therapist, start_day, end_day))
+
+
+def refresh_day(therapist_id, day):
+    # Called when an appointment takes or releases a slot on this day
+    if therapist_id is None or day is None:
+        return
+    therapist = Therapist.objects.filter(pk=therapist_id).first()
+    if therapist is not None:
+        refresh_free_slots(therapist, day, day)
+
+
+def rebuild_free_slots():
+    """Rebuild the whole index, dropping past slots and extending the horizon."""
+    FreeSlot.objects.filter(date__lt=timezone.localdate()).delete()
+    for therapist in Therapist.objects.iterator():
+        refresh_free_slots(therapist)
+
+
+def next_free_slots(specialization=None, after=None, limit=10):
+    """Return the next limit open slots from after (default now), earliest first."""
+    after = after or timezone.localtime().replace(tzinfo=None)
+    slots = FreeSlot.objects.select_related('therapist').filter(date__gte=after.date()).exclude(
+        date=after.date(), time__lt=after.time())
+    if specialization:
+        slots = slots.filter(specialization=specialization)
+    return slots.order_by('date', 'time', 'therapist_id')[:limit]
@@ -0,0 +1,82 @@
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+import django
+from django.db import connection
+
+from .models import Appointment, Patient, Therapist
+from .seeding import seed_catalog
+
+DEFAULT_DATABASE = os.path.join(tempfile.gettempdir(), 'merakitherapy_bench.sqlite3')
+
+
+def percentile(values, p):
+    # values must be sorted
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+def summarise(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]),
+    }
+
+
+def environment():
+    """Versions and the current commit, so saved reports can be compared."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version}
+
+
+def add_dataset_arguments(parser, therapists=50, patients=5000, appointments=50000):
+    parser.add_argument('--therapists', type=int, default=therapists)
+    parser.add_argument('--patients', type=int, default=patients)
+    parser.add_argument('--appointments', type=int, default=appointments)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help="SQLite file to seed and run against.")
+    parser.add_argument('--reseed', action='store_true', help="Recreate the database even if it matches.")
+
+
+def setup_database(path, sizes, seed=0, reseed=False, log=print):
+    """
+    Point the default connection at the SQLite file path, seeded with sizes
+    rows. The file is kept between runs and only reseeded when its row
+    counts differ. Returns the name to pass to teardown_database().
+    """
+    connection.settings_dict['TEST']['NAME'] = path
+    old_name = connection.settings_dict['NAME']
+    existing = os.path.exists(path) and not reseed
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=existing)
+    counts = {'therapists': Therapist.objects.count(), 'patients': Patient.objects.count(),
+              'appointments': Appointment.objects.count()}
+    if existing and counts != sizes:
+        log(f"{path} holds {counts}, reseeding")
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = path
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        existing = False
+    if not existing:
+        started = time.perf_counter()
+        seed_catalog(seed=seed, **sizes)
+        log(f"Seeded {sizes} in {time.perf_counter() - started:.1f}s")
+    return old_name
+
+
+def teardown_database(old_name):
+    connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=True)
@@ -0,0 +1,66 @@
+import random
+from time import sleep
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import Appointment
+
+
+SLOT_TAKEN_MESSAGE = "This therapist is already booked at that date and time."
+
+# SQLite reports a busy writer as "database is locked"; retry those briefly
+LOCK_RETRIES = 20
+
+
+class SlotTaken(ValidationError):
+    pass
+
+
+def active_bookings(therapist, date, time):
+    # Served by the unique_active_therapist_slot partial index
+    return Appointment.objects.filter(therapist=therapist, date=date, time=time).exclude(status='Canceled')
+
+
+def slot_taken(appointment):
+    """Return True if another active appointment holds appointment's therapist slot."""
+    if appointment.therapist_id is None or appointment.date is None or appointment.time is None:
+        return False
+    if appointment.status == 'Canceled':
+        return False
+    bookings = active_bookings(appointment.therapist_id, appointment.date, appointment.time)
+    if appointment.pk is not None:
+        bookings = bookings.exclude(pk=appointment.pk)
+    return bookings.exists()
+
+
+def book_appointment(appointment):
+    """
+    Save appointment, raising SlotTaken if its therapist is already booked
+    at the same date and time.
+
+    The exists() check answers the common case without writing anything.
+    Two bookings racing past it are settled by the unique constraint: the
+    losing INSERT/UPDATE fails inside its own savepoint and is reported as
+    SlotTaken, so no table lock is needed.
+    """
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return _book(appointment)
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == LOCK_RETRIES:
+                raise
+            sleep(random.uniform(0, min(0.001 * 2 ** attempt, 0.1)))
+
+
+def _book(appointment):
+    if slot_taken(appointment):
+        raise SlotTaken(SLOT_TAKEN_MESSAGE, code='slot_taken')
+    try:
+        with transaction.atomic():
+            appointment.save()
+    except IntegrityError:
+        if slot_taken(appointment):
+            raise SlotTaken(SLOT_TAKEN_MESSAGE, code='slot_taken')
+        raise
+    return appointment
@@ -0,0 +1,97 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .counters import aget_versions, get_versions
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _stamp(versions):
+    versions = ';'.join(f'{kind}={value}@{updated}' for kind, (value, updated) in sorted(versions.items()))
+    return hashlib.sha1(versions.encode()).hexdigest()
+
+
+def version_stamp(kinds):
+    """Short hash of the current version stamps of kinds, for cache keys."""
+    return _stamp(get_versions(kinds))
+
+
+async def aversion_stamp(kinds):
+    return _stamp(await aget_versions(kinds))
+
+
+def user_variant(user):
+    # Anonymous visitors share one copy; signed-in users get their own,
+    # split again by permissions so a grant or revoke shows immediately
+    if not user.is_authenticated:
+        return 'anon'
+    permissions = ','.join(sorted(user.get_all_permissions()))
+    flags = f'{int(user.is_staff)}{int(user.is_superuser)}'
+    return f"user{user.pk}:{flags}:{hashlib.sha1(permissions.encode()).hexdigest()[:16]}"
+
+
+def _record(cache, view_name, outcome):
+    for key in (f'catalog:stats:{outcome}', f'catalog:stats:{view_name}:{outcome}'):
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 1, timeout=None)
+
+
+def cache_stats(view_names=()):
+    """Return {name: {'hits', 'misses', 'ratio'}} overall ('all') and for each view name."""
+    cache = get_cache()
+    result = {}
+    for name in ['all', *view_names]:
+        prefix = 'catalog:stats' if name == 'all' else f'catalog:stats:{name}'
+        hits = cache.get(f'{prefix}:hit', 0)
+        misses = cache.get(f'{prefix}:miss', 0)
+        result[name] = {'hits': hits, 'misses': misses, 'ratio': hits / (hits + misses) if hits + misses else 0.0}
+    return result
+
+
+def cache_catalog_view(*kinds):
+    """
+    Cache successful GET responses of a view until one of the tables in
+    kinds changes. The key holds the version stamps that catalog.signals
+    bump on every save/delete, so a write makes old entries unreachable
+    instead of having to find and delete them.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'CATALOG_CACHE_ENABLED', True) or request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            cache = get_cache()
+            # URL name, e.g. "catalog:patient_list", for the key and the hit/miss stats
+            view_name = getattr(request.resolver_match, 'view_name', None) or view_func.__name__
+            path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+            key = f'catalog:view:{view_name}:{user_variant(request.user)}:{path}:{version_stamp(kinds)}'
+
+            response = cache.get(key)
+            if response is not None:
+                _record(cache, view_name, 'hit')
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _record(cache, view_name, 'miss')
+            response = view_func(request, *args, **kwargs)
+            response['X-Cache'] = 'MISS'
+            if response.status_code == 200 and not response.streaming:
+                timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.add_post_render_callback(lambda r: cache.set(key, r, timeout))
+                else:
+                    cache.set(key, response, timeout)
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Appointment, ArchivedAppointment, Counter, Patient, Therapist
+
+COUNTED_MODELS = {
+    'therapists': Therapist,
+    'patients': Patient,
+    'appointments': Appointment,
+}
+
+# Archived rows still count towards their kind's total
+ARCHIVED_MODELS = {
+    'appointments': ArchivedAppointment,
+}
+
+# Patients per gender for the dashboard, e.g. "patients_F"
+GENDER_COUNTERS = {code: f'patients_{code}' for code, label in Patient.GENDER_CHOICES}
+
+
+def counter_name(model):
+    for name, counted in (*COUNTED_MODELS.items(), *ARCHIVED_MODELS.items()):
+        if counted is model:
+            return name
+    return None
+
+
+def _counted_queryset(name):
+    if name in COUNTED_MODELS:
+        return COUNTED_MODELS[name].objects.all()
+    for code, gender_name in GENDER_COUNTERS.items():
+        if gender_name == name:
+            return Patient.objects.filter(gender=code)
+    raise KeyError(name)
+
+
+def recount(name):
+    value = _counted_queryset(name).count()
+    if name in ARCHIVED_MODELS:
+        value += ARCHIVED_MODELS[name].objects.count()
+    Counter.objects.update_or_create(name=name, defaults={'value': value})
+    return value
+
+
+def increment(name, delta=1):
+    updated = Counter.objects.filter(name=name).update(value=F('value') + delta, updated=timezone.now())
+    if not updated:
+        # First use or the row was removed: start again from a real count
+        recount(name)
+
+
+def get_counts():
+    """Return {name: value} for every counter in a single query."""
+    names = list(COUNTED_MODELS) + list(GENDER_COUNTERS.values())
+    counts = dict(Counter.objects.filter(name__in=names).values_list('name', 'value'))
+    for name in names:
+        if name not in counts:
+            counts[name] = recount(name)
+    return counts
+
+
+async def arecount(name):
+    value = await _counted_queryset(name).acount()
+    if name in ARCHIVED_MODELS:
+        value += await ARCHIVED_MODELS[name].objects.acount()
+    await Counter.objects.aupdate_or_create(name=name, defaults={'value': value})
+    return value
+
+
+async def aget_counts():
+    """Async version of get_counts()."""
+    names = list(COUNTED_MODELS) + list(GENDER_COUNTERS.values())
+    counts = {name: value async for name, value in Counter.objects.filter(name__in=names).values_list('name', 'value')}
+    for name in names:
+        if name not in counts:
+            counts[name] = await arecount(name)
+    return counts
+
+
+def rebuild_counters():
+    names = list(COUNTED_MODELS) + list(GENDER_COUNTERS.values())
+    return {name: recount(name) for name in names}
+
+
+# Per-table version stamps, bumped on every write. Anything derived from a
+# table (ETags, cached responses) can key on them instead of reading the table.
+
+def version_name(kind):
+    return f'version_{kind}'
+
+
+def bump_version(kind):
+    name = version_name(kind)
+    updated = Counter.objects.filter(name=name).update(value=F('value') + 1, updated=timezone.now())
+    if not updated:
+        Counter.objects.get_or_create(name=name, defaults={'value': 1})
+
+
+def _version_rows(kinds):
+    names = {version_name(kind): kind for kind in kinds}
+    return names, Counter.objects.filter(name__in=names).values_list('name', 'value', 'updated')
+
+
+def get_versions(kinds):
+    """Return {kind: (version, last modified)} for kinds in a single query."""
+    names, rows = _version_rows(kinds)
+    versions = {kind: (0, None) for kind in kinds}
+    for name, value, updated in rows:
+        versions[names[name]] = (value, updated)
+    return versions
+
+
+async def aget_versions(kinds):
+    names, rows = _version_rows(kinds)
+    versions = {kind: (0, None) for kind in kinds}
+    async for name, value, updated in rows:
+        versions[names[name]] = (value, updated)
+    return versions
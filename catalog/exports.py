@@ -0,0 +1,93 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Appointment, ArchivedAppointment, Patient, Therapist
+
+# Columns per export. Appointment columns match what import_catalog reads,
+# so an export can be loaded into another database as is.
+EXPORTS = {
+    'appointments': {
+        'model': Appointment,
+        # Exported together with the live rows, in one ordered stream
+        'archive': ArchivedAppointment,
+        'columns': ['appointment_id', 'therapist', 'therapist_name', 'patient', 'patient_name', 'date', 'time',
+                    'service', 'status'],
+        'fields': ['appointment_id', 'therapist_id', 'therapist__name', 'patient_id', 'patient__name', 'date', 'time',
+                   'service', 'status'],
+        # Same order as the list view, served by appt_date_time_idx
+        'ordering': ['date', 'time', 'appointment_id'],
+    },
+    'patients': {
+        'model': Patient,
+        'columns': ['patient_id', 'name', 'date_of_birth', 'gender', 'contact'],
+        'fields': ['patient_id', 'name', 'date_of_birth', 'gender', 'contact'],
+        # Primary key order needs no sort, so the first rows go out at once
+        'ordering': ['patient_id'],
+    },
+    'therapists': {
+        'model': Therapist,
+        'columns': ['therapist_id', 'name', 'contact', 'specialization', 'availability'],
+        'fields': ['therapist_id', 'name', 'contact', 'specialization', 'availability'],
+        'ordering': ['therapist_id'],
+    },
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    # csv.writer needs a file; this one hands each line straight back
+    def write(self, value):
+        return value
+
+
+def export_rows(kind, queryset=None, archived=None):
+    spec = EXPORTS[kind]
+    if queryset is None:
+        queryset = spec['model'].objects.all()
+    # values_list joins therapist/patient names in the same query and skips model instances
+    rows = queryset.order_by().values_list(*spec['fields'])
+    if 'archive' in spec:
+        if archived is None:
+            archived = spec['archive'].objects.all()
+        rows = rows.union(archived.order_by().values_list(*spec['fields']), all=True)
+    return rows.order_by(*spec['ordering']).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_csv(kind, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORTS[kind]['columns'])
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_jsonl(kind, rows):
+    columns = EXPORTS[kind]['columns']
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    for row in rows:
+        chunk.append(encoder.encode(dict(zip(columns, row))) + '\n')
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_export(kind, fmt, queryset=None, archived=None):
+    rows = export_rows(kind, queryset, archived)
+    if fmt == 'csv':
+        return stream_csv(kind, rows)
+    return stream_jsonl(kind, rows)
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Patient, Appointment, Therapist
+from .models import Patient, Appointment, AppointmentSeries, Therapist
 
 
 class PatientRegistrationForm(forms.ModelForm):
@@ -18,3 +18,63 @@ class AppointmentForm(forms.ModelForm):
     class Meta:
         model = Appointment
         fields = ['therapist', 'patient', 'date', 'time', 'service']
+
+
+class AppointmentSeriesForm(forms.ModelForm):
+    class Meta:
+        model = AppointmentSeries
+        fields = ['therapist', 'patient', 'service', 'start_date', 'time', 'frequency', 'count', 'until']
+
+
+class SeriesChangeForm(forms.Form):
+    from_date = forms.DateField(label='From', help_text="Change the pending appointments on or after this date.")
+    therapist = forms.ModelChoiceField(queryset=Therapist.objects.all(), required=False,
+                                       empty_label='Keep the therapist')
+    time = forms.TimeField(required=False)
+    service = forms.ChoiceField(choices=[('', 'Keep the service')] + Appointment.SERVICE_CHOICES, required=False)
+
+
+class AppointmentFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'Any status')] + Appointment.APPOINTMENT_STATUS_CHOICES, required=False)
+    therapist = forms.ModelChoiceField(queryset=Therapist.objects.all(), required=False, empty_label='Any therapist')
+    service = forms.ChoiceField(choices=[('', 'Any service')] + Appointment.SERVICE_CHOICES, required=False)
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+        if data.get('status'):
+            queryset = queryset.filter(status=data['status'])
+        if data.get('therapist'):
+            queryset = queryset.filter(therapist=data['therapist'])
+        if data.get('service'):
+            queryset = queryset.filter(service=data['service'])
+        if data.get('date_from'):
+            queryset = queryset.filter(date__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(date__lte=data['date_to'])
+        return queryset
+
+
+class PatientAgeForm(forms.Form):
+    min_age = forms.IntegerField(min_value=0, required=False, label='Aged from')
+    max_age = forms.IntegerField(min_value=0, required=False, label='to')
+
+
+class NextAvailableForm(forms.Form):
+    specialization = forms.ChoiceField(choices=[('', 'Any')] + Therapist.SPECIALIZATION_CHOICES, required=False)
+    date = forms.DateField(required=False)
+    time = forms.TimeField(required=False)
+    limit = forms.IntegerField(min_value=1, max_value=100, required=False)
+
+
+class DashboardRangeForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(max_length=100)
+    kind = forms.ChoiceField(choices=[('', 'All'), ('patients', 'Patients'), ('therapists', 'Therapists')],
+                             required=False)
+    limit = forms.IntegerField(min_value=1, max_value=100, required=False)
@@ -0,0 +1,204 @@
+"""
+A job queue kept in the catalog database, so slow side effects can leave
+the request without a separate broker. Functions registered with @task
+are queued with enqueue() and run by "manage.py run_worker". A worker
+leases the jobs it takes; a job whose worker died is picked up again once
+its lease runs out. Failed attempts are retried with exponential backoff
+up to max_attempts.
+"""
+import logging
+import random
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('catalog.jobs')
+
+TASKS = {}
+
+# Tries at recording a job's outcome while other workers hold the SQLite write lock, FINISH_RETRY_SECONDS apart
+# and doubling
+FINISH_ATTEMPTS = 5
+FINISH_RETRY_SECONDS = 0.05
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register func as a job task under name, by default its module and
+    function name. It is called with the JSON kwargs given to enqueue(),
+    or to func.enqueue(**kwargs), whose optional first argument is a dict
+    of enqueue() options such as queue or delay. A task that outlives
+    JOB_LEASE_SECONDS, or whose worker dies, runs again, so it must be
+    safe to repeat.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        TASKS[task_name] = {'func': func, 'max_attempts': max_attempts}
+        func.task_name = task_name
+        func.enqueue = lambda _options=None, **kwargs: enqueue(task_name, kwargs, **(_options or {}))
+        return func
+    return decorator if func is None else decorator(func)
+
+
+def enqueue(task_name, kwargs=None, queue='default', run_at=None, delay=None, max_attempts=None):
+    if task_name not in TASKS:
+        raise KeyError(f"No task registered as {task_name!r}")
+    run_at = run_at or timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    max_attempts = max_attempts or TASKS[task_name]['max_attempts'] or _setting('JOB_MAX_ATTEMPTS', 5)
+    return Job.objects.create(task=task_name, kwargs=kwargs or {}, queue=queue, run_at=run_at,
+                              max_attempts=max_attempts)
+
+
+def backoff(attempts):
+    """Seconds to wait before attempt attempts + 1: doubling from JOB_BACKOFF_SECONDS, capped, with jitter."""
+    delay = min(_setting('JOB_BACKOFF_MAX_SECONDS', 3600), _setting('JOB_BACKOFF_SECONDS', 10) * 2 ** (attempts - 1))
+    # Spread out retries of jobs that failed together
+    return delay * random.uniform(0.5, 1)
+
+
+def _claimable(queue, now):
+    due = Q(status=Job.QUEUED, run_at__lte=now)
+    expired = Q(status=Job.RUNNING, leased_until__lt=now)
+    return Job.objects.filter(due | expired, queue=queue)
+
+
+def claim(worker, queue='default', limit=1, now=None):
+    """
+    Lease up to limit due jobs of queue to worker, oldest first. Picking and
+    leasing is one UPDATE that repeats the conditions of the pick, so of two
+    workers racing for the same job only one gets it.
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    lease = _setting('JOB_LEASE_SECONDS', 300)
+    with transaction.atomic():
+        candidates = _claimable(queue, now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Other workers pass over these rows instead of queueing behind this one
+            candidates = candidates.select_for_update(skip_locked=True)
+        # Writing first means SQLite takes the write lock at once instead of upgrading a read lock
+        _claimable(queue, now).filter(pk__in=candidates.values('pk')[:limit]).update(
+            status=Job.RUNNING, lease_token=token, leased_until=now + timedelta(seconds=lease), worker=worker,
+            attempts=F('attempts') + 1, started_at=now)
+        return list(Job.objects.filter(lease_token=token))
+
+
+def _finish(job, **fields):
+    # A no-op if the lease ran out and another worker has taken the job since
+    finished = Job.objects.filter(pk=job.pk, lease_token=job.lease_token)
+    for attempt in range(FINISH_ATTEMPTS):
+        try:
+            return finished.update(lease_token='', leased_until=None, **fields)
+        except OperationalError:
+            # Giving up would leave the job running until its lease ran out, and then run it again
+            if attempt == FINISH_ATTEMPTS - 1:
+                raise
+            time.sleep(FINISH_RETRY_SECONDS * 2 ** attempt * random.uniform(0.5, 1))
+
+
+def run(job):
+    """Run a claimed job and record the outcome. Returns True if it succeeded."""
+    started = time.perf_counter()
+    try:
+        spec = TASKS.get(job.task)
+        if spec is None:
+            raise LookupError(f"No task registered as {job.task!r}")
+        spec['func'](**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = backoff(job.attempts)
+            _finish(job, status=Job.QUEUED, run_at=timezone.now() + timedelta(seconds=delay), last_error=error)
+            logger.warning("%s failed, retrying in %.0fs", job, delay, exc_info=True)
+        else:
+            _finish(job, status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+            logger.error("%s failed for good", job, exc_info=True)
+        return False
+    _finish(job, status=Job.DONE, finished_at=timezone.now())
+    logger.debug("%s done in %.3fs", job, time.perf_counter() - started)
+    return True
+
+
+def work(worker, queue='default', batch=1, poll=1.0, burst=False, should_stop=lambda: False):
+    """
+    Claim and run jobs until should_stop() returns True, or with burst
+    until the queue has no due jobs left. Returns the number of jobs run.
+    """
+    processed = 0
+    while not should_stop():
+        try:
+            jobs = claim(worker, queue, batch)
+        except OperationalError:
+            # Lost a race for the SQLite write lock; the job is still there next time
+            logger.debug("%s could not claim a job", worker, exc_info=True)
+            jobs = []
+        if not jobs:
+            if burst:
+                break
+            time.sleep(poll)
+            continue
+        for job in jobs:
+            try:
+                run(job)
+            except OperationalError:
+                # The outcome could not be recorded; the job runs again once its lease is up
+                logger.error("%s ran but could not be marked finished", job, exc_info=True)
+            processed += 1
+    return processed
+
+
+def purge_jobs(older_than=None):
+    """Delete finished jobs older than older_than seconds (JOB_KEEP_SECONDS), keeping recent ones for metrics."""
+    cutoff = timezone.now() - timedelta(seconds=older_than or _setting('JOB_KEEP_SECONDS', 86400))
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def job_metrics(window=300, queue=None):
+    """
+    Queue depth, lag and throughput in one query: jobs per status, how long
+    the oldest due job has been waiting, and over the last window seconds
+    the jobs finished per second and their average wait and run times.
+    """
+    now = timezone.now()
+    since = now - timedelta(seconds=window)
+    jobs = Job.objects.all() if queue is None else Job.objects.filter(queue=queue)
+    recent = Q(status=Job.DONE, finished_at__gte=since)
+    row = jobs.aggregate(
+        queued=Count('pk', filter=Q(status=Job.QUEUED)),
+        due=Count('pk', filter=Q(status=Job.QUEUED, run_at__lte=now)),
+        running=Count('pk', filter=Q(status=Job.RUNNING)),
+        failed=Count('pk', filter=Q(status=Job.FAILED)),
+        oldest_due=Min('run_at', filter=Q(status=Job.QUEUED, run_at__lte=now)),
+        done_recently=Count('pk', filter=recent),
+        failed_recently=Count('pk', filter=Q(status=Job.FAILED, finished_at__gte=since)),
+        wait=Avg(F('started_at') - F('run_at'), filter=recent),
+        runtime=Avg(F('finished_at') - F('started_at'), filter=recent),
+    )
+    seconds = lambda delta: round(delta.total_seconds(), 3) if delta is not None else None
+    return {
+        'queued': row['queued'],
+        'due': row['due'],
+        'running': row['running'],
+        'failed': row['failed'],
+        'lag_s': seconds(now - row['oldest_due']) if row['oldest_due'] else 0.0,
+        'window_s': window,
+        'done_per_s': round(row['done_recently'] / window, 3),
+        'failed_recently': row['failed_recently'],
+        'avg_wait_s': seconds(row['wait']),
+        'avg_runtime_s': seconds(row['runtime']),
+    }
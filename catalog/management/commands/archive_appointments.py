@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.archive import BATCH_SIZE, archivable, archive_appointments, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = ("Move Completed and Canceled appointments older than APPOINTMENT_ARCHIVE_AFTER_DAYS (or --days) "
+            "from the appointment table to the archive, in batches. Safe to run while the site is up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Archive closed appointments dated more than this many "
+                                                     "days ago. Defaults to APPOINTMENT_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--limit', type=int, help="Stop after moving this many appointments.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, days, batch_size, limit, dry_run, **options):
+        if (days is not None and days < 0) or batch_size < 1:
+            raise CommandError("--days must not be negative and --batch-size must be positive.")
+        cutoff = archive_cutoff(days)
+        if dry_run:
+            self.stdout.write(f"{archivable(cutoff).count()} appointments dated before {cutoff} would be archived.")
+            return
+
+        started = time.perf_counter()
+        moved = archive_appointments(days, batch_size=batch_size, limit=limit,
+                                     progress=lambda moved: self.stdout.write(f"Archived {moved}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} appointments dated before {cutoff} in {time.perf_counter() - started:.1f}s."))
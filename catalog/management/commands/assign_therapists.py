@@ -0,0 +1,49 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.assignment import assign_therapists
+from catalog.models import Therapist
+
+
+class Command(BaseCommand):
+    help = ("Assign therapists to pending appointments that have none, matching the appointment's service to "
+            "the therapist's specialization and using the free-slot index for availability. Each appointment "
+            "goes to the least loaded free therapist, earliest appointments first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Consider at most this many appointments, earliest first.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be assigned without changing anything. Use -v 2 to list "
+                                 "every assignment.")
+
+    def handle(self, *args, limit, dry_run, verbosity, **options):
+        if limit is not None and limit < 1:
+            raise CommandError("--limit must be positive.")
+        started = time.perf_counter()
+        plan = assign_therapists(limit, dry_run=dry_run)
+        elapsed = time.perf_counter() - started
+
+        names = dict(Therapist.objects.filter(pk__in=plan['load']).values_list('pk', 'name'))
+        given = Counter(therapist_id for pk, therapist_id, day, at in plan['assignments'])
+        if verbosity >= 2:
+            for pk, therapist_id, day, at in plan['assignments']:
+                self.stdout.write(f"Appointment {pk} on {day} at {at:%H:%M}: {names[therapist_id]}")
+        if verbosity >= 1 and given:
+            self.stdout.write("Therapist: appointments given, pending load afterwards")
+            for therapist_id, count in given.most_common():
+                self.stdout.write(f"  {names[therapist_id]}: {count}, {plan['load'][therapist_id]}")
+        for reason, count in Counter(plan['unassigned'].values()).most_common():
+            self.stdout.write(f"{count} appointments left unassigned: {reason}")
+
+        total = len(plan['assignments']) + len(plan['unassigned'])
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"Would assign {len(plan['assignments'])} of {total} appointments (planned in {elapsed:.2f}s)."))
+            return
+        if plan['conflicts']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(plan['conflicts'])} appointments changed while assigning and were left alone."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {plan['assigned']} of {total} appointments in {elapsed:.2f}s."))
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmarks import environment, summarise
+from catalog.models import Appointment, Patient, Therapist
+
+# Read pages with both a sync and an async view; the async URL names are "async_" + name
+PAGES = {
+    'therapist_list': None,
+    'therapist_detail': Therapist,
+    'patient_list': None,
+    'patient_detail': Patient,
+    'appointment_list': None,
+    'appointment_detail': Appointment,
+    'therapist_dashboard': None,
+}
+
+HOST = 'localhost'
+
+
+def wsgi_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': HOST,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(path):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', HOST.encode())], 'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+
+
+def run_wsgi(application, paths, concurrency):
+    def call(path):
+        status = []
+        started = time.perf_counter()
+        response = application(wsgi_environ(path), lambda s, headers: status.append(s))
+        b''.join(response)
+        response.close()
+        return time.perf_counter() - started, status[0].startswith('200')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, paths))
+    elapsed = time.perf_counter() - started
+    return summarise([latency for latency, ok in results], sum(not ok for latency, ok in results), elapsed)
+
+
+async def run_asgi(application, paths, concurrency):
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    latencies = []
+    errors = 0
+
+    async def call(path):
+        sent_request = False
+        status = None
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django listens for a disconnect while the view runs; the client never goes away
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(asgi_scope(path), receive, send)
+        return status == 200
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            ok = await call(path)
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarise(latencies, errors, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = ("Compare throughput and tail latency of the catalog read pages served through the WSGI and ASGI "
+            "handlers at increasing concurrency, and write the results as JSON. Runs in-process against the "
+            "configured database, which should hold a realistic amount of data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16,64',
+                            help="Comma-separated numbers of concurrent clients.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per page at each level.")
+        parser.add_argument('--with-cache', action='store_true',
+                            help="Keep the catalog response cache on (the async views never use it).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def page_paths(self):
+        paths = {}
+        for name, model in PAGES.items():
+            args = []
+            if model is not None:
+                pk = model.objects.order_by('pk').values_list('pk', flat=True).first()
+                if pk is None:
+                    raise CommandError(f"No {model._meta.verbose_name} to benchmark the detail page with.")
+                args = [pk]
+            paths[name] = (reverse(f'catalog:{name}', args=args), reverse(f'catalog:async_{name}', args=args))
+        return paths
+
+    def handle(self, *args, concurrency, requests, with_cache, output, **options):
+        levels = [int(level) for level in concurrency.split(',')]
+        paths = self.page_paths()
+        sync_paths = [sync for sync, _ in paths.values()] * requests
+        async_paths = [async_path for _, async_path in paths.values()] * requests
+
+        wsgi = get_wsgi_application()
+        asgi = get_asgi_application()
+        # sync views through each handler, and the async views under ASGI
+        modes = {
+            'wsgi': lambda level: run_wsgi(wsgi, sync_paths, level),
+            'asgi_sync_views': lambda level: asyncio.run(run_asgi(asgi, sync_paths, level)),
+            'asgi_async_views': lambda level: asyncio.run(run_asgi(asgi, async_paths, level)),
+        }
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[HOST], CATALOG_CACHE_ENABLED=with_cache):
+            # Warm up templates, URL resolving and connections before timing
+            run_wsgi(wsgi, sync_paths[:len(paths)], 1)
+            asyncio.run(run_asgi(asgi, async_paths[:len(paths)], 1))
+            for mode, run in modes.items():
+                results[mode] = {}
+                for level in levels:
+                    results[mode][level] = run(level)
+                    self.stderr.write(f"{mode} x{level}: {results[mode][level]['throughput_rps']} req/s")
+
+        report = json.dumps({'environment': environment(),
+                             'pages': {name: list(pair) for name, pair in paths.items()},
+                             'requests_per_level': len(sync_paths), 'results': results}, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+        else:
+            self.stdout.write(report)
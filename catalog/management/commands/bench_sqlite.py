@@ -0,0 +1,131 @@
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from catalog.benchmarks import add_dataset_arguments, environment, setup_database, summarise, teardown_database
+from catalog.models import Appointment
+from catalog.pagination import keyset_paginate
+from catalog.stats import dashboard_stats
+from catalog.views import AppointmentListView
+from merakitherapy import settings_production
+
+# SQLite's own defaults with a new connection per request, against merakitherapy/settings_production.py
+PROFILES = {
+    'default': {'engine': 'django.db.backends.sqlite3', 'pragmas': {'journal_mode': 'DELETE'}, 'conn_max_age': 0},
+    'production': {'engine': settings_production.DATABASES['default']['ENGINE'],
+                   'pragmas': settings_production.SQLITE_PRAGMAS,
+                   'conn_max_age': settings_production.DATABASES['default']['CONN_MAX_AGE']},
+}
+
+
+def read_appointments():
+    page = keyset_paginate(Appointment.objects.select_related('therapist', 'patient'),
+                           AppointmentListView.keyset_fields, per_page=AppointmentListView.page_size)
+    return len(page.object_list)
+
+
+def read_dashboard():
+    today = timezone.localdate()
+    return dashboard_stats(today - timedelta(days=30), today)
+
+
+def write_status(pks, rng):
+    with transaction.atomic():
+        appointment = Appointment.objects.get(pk=rng.choice(pks))
+        appointment.status = 'Canceled' if appointment.status == 'Pending' else 'Pending'
+        appointment.save()
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent readers and writers against a seeded SQLite file under the default "
+            "connection settings and under the production profile (WAL, connection PRAGMAs and "
+            "persistent connections), reporting reads/s, writes/s, latency and lock errors as JSON.")
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to run each profile for.")
+        parser.add_argument('--profiles', default=','.join(PROFILES), help="Comma-separated profiles to run.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def run_profile(self, profile, readers, writers, duration):
+        # Changing the journal mode needs every other connection to the file closed
+        connections.close_all()
+        # The worker threads open their own connections from these
+        connection.settings_dict.update(ENGINE=profile['engine'], CONN_MAX_AGE=profile['conn_max_age'])
+        pks = list(Appointment.objects.values_list('pk', flat=True))
+        results = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker(kind, number):
+            rng = random.Random(f'{kind}:{number}')
+            operations = [read_appointments, read_dashboard] if kind == 'read' else [lambda: write_status(pks, rng)]
+            latencies, failed = [], 0
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operations[len(latencies) % len(operations)]()
+                    except OperationalError:
+                        # "database is locked" once busy_timeout runs out
+                        failed += 1
+                    latencies.append(time.perf_counter() - started)
+                    # What request_finished does: with CONN_MAX_AGE = 0 the next request reconnects
+                    connection.close_if_unusable_or_obsolete()
+            finally:
+                connection.close()
+            with lock:
+                results[kind].extend(latencies)
+                errors[kind] += failed
+
+        threads = [threading.Thread(target=worker, args=('read', n)) for n in range(readers)]
+        threads += [threading.Thread(target=worker, args=('write', n)) for n in range(writers)]
+        started = time.perf_counter()
+        with override_settings(SQLITE_PRAGMAS=profile['pragmas']):
+            # Set the journal mode once before the workers start
+            connection.ensure_connection()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+        return {kind: summarise(results[kind], errors[kind], elapsed) for kind in results if results[kind]}
+
+    def handle(self, *args, therapists, patients, appointments, seed, database, reseed, readers, writers, duration,
+               profiles, output, **options):
+        sizes = {'therapists': therapists, 'patients': patients, 'appointments': appointments}
+        old_name = setup_database(database, sizes, seed, reseed, log=self.stderr.write)
+        saved = {key: connection.settings_dict[key] for key in ('ENGINE', 'CONN_MAX_AGE')}
+        results = {}
+        try:
+            for name in profiles.split(','):
+                results[name] = self.run_profile(PROFILES[name], readers, writers, duration)
+                self.stderr.write(f"{name}: " + ', '.join(
+                    f"{kind} {result['throughput_rps']}/s p99 {result['p99_ms']} ms, {result['errors']} errors"
+                    for kind, result in results[name].items()))
+        finally:
+            connections.close_all()
+            connection.settings_dict.update(saved)
+            with override_settings(SQLITE_PRAGMAS=PROFILES['default']['pragmas']):
+                # Leave the file in rollback journal mode, without -wal and -shm files next to it
+                connection.ensure_connection()
+            teardown_database(old_name)
+
+        report = json.dumps({'environment': environment(), 'dataset': dict(sizes, seed=seed), 'readers': readers,
+                             'writers': writers, 'duration_s': duration, 'results': results}, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+        else:
+            self.stdout.write(report)
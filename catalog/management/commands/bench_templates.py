@@ -0,0 +1,133 @@
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import date, time as clock, timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from catalog.forms import (AppointmentFilterForm, AppointmentForm, DashboardRangeForm, PatientRegistrationForm,
+                           TherapistRegistrationForm)
+from catalog.models import Appointment, Patient, Therapist
+
+# List templates wrap each row in {% cache %}; they are timed cold and warm
+FRAGMENT_CACHED = {'catalog/appointment_list.html', 'catalog/patient_list.html', 'catalog/therapist_list.html'}
+
+
+def build_rows(count):
+    # Unsaved instances with primary keys: rendering needs no database
+    therapists = [Therapist(therapist_id=i, name=f'Therapist {i}', contact='0700000000',
+                            specialization=Therapist.SPECIALIZATION_CHOICES[i % 7][0], availability='A')
+                  for i in range(1, count + 1)]
+    patients = [Patient(patient_id=i, name=f'Patient {i}', gender='F', contact='0711111111',
+                        date_of_birth=date(1990, 1, 1)) for i in range(1, count + 1)]
+    start = date(2024, 1, 1)
+    appointments = [Appointment(appointment_id=i, therapist=therapists[i % len(therapists)],
+                                patient=patients[i % len(patients)], date=start + timedelta(days=i // 8),
+                                time=clock(9 + i % 8), service='TRAUMA', status='Pending')
+                    for i in range(count)]
+    return therapists, patients, appointments
+
+
+def no_choices(form):
+    # Keep ModelChoiceFields from querying the database while rendering
+    for field in form.fields.values():
+        if hasattr(field, 'queryset'):
+            field.queryset = field.queryset.none()
+    return form
+
+
+def template_contexts(rows):
+    therapists, patients, appointments = build_rows(rows)
+    status_counts = {'Pending': 3, 'Completed': 2, 'Canceled': 1}
+    return {
+        'catalog/index.html': {'num_appointments': rows, 'num_patients': rows, 'num_therapists': rows,
+                               'num_visits': 1},
+        'catalog/appointment_list.html': {'appointments': appointments, 'row_version': 'bench',
+                                          'filter_form': no_choices(AppointmentFilterForm()), 'next_query': 'after=x'},
+        'catalog/patient_list.html': {'patients': patients, 'row_version': 'bench'},
+        'catalog/therapist_list.html': {'therapists': therapists, 'row_version': 'bench'},
+        'catalog/user_appointments.html': {'appointments': appointments},
+        'catalog/appointment_detail.html': {'appointment': appointments[0]},
+        'catalog/patient_detail.html': {'patient': patients[0]},
+        'catalog/therapist_detail.html': {'therapist': therapists[0]},
+        'catalog/create_appointment.html': {'form': no_choices(AppointmentForm())},
+        'catalog/patient_registration.html': {'form': PatientRegistrationForm()},
+        'catalog/therapist_registration.html': {'form': TherapistRegistrationForm()},
+        'catalog/update_appointment.html': {'appointment': appointments[0]},
+        'catalog/update_patient.html': {'patient': patients[0]},
+        'catalog/update_therapist.html': {'therapist': therapists[0]},
+        'catalog/therapist_dashboard.html': {
+            'num_patients': rows, 'num_appointments': rows,
+            'gender_distribution': [{'gender': 'F', 'count': rows, 'percent': 100.0}],
+            'most_chosen_specialization': {'specialization': 'TRAUMA', 'count': rows},
+            'range_form': DashboardRangeForm(), 'date_from': date(2024, 1, 1), 'date_to': date(2024, 12, 31),
+            'appointment_stats': {
+                'total': 6 * rows, 'by_status': status_counts,
+                'by_service': [(code, status_counts) for code, label in Appointment.SERVICE_CHOICES],
+                'by_day': [(date(2024, 1, 1) + timedelta(days=i), status_counts) for i in range(rows)],
+            },
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ("Render every catalog template with N rows and report render time and memory allocations "
+            "as JSON, so template regressions can be compared between commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def render(self, name, context, request, repeat, before=None):
+        timings = []
+        for _ in range(repeat):
+            if before:
+                before()
+            started = time.perf_counter()
+            html = render_to_string(name, context, request)
+            timings.append(time.perf_counter() - started)
+
+        if before:
+            before()
+        tracemalloc.start()
+        render_to_string(name, context, request)
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+
+        return {
+            'min_ms': round(min(timings) * 1000, 3),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'peak_kib': round(peak / 1024, 1),
+            'retained_blocks': blocks,
+            'bytes': len(html),
+        }
+
+    def handle(self, *args, rows, repeat, output, **options):
+        request = RequestFactory().get('/catalog/')
+        request.user = AnonymousUser()
+        fragments = caches['template_fragments'] if 'template_fragments' in caches.settings else caches['default']
+
+        results = {}
+        for name, context in template_contexts(rows).items():
+            if name in FRAGMENT_CACHED:
+                results[f'{name} (cold)'] = self.render(name, context, request, repeat, before=fragments.clear)
+                results[f'{name} (warm)'] = self.render(name, context, request, repeat)
+            else:
+                results[name] = self.render(name, context, request, repeat)
+            self.stderr.write(f"{name}: done")
+
+        report = json.dumps({'rows': rows, 'repeat': repeat, 'templates': results}, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from catalog import urls
+from catalog.benchmarks import (add_dataset_arguments, environment, percentile, setup_database, summarise,
+                                teardown_database)
+from catalog.models import Appointment, AppointmentSeries, Patient, Therapist
+
+
+def sample(model):
+    # A row from the middle of the table rather than the first one
+    count = model.objects.count()
+    return model.objects.order_by('pk')[count // 2] if count else None
+
+
+def spare_therapist():
+    return Therapist.objects.create(name='Bench Spare', contact='0700000000', specialization='TRAUMA').pk
+
+
+def spare_patient():
+    return Patient.objects.create(name='Bench Spare', gender='O', contact='0700000000').pk
+
+
+def spare_appointment():
+    return Appointment.objects.create(service='TRAUMA', status='Canceled').pk
+
+
+def build_routes():
+    """
+    One request per catalog URL name: (label, URL name, args, query, method).
+    Args that are callables are run before each request and not timed, so
+    the delete routes always have a fresh row to delete.
+    """
+    therapist, patient, appointment = sample(Therapist), sample(Patient), sample(Appointment)
+    if None in (therapist, patient, appointment):
+        raise CommandError("The benchmark database has no data; seed it first.")
+    series = AppointmentSeries.objects.filter(therapist=therapist).first() or AppointmentSeries.objects.create(
+        therapist=therapist, patient=patient, service=therapist.specialization, start_date=appointment.date,
+        time=appointment.time, count=1)
+    day = f'date_from={appointment.date}&date_to={appointment.date}'
+    word = patient.name.split()[0]
+    routes = [
+        ('index', 'index', [], '', 'get'),
+        ('therapist_registration', 'therapist_registration', [], '', 'get'),
+        ('therapist_list', 'therapist_list', [], '', 'get'),
+        ('therapist_list?q', 'therapist_list', [], f'q={therapist.name.split()[-1]}', 'get'),
+        ('therapist_detail', 'therapist_detail', [therapist.pk], '', 'get'),
+        ('update_therapist', 'update_therapist', [therapist.pk], '', 'get'),
+        ('therapist_delete', 'therapist_delete', [spare_therapist], '', 'get'),
+        ('patient_registration', 'patient_registration', [], '', 'get'),
+        ('patient_list', 'patient_list', [], '', 'get'),
+        ('patient_list?q', 'patient_list', [], f'q={word}', 'get'),
+        ('patient_detail', 'patient_detail', [patient.pk], '', 'get'),
+        ('update_patient', 'update_patient', [patient.pk], '', 'get'),
+        ('patient_delete', 'patient_delete', [spare_patient], '', 'get'),
+        ('create_appointment', 'create_appointment', [], '', 'get'),
+        ('appointment_list', 'appointment_list', [], '', 'get'),
+        ('appointment_list?filtered', 'appointment_list', [], f'status=Pending&{day}', 'get'),
+        ('appointment_detail', 'appointment_detail', [appointment.pk], '', 'get'),
+        ('update_appointment', 'update_appointment', [appointment.pk], '', 'get'),
+        ('delete_appointment', 'delete_appointment', [spare_appointment], '', 'get'),
+        ('next_available', 'next_available', [], f'specialization={therapist.specialization}', 'get'),
+        ('create_series', 'create_series', [], '', 'get'),
+        ('update_series', 'update_series', [series.pk], '', 'get'),
+        ('search', 'search', [], f'q={word}', 'get'),
+        ('export:appointments', 'export', ['appointments'], day, 'get'),
+        ('export:patients', 'export', ['patients'], f'q={word}', 'get'),
+        ('export:therapists', 'export', ['therapists'], '', 'get'),
+        ('login', 'login', [], '', 'get'),
+        ('logout', 'logout', [], '', 'post'),
+        ('therapist_dashboard', 'therapist_dashboard', [], '', 'get'),
+    ]
+    for kind, obj in (('therapists', therapist), ('patients', patient), ('appointments', appointment)):
+        routes.append((f'api_list:{kind}', 'api_list', [kind], '', 'get'))
+        routes.append((f'api_detail:{kind}', 'api_detail', [kind, obj.pk], '', 'get'))
+    for name, args in (('therapist_list', []), ('therapist_detail', [therapist.pk]), ('patient_list', []),
+                       ('patient_detail', [patient.pk]), ('appointment_list', []),
+                       ('appointment_detail', [appointment.pk]), ('therapist_dashboard', [])):
+        routes.append((f'async_{name}', f'async_{name}', args, '', 'get'))
+
+    missing = {pattern.name for pattern in urls.urlpatterns} - {name for label, name, *rest in routes}
+    if missing:
+        raise CommandError(f"No benchmark request for: {', '.join(sorted(missing))}")
+    return routes
+
+
+class Command(BaseCommand):
+    help = ("Seed a benchmark database with a synthetic dataset and request every catalog URL at each "
+            "concurrency level, reporting throughput, p50/p95/p99 latency and SQL queries per request as "
+            "JSON so runs can be compared between commits. The database is a separate file that is kept "
+            "between runs and only reseeded when the requested size changes.")
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--concurrency', default='1,4,16',
+                            help="Comma-separated numbers of concurrent clients.")
+        parser.add_argument('--requests', type=int, default=50, help="Requests per route at each level.")
+        parser.add_argument('--only', help="Comma-separated route labels to run, e.g. index,patient_list.")
+        parser.add_argument('--skip', default='', help="Comma-separated route labels to leave out.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def run_route(self, route, concurrency, requests):
+        label, name, args, query, method = route
+        local = threading.local()
+
+        def call(_):
+            if not hasattr(local, 'client'):
+                # Count server errors instead of raising them
+                local.client = Client(raise_request_exception=False)
+            url = reverse(f'catalog:{name}', args=[arg() if callable(arg) else arg for arg in args])
+            if query:
+                url += '?' + query
+            with CaptureQueriesContext(connections['default']) as queries:
+                started = time.perf_counter()
+                response = getattr(local.client, method)(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latency = time.perf_counter() - started
+            return latency, response.status_code < 400, len(queries)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(call, range(requests)))
+        elapsed = time.perf_counter() - started
+
+        summary = summarise([latency for latency, ok, count in results], sum(not ok for latency, ok, count in results),
+                            elapsed)
+        query_counts = sorted(count for latency, ok, count in results)
+        summary['queries_p50'] = percentile(query_counts, 50)
+        summary['queries_max'] = query_counts[-1]
+        return summary
+
+    def handle(self, *args, therapists, patients, appointments, seed, concurrency, requests, only, skip, database,
+               reseed, output, **options):
+        levels = [int(level) for level in concurrency.split(',')]
+        sizes = {'therapists': therapists, 'patients': patients, 'appointments': appointments}
+        old_name = setup_database(database, sizes, seed, reseed, log=self.stderr.write)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for alias in caches:
+                    caches[alias].clear()
+                routes = build_routes()
+                if only:
+                    routes = [route for route in routes if route[0] in only.split(',')]
+                routes = [route for route in routes if route[0] not in skip.split(',')]
+
+                results = {}
+                for route in routes:
+                    results[route[0]] = {}
+                    for level in levels:
+                        result = self.run_route(route, level, requests)
+                        results[route[0]][level] = result
+                        self.stderr.write(f"{route[0]} x{level}: {result['throughput_rps']} req/s, "
+                                          f"p99 {result['p99_ms']} ms, {result['queries_p50']} queries")
+        finally:
+            teardown_database(old_name)
+
+        report = json.dumps({'environment': environment(), 'dataset': dict(sizes, seed=seed),
+                             'requests_per_level': requests, 'results': results}, indent=2)
+        if output:
+            with open(output, 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog.cache import cache_stats
+
+VIEWS = ['catalog:appointment_detail', 'catalog:patient_list', 'catalog:patient_detail', 'catalog:therapist_list',
+         'catalog:therapist_detail']
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss ratios of the catalog response cache."
+
+    def handle(self, *args, **options):
+        for name, stats in cache_stats(VIEWS).items():
+            self.stdout.write(f"{name}: {stats['hits']} hits, {stats['misses']} misses, "
+                              f"{stats['ratio']:.1%} hit ratio")
@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import time
+from collections import Counter as Tally
+from itertools import islice
+
+from django import forms
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from catalog import availability, counters, stats
+from catalog.forms import AppointmentForm, PatientRegistrationForm, TherapistRegistrationForm
+from catalog.models import Appointment, ImportProgress, Patient, Therapist
+
+# What can be imported: the form whose field rules validate each row, plus
+# model fields the form leaves out but a clinic export will carry
+IMPORTS = {
+    'therapists': (Therapist, TherapistRegistrationForm, []),
+    'patients': (Patient, PatientRegistrationForm, []),
+    'appointments': (Appointment, AppointmentForm, ['status']),
+}
+
+
+def _bad_row(message):
+    return ValidationError({NON_FIELD_ERRORS: [message]})
+
+
+def _is_utf8(text):
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_rows(path, fmt):
+    # Stream rows one at a time so memory use does not depend on file size. A row that cannot be read is
+    # yielded as a ValidationError, so it is reported and skipped like an invalid one and resuming still
+    # counts rows the same way. Bytes that are not UTF-8 are read as lone surrogates rather than raising.
+    with open(path, newline='', encoding='utf-8', errors='surrogateescape') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            while True:
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    yield _bad_row(f"Not valid CSV: {e}")
+                    continue
+                text = ''.join(value for value in row.values() if isinstance(value, str))
+                yield row if _is_utf8(text) else _bad_row("Not valid UTF-8.")
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                if not _is_utf8(line):
+                    yield _bad_row("Not valid UTF-8.")
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield _bad_row(f"Not valid JSON: {e}")
+                    continue
+                yield row if isinstance(row, dict) else _bad_row("Not a JSON object.")
+
+
+class RowValidator:
+    def __init__(self, model, form_class, extra_fields):
+        self.model = model
+        self.pk_name = model._meta.pk.name
+        self.fields = dict(form_class.base_fields)
+        for name in extra_fields:
+            self.fields[name] = model._meta.get_field(name).formfield()
+
+        # Foreign keys are checked against the primary keys loaded once up front
+        self.known_pks = {}
+        for name, field in self.fields.items():
+            if isinstance(field, forms.ModelChoiceField):
+                related = model._meta.get_field(name).related_model
+                self.known_pks[name] = set(related.objects.values_list('pk', flat=True).iterator())
+
+    def build(self, row):
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            raw = row.get(name)
+            if raw is None:
+                raw = ''
+            try:
+                if name in self.known_pks:
+                    values[f'{name}_id'] = self.clean_fk(name, field, raw)
+                else:
+                    values[name] = field.clean(raw if isinstance(raw, str) else str(raw))
+            except ValidationError as e:
+                errors[name] = e.messages
+        if row.get(self.pk_name) not in (None, ''):
+            try:
+                values[self.pk_name] = int(row[self.pk_name])
+            except (TypeError, ValueError):
+                errors[self.pk_name] = ['Enter a whole number.']
+        if errors:
+            raise ValidationError(errors)
+        return self.model(**values)
+
+    def clean_fk(self, name, field, raw):
+        if raw in ('', None):
+            if field.required:
+                raise ValidationError(field.error_messages['required'])
+            return None
+        try:
+            pk = int(raw)
+        except (TypeError, ValueError):
+            raise ValidationError(field.error_messages['invalid_choice'])
+        if pk not in self.known_pks[name]:
+            raise ValidationError(field.error_messages['invalid_choice'])
+        return pk
+
+
+class Command(BaseCommand):
+    help = ("Stream patients, therapists or appointments from a CSV or JSONL file into the database "
+            "in batched transactions. Rows are validated with the registration/appointment form rules; "
+            "foreign keys refer to therapist_id/patient_id values already in the database. "
+            "Progress is committed with every batch so an interrupted import can be resumed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore saved progress and import the file from the first row.")
+
+    def handle(self, *args, kind, path, format, batch_size, restart, **options):
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive.")
+        fmt = format or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        model, form_class, extra_fields = IMPORTS[kind]
+        validator = RowValidator(model, form_class, extra_fields)
+
+        progress, _ = ImportProgress.objects.get_or_create(source=f'{kind}:{os.path.abspath(path)}')
+        if restart:
+            progress.rows_done = 0
+            progress.save()
+        elif progress.rows_done:
+            self.stdout.write(f"Resuming after row {progress.rows_done}.")
+
+        rows = islice(read_rows(path, fmt), progress.rows_done, None)
+        line = progress.rows_done
+        imported = skipped = 0
+        started = time.monotonic()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            objects = []
+            for row in batch:
+                line += 1
+                try:
+                    if isinstance(row, ValidationError):
+                        raise row
+                    objects.append(validator.build(row))
+                except ValidationError as e:
+                    skipped += 1
+                    self.stderr.write(f"Row {line}: {e.message_dict}")
+
+            with transaction.atomic():
+                saved, rejected = self.insert(model, objects)
+                for obj in rejected:
+                    self.stderr.write(f"Row rejected by the database: {obj}")
+                self.update_derived_data(kind, saved)
+                progress.rows_done = line
+                progress.save(update_fields=['rows_done', 'updated'])
+
+            imported += len(saved)
+            skipped += len(rejected)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{line} rows read, {imported} imported, {skipped} skipped "
+                              f"({imported / elapsed if elapsed else 0:.0f} rows/s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} {kind}, skipped {skipped}."))
+
+    def insert(self, model, objects):
+        try:
+            with transaction.atomic():
+                return model.objects.bulk_create(objects), []
+        except IntegrityError:
+            pass
+        # Something in the batch clashes (duplicate id, taken slot): find it row by row
+        saved, rejected = [], []
+        for obj in objects:
+            try:
+                with transaction.atomic():
+                    saved.extend(model.objects.bulk_create([obj]))
+            except IntegrityError:
+                rejected.append(obj)
+        return saved, rejected
+
+    def update_derived_data(self, kind, saved):
+        # bulk_create sends no signals, so do what catalog.signals would have done
+        if not saved:
+            return
+        counters.increment(kind, len(saved))
+        counters.bump_version(kind)
+        if kind == 'patients':
+            for gender, count in Tally(obj.gender for obj in saved).items():
+                if gender in counters.GENDER_COUNTERS:
+                    counters.increment(counters.GENDER_COUNTERS[gender], count)
+        elif kind == 'appointments':
+            keys = Tally()
+            for obj in saved:
+                key = stats.appointment_key(obj.therapist_id, obj.date, obj.service, obj.status)
+                if key is not None:
+                    keys[tuple(sorted(key.items()))] += 1
+            for key, count in keys.items():
+                stats.record(dict(key), count)
+            today = timezone.localdate()
+            for therapist_id, day in {(obj.therapist_id, obj.date) for obj in saved}:
+                if day is not None and day >= today:
+                    availability.refresh_day(therapist_id, day)
@@ -0,0 +1,17 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from catalog.jobs import job_metrics
+
+
+class Command(BaseCommand):
+    help = ("Show the background job queue: jobs per status, lag of the oldest due job, and throughput, "
+            "wait and run times over the last --window seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=300)
+        parser.add_argument('--queue', help="Only this queue.")
+
+    def handle(self, *args, window, queue, **options):
+        self.stdout.write(json.dumps(job_metrics(window, queue), indent=2))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import AppointmentDailyStat
+from catalog.stats import rebuild_appointment_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily appointment rollup used by the therapist dashboard."
+
+    def handle(self, *args, **options):
+        rebuild_appointment_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {AppointmentDailyStat.objects.count()} rollup rows."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalog.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recount therapists, patients and appointments in case the cached counters have drifted."
+
+    def handle(self, *args, **options):
+        for name, value in rebuild_counters().items():
+            self.stdout.write(f"{name}: {value}")
+        self.stdout.write(self.style.SUCCESS("Counters rebuilt."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.availability import HORIZON_DAYS, rebuild_free_slots
+from catalog.models import FreeSlot
+
+
+class Command(BaseCommand):
+    help = (f"Rebuild the free-slot index for the next {HORIZON_DAYS} days. "
+            "Run daily to drop past slots and extend the horizon.")
+
+    def handle(self, *args, **options):
+        rebuild_free_slots()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {FreeSlot.objects.count()} free slots."))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.replicas import refresh_replica
+from catalog.routers import replicas
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database over each read replica in settings.DATABASE_REPLICAS, "
+            "once or every --interval seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='aliases',
+                            help="Replica alias to refresh; may be repeated. Defaults to DATABASE_REPLICAS.")
+        parser.add_argument('--interval', type=float,
+                            help="Keep running and refresh every this many seconds. Keep it below "
+                                 "DATABASE_REPLICA_LAG.")
+
+    def handle(self, *args, aliases, interval, **options):
+        aliases = aliases or replicas()
+        if not aliases:
+            raise CommandError("No replicas configured; set DATABASE_REPLICAS or pass --database.")
+        while True:
+            started = time.perf_counter()
+            for alias in aliases:
+                refresh_replica(alias)
+            self.stdout.write(f"Refreshed {', '.join(aliases)} in {time.perf_counter() - started:.2f}s")
+            if interval is None:
+                return
+            time.sleep(max(0, interval - (time.perf_counter() - started)))
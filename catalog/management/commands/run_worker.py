@@ -0,0 +1,91 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def worker_process(name, queue, batch, poll, burst):
+    # Started with "spawn", so Django has to be set up again in the child
+    django.setup()
+    from catalog.jobs import work
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    # Finish the job in hand, then exit
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    work(name, queue, batch, poll, burst, should_stop=lambda: stopping)
+
+
+class Command(BaseCommand):
+    help = ("Run background jobs from the database queue in a pool of worker processes. Each worker leases "
+            "the jobs it takes, and jobs of a worker that died are taken over once the lease runs out. "
+            "Prints queue metrics as JSON every --metrics-every seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Worker processes; 1 runs the jobs in this process.")
+        parser.add_argument('--queue', default='default')
+        parser.add_argument('--batch', type=int, default=1, help="Jobs each worker leases at a time.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no jobs are due.")
+        parser.add_argument('--metrics-every', type=float, default=60,
+                            help="Seconds between metrics reports; 0 turns them off.")
+
+    def report(self, queue):
+        # Imported late throughout: spawned workers load this module before Django is set up
+        from catalog.jobs import job_metrics
+
+        self.stdout.write(json.dumps({'queue': queue, **job_metrics(queue=queue)}))
+
+    def handle(self, *args, processes, queue, batch, poll, burst, metrics_every, **options):
+        if processes < 1 or batch < 1:
+            raise CommandError("--processes and --batch must be at least 1.")
+        base_name = f'{socket.gethostname()}:{os.getpid()}'
+        started = time.perf_counter()
+
+        if processes == 1:
+            from catalog.jobs import work
+
+            processed = work(base_name, queue, batch, poll, burst)
+            self.stdout.write(f"Ran {processed} jobs in {time.perf_counter() - started:.1f}s")
+            return
+
+        # Children open their own connections
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=worker_process, args=(f'{base_name}/{n}', queue, batch, poll, burst),
+                                   daemon=True) for n in range(processes)]
+        for process in workers:
+            process.start()
+
+        def stop(signum, frame):
+            for process in workers:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop)
+        last_report = time.perf_counter()
+        try:
+            while any(process.is_alive() for process in workers):
+                time.sleep(0.5)
+                if metrics_every and time.perf_counter() - last_report >= metrics_every:
+                    last_report = time.perf_counter()
+                    self.report(queue)
+        except KeyboardInterrupt:
+            # The workers got the same SIGINT and are finishing their jobs
+            pass
+        for process in workers:
+            process.join()
+        self.report(queue)
+        self.stdout.write(f"Workers stopped after {time.perf_counter() - started:.1f}s")
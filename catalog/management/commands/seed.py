@@ -0,0 +1,55 @@
+import time
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.seeding import BATCH_SIZE, flush_catalog, seed_catalog
+
+
+class Command(BaseCommand):
+    help = ("Generate synthetic therapists, patients and appointments with realistic distributions. "
+            "The same sizes, --seed and --today always give the same rows.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--therapists', type=int, default=500)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--appointments', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--today', type=date.fromisoformat,
+                            help="Reference date (YYYY-MM-DD) for ages and which appointments are past. "
+                                 "Defaults to today; pass it to reproduce an earlier run exactly.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete all existing therapists, patients and appointments first.")
+
+    def handle(self, *args, therapists, patients, appointments, seed, today, batch_size, flush, **options):
+        if min(therapists, patients, appointments) < 0 or batch_size < 1:
+            raise CommandError("Sizes must not be negative and --batch-size must be positive.")
+        if appointments and not therapists:
+            raise CommandError("Appointments need at least one therapist.")
+
+        started = time.perf_counter()
+        if flush:
+            flush_catalog()
+            self.stdout.write(f"Flushed existing data in {time.perf_counter() - started:.1f}s")
+
+        inserted = Counter()
+        last_report = time.perf_counter()
+
+        def progress(model, rows):
+            nonlocal last_report
+            inserted[model._meta.verbose_name_plural] += rows
+            if time.perf_counter() - last_report >= 5:
+                last_report = time.perf_counter()
+                self.stdout.write(', '.join(f"{name}: {count}" for name, count in inserted.items()))
+
+        started = time.perf_counter()
+        summary = seed_catalog(therapists, patients, appointments, seed=seed, today=today, batch_size=batch_size,
+                               progress=progress)
+        elapsed = time.perf_counter() - started
+        rows = therapists + patients + appointments
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {therapists} therapists, {patients} patients and {appointments} appointments "
+            f"(seed {seed}, today {summary['today']}, schedule from {summary['start']}) "
+            f"in {elapsed:.1f}s, {rows / elapsed:,.0f} rows/s."))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.reminders import due_reminders, reminder_window, send_reminders
+
+
+class Command(BaseCommand):
+    help = ("Remind patients of their pending appointments in the next REMINDER_WINDOW_HOURS (or --window) "
+            "through the REMINDER_SENDER backend. Appointments that already had a reminder are skipped, so "
+            "it is safe to run as often as you like, e.g. from cron every few minutes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=float, help="Hours ahead to look. Defaults to REMINDER_WINDOW_HOURS.")
+        parser.add_argument('--kind', default='upcoming',
+                            help="Reminder kind; an appointment gets one reminder of each kind.")
+        parser.add_argument('--batch-size', type=int, help="Defaults to REMINDER_BATCH_SIZE.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the reminders that are due.")
+
+    def handle(self, *args, window, kind, batch_size, dry_run, **options):
+        if (window is not None and window <= 0) or (batch_size is not None and batch_size < 1):
+            raise CommandError("--window and --batch-size must be positive.")
+        if dry_run:
+            start, end = reminder_window(window)
+            self.stdout.write(f"{due_reminders(start, end, kind).count()} {kind} reminders due "
+                              f"between {start:%Y-%m-%d %H:%M} and {end:%Y-%m-%d %H:%M}.")
+            return
+
+        started = time.perf_counter()
+        stats = send_reminders(window, kind, batch_size,
+                               progress=lambda stats: self.stderr.write(f"Sent {stats['sent']}"))
+        elapsed = time.perf_counter() - started
+        message = (f"Sent {stats['sent']} {kind} reminders in {stats['batches']} batches in {elapsed:.1f}s, "
+                   f"{stats['failed']} failed.")
+        self.stdout.write(self.style.WARNING(message) if stats['failed'] else self.style.SUCCESS(message))
@@ -0,0 +1,189 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import routers
+
+logger = logging.getLogger('catalog.requests')
+
+
+def query_budget(queries):
+    """Declare the most SQL queries a function view may run per request."""
+    def decorator(view_func):
+        view_func.query_budget = queries
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    # Class-based views declare it as a class attribute
+    view_class = getattr(view_func, 'view_class', None)
+    return getattr(view_class or view_func, 'query_budget', None)
+
+
+class QueryStats:
+    """execute_wrapper that counts and times every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.time += duration
+            if duration >= self.slowest_time:
+                self.slowest_time, self.slowest_sql = duration, sql
+
+
+def _time_queries(stack, stats):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(stats))
+
+
+class QueryTimingMiddleware:
+    """
+    Record the number of queries, their total time and the slowest one for
+    each request, send them in a Server-Timing header and log them as one
+    JSON line on the "catalog.requests" logger. Queries run while a
+    streaming response is consumed happen after this and are not counted.
+    Like the rest of the chain it runs sync or async, so that under ASGI
+    the async views are not called through async_to_sync.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            _time_queries(stack, stats)
+            response = self.get_response(request)
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        stack = ExitStack()
+        # The ORM runs in the thread sync_to_async hands it to, which has its own connections
+        await sync_to_async(_time_queries)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._report(request, response, stats, time.perf_counter() - started)
+
+    def _report(self, request, response, stats, total):
+        response['Server-Timing'] = (f'db;dur={stats.time * 1000:.3f};desc="{stats.count} queries", '
+                                     f'db-slowest;dur={stats.slowest_time * 1000:.3f}, '
+                                     f'total;dur={total * 1000:.3f}')
+
+        budget = getattr(request, 'query_budget', None)
+        over_budget = budget is not None and stats.count > budget
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'queries': stats.count,
+            'query_budget': budget,
+            'db_ms': round(stats.time * 1000, 3),
+            'slowest_ms': round(stats.slowest_time * 1000, 3),
+            'slowest_sql': stats.slowest_sql,
+            'total_ms': round(total * 1000, 3),
+        }
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(entry), extra={'request_stats': entry})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
+
+
+class PrimaryPinningMiddleware:
+    """
+    Read-your-writes for catalog.routers.PrimaryReplicaRouter. Requests that
+    may write read from the primary, and once a request has written, the
+    same browser keeps reading from the primary for DATABASE_REPLICA_LAG
+    seconds, until the replicas have caught up.
+    """
+    cookie_name = 'read_primary'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._pin(request)
+        try:
+            return self._remember_writes(self.get_response(request))
+        finally:
+            routers.unpin_primary()
+
+    async def __acall__(self, request):
+        self._pin(request)
+        try:
+            return self._remember_writes(await self.get_response(request))
+        finally:
+            routers.unpin_primary()
+
+    def _pin(self, request):
+        routers.unpin_primary()
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') or self.cookie_name in request.COOKIES:
+            routers.pin_primary()
+
+    def _remember_writes(self, response):
+        if routers.has_written():
+            response.set_cookie(self.cookie_name, '1', max_age=getattr(settings, 'DATABASE_REPLICA_LAG', 10),
+                                httponly=True, samesite='Lax')
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoiseMiddleware that can also run async, which WhiteNoise itself cannot."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Without autorefresh the files are indexed at startup and finding one is a dict lookup
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
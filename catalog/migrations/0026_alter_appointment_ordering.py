@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0025_alter_patient_options_alter_therapist_options'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='appointment',
+            options={'ordering': ['date', 'time', 'appointment_id']},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0027_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'Canceled'), _negated=True), fields=('therapist', 'date', 'time'), name='unique_active_therapist_slot', violation_error_message='This therapist is already booked at that date and time.'),
+        ),
+    ]
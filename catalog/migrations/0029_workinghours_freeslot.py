@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0028_appointment_unique_active_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkingHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='working_hours', to='catalog.therapist')),
+            ],
+            options={
+                'verbose_name_plural': 'working hours',
+                'ordering': ['therapist', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FreeSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(blank=True, max_length=100)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_slots', to='catalog.therapist')),
+            ],
+            options={
+                'ordering': ['date', 'time', 'therapist_id'],
+                'indexes': [models.Index(fields=['specialization', 'date', 'time', 'therapist'], name='freeslot_spec_date_time_idx'), models.Index(fields=['date', 'time', 'therapist'], name='freeslot_date_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='freeslot',
+            constraint=models.UniqueConstraint(fields=('therapist', 'date', 'time'), name='unique_free_slot'),
+        ),
+    ]
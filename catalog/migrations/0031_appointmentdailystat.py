@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_stats(apps, schema_editor):
+    Appointment = apps.get_model('catalog', 'Appointment')
+    AppointmentDailyStat = apps.get_model('catalog', 'AppointmentDailyStat')
+    rows = (Appointment.objects.filter(date__isnull=False).order_by()
+            .values('therapist_id', 'date', 'service', 'status').annotate(total=Count('pk')))
+    AppointmentDailyStat.objects.bulk_create(
+        AppointmentDailyStat(therapist_id=row['therapist_id'], date=row['date'], service=row['service'] or '',
+                             status=row['status'], count=row['total'])
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0030_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('service', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('therapist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='catalog.therapist')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date', 'therapist', 'service', 'status'], name='apptstat_date_key_idx')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
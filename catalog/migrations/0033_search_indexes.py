@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from catalog.search import install_search_indexes
+    install_search_indexes(schema_editor.connection, rebuild=True)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in ('catalog_patient_fts', 'catalog_therapist_fts'):
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0032_importprogress'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
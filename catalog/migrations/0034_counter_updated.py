@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0033_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='counter',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
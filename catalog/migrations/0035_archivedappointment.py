@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0034_counter_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Canceled', 'Canceled')], default='Pending', max_length=20)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('time', models.TimeField(blank=True, null=True)),
+                ('service', models.CharField(blank=True, choices=[('COUPLES', 'COUPLES'), ('TRAUMA', 'TRAUMA'), ('DEPRESSION', 'DEPRESSION'), ('NUTRITIONAL', 'NUTRITIONAL'), ('FAMILY', 'FAMILY'), ('BEHAVIORAL', 'BEHAVIORAL'), ('ADDICTION', 'ADDICTION')], help_text='Select Specialization', max_length=100)),
+                ('appointment_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField()),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='catalog.patient')),
+                ('therapist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='catalog.therapist')),
+            ],
+            options={
+                'ordering': ['date', 'time', 'appointment_id'],
+                'indexes': [models.Index(fields=['date', 'time', 'appointment_id'], name='archived_appt_date_time_idx'), models.Index(fields=['patient', 'date'], name='archived_appt_patient_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-18 11:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0038_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(blank=True, choices=[('COUPLES', 'COUPLES'), ('TRAUMA', 'TRAUMA'), ('DEPRESSION', 'DEPRESSION'), ('NUTRITIONAL', 'NUTRITIONAL'), ('FAMILY', 'FAMILY'), ('BEHAVIORAL', 'BEHAVIORAL'), ('ADDICTION', 'ADDICTION')], max_length=100)),
+                ('start_date', models.DateField()),
+                ('time', models.TimeField()),
+                ('frequency', models.PositiveSmallIntegerField(choices=[(1, 'Weekly'), (2, 'Every two weeks')], default=1)),
+                ('count', models.PositiveIntegerField(blank=True, help_text='Number of appointments', null=True)),
+                ('until', models.DateField(blank=True, help_text='Date of the last appointment', null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.patient')),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.therapist')),
+            ],
+            options={
+                'verbose_name_plural': 'appointment series',
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='catalog.appointmentseries'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentseries',
+            constraint=models.CheckConstraint(check=models.Q(('count__isnull', False), ('until__isnull', False), _connector='OR'), name='series_has_end'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+
+def delete_orphan_reminders(apps, schema_editor):
+    # Reminders of appointments deleted before catalog.signals removed them too
+    Appointment = apps.get_model('catalog', 'Appointment')
+    ArchivedAppointment = apps.get_model('catalog', 'ArchivedAppointment')
+    Reminder = apps.get_model('catalog', 'Reminder')
+    Reminder.objects.exclude(Exists(Appointment.objects.filter(pk=OuterRef('appointment_id')))).exclude(
+        Exists(ArchivedAppointment.objects.filter(pk=OuterRef('appointment_id')))).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0039_appointment_series'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_orphan_reminders, migrations.RunPython.noop),
+    ]
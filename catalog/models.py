@@ -1,7 +1,12 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connections, models
+from django.db.models import Case, ExpressionWrapper, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractYear
 from django.urls import reverse
-from datetime import date
+from django.utils import timezone
+from datetime import date, timedelta
 
 
 class Therapist(models.Model):
@@ -71,7 +76,75 @@ class Therapist(models.Model):
                 f"{self.availability}")
 
     def get_absolute_url(self):
-        return reverse('therapist-detail', args=[self.therapist_id])
+        return reverse('catalog:therapist_detail', args=[self.therapist_id])
+
+
+# Dashboard age bands: (label, youngest, oldest), oldest None for no upper limit
+AGE_BANDS = [
+    ('0-17', 0, 17),
+    ('18-29', 18, 29),
+    ('30-44', 30, 44),
+    ('45-64', 45, 64),
+    ('65+', 65, None),
+]
+
+
+def years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        # 29 February in a year without one
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_range_q(youngest=None, oldest=None, today=None):
+    """
+    Q for patients aged youngest to oldest inclusive, written as a range on
+    date_of_birth so it can use patient_birth_date_idx.
+    """
+    today = today or timezone.localdate()
+    q = Q()
+    if youngest is not None:
+        q &= Q(date_of_birth__lte=years_before(today, youngest))
+    if oldest is not None:
+        q &= Q(date_of_birth__gt=years_before(today, oldest + 1))
+    return q
+
+
+class PatientQuerySet(models.QuerySet):
+    def with_age(self, today=None):
+        """Annotate age in whole years, computed by the database; None without a date of birth."""
+        today = today or timezone.localdate()
+        birthday_to_come = (Q(date_of_birth__month__gt=today.month)
+                            | Q(date_of_birth__month=today.month, date_of_birth__day__gt=today.day))
+        return self.annotate(age=ExpressionWrapper(
+            Value(today.year) - ExtractYear('date_of_birth') - Case(When(birthday_to_come, then=1), default=0),
+            output_field=IntegerField()))
+
+    def age_between(self, youngest=None, oldest=None, today=None):
+        return self.filter(age_range_q(youngest, oldest, today))
+
+    def age_bands(self, bands=AGE_BANDS, today=None):
+        """
+        [{'band': label, 'count': n}] for each band and for no date of birth.
+        Each band is counted over its own range of patient_birth_date_idx, all
+        in one query: one aggregate over every row takes ten times as long.
+        """
+        ranges = [age_range_q(youngest, oldest, today) for label, youngest, oldest in bands]
+        counts, params = [], []
+        for q in ranges + [Q(date_of_birth__isnull=True)]:
+            sql, band_params = self.filter(q).order_by().values('pk').query.sql_with_params()
+            counts.append(f'(SELECT COUNT(*) FROM ({sql}) band)')
+            params.extend(band_params)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(counts)}', params)
+            row = cursor.fetchone()
+        labels = [label for label, youngest, oldest in bands] + ['Unknown']
+        return [{'band': label, 'count': count} for label, count in zip(labels, row)]
+
+    async def aage_bands(self, bands=AGE_BANDS, today=None):
+        # Raw SQL has no async API
+        return await sync_to_async(self.age_bands)(bands, today)
 
 
 class Patient(models.Model):
@@ -87,8 +160,14 @@ class Patient(models.Model):
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     contact = models.CharField(max_length=15)
 
+    objects = PatientQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Age filters and age bands are date_of_birth ranges
+            models.Index(fields=['date_of_birth'], name='patient_birth_date_idx'),
+        ]
         permissions = [
             ("can_update_patient", "Update patient details"),
             ("can_delete_patient", "Delete patient"),
@@ -102,6 +181,8 @@ class Patient(models.Model):
         return f"Patient {self.patient_id}: {self.name}"
 
     def calculate_age(self):
+        if self.date_of_birth is None:
+            return None
         today = date.today()
         birth_date = self.date_of_birth
         age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
@@ -109,16 +190,21 @@ class Patient(models.Model):
 
     @property
     def age(self):
-        return self.calculate_age()
+        # Set by Patient.objects.with_age(), otherwise worked out here
+        if not hasattr(self, '_age'):
+            self._age = self.calculate_age()
+        return self._age
 
-    def get_absolute_url(self):
-        return reverse('patient-detail', args=[str(self.patient_id)])
+    @age.setter
+    def age(self, value):
+        self._age = value
 
+    def get_absolute_url(self):
+        return reverse('catalog:patient_detail', args=[str(self.patient_id)])
 
-# Appointment model
-class Appointment(models.Model):
-    appointment_id = models.AutoField(primary_key=True)
 
+# Fields shared by live and archived appointments
+class AppointmentBase(models.Model):
     therapist = models.ForeignKey(Therapist, on_delete=models.CASCADE, null=True, blank=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=True, blank=True)
 
@@ -144,7 +230,7 @@ class Appointment(models.Model):
                                help_text="Select Specialization")
 
     class Meta:
-        ordering = ['date', 'time', 'therapist', 'patient', 'status']
+        abstract = True
 
     def __str__(self):
         patient_name = self.patient.name if self.patient else "Unassigned"
@@ -152,4 +238,245 @@ class Appointment(models.Model):
                 f"Status: {self.status}")
 
     def get_absolute_url(self):
-        return reverse('appointment-detail', args=[str(self.appointment_id)])
+        return reverse('catalog:appointment_detail', args=[str(self.appointment_id)])
+
+
+# A repeating booking, expanded into Appointment rows by catalog.series
+class AppointmentSeries(models.Model):
+    WEEKLY = 1
+    BIWEEKLY = 2
+    # Weeks between occurrences
+    FREQUENCY_CHOICES = [
+        (WEEKLY, 'Weekly'),
+        (BIWEEKLY, 'Every two weeks'),
+    ]
+    # Two years of weekly sessions
+    MAX_OCCURRENCES = 104
+
+    therapist = models.ForeignKey(Therapist, on_delete=models.CASCADE)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
+    service = models.CharField(max_length=100, choices=AppointmentBase.SERVICE_CHOICES, blank=True)
+    start_date = models.DateField()
+    time = models.TimeField()
+    frequency = models.PositiveSmallIntegerField(choices=FREQUENCY_CHOICES, default=WEEKLY)
+    # The series ends after count occurrences or on until, whichever comes first
+    count = models.PositiveIntegerField(null=True, blank=True, help_text="Number of appointments")
+    until = models.DateField(null=True, blank=True, help_text="Date of the last appointment")
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'appointment series'
+        constraints = [
+            models.CheckConstraint(check=Q(count__isnull=False) | Q(until__isnull=False),
+                                   name='series_has_end'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} at {self.time} from {self.start_date}"
+
+    def get_absolute_url(self):
+        return reverse('catalog:update_series', args=[str(self.pk)])
+
+    def clean(self):
+        if self.count is None and self.until is None:
+            raise ValidationError("Give the number of appointments or the date of the last one.")
+        if self.count is not None and not 1 <= self.count <= self.MAX_OCCURRENCES:
+            raise ValidationError({'count': f"A series has 1 to {self.MAX_OCCURRENCES} appointments."})
+        if self.until is not None and self.start_date is not None and self.until < self.start_date:
+            raise ValidationError({'until': "The series cannot end before it starts."})
+        elif self.count is None and self.start_date is not None:
+            if (self.until - self.start_date).days // (7 * self.frequency) >= self.MAX_OCCURRENCES:
+                raise ValidationError({'until': f"A series has at most {self.MAX_OCCURRENCES} appointments."})
+
+    def occurrences(self):
+        """The dates of the series, at most MAX_OCCURRENCES of them."""
+        count = min(self.count or self.MAX_OCCURRENCES, self.MAX_OCCURRENCES)
+        dates = [self.start_date + timedelta(weeks=self.frequency * n) for n in range(count)]
+        return [day for day in dates if self.until is None or day <= self.until]
+
+
+# Appointment model
+class Appointment(AppointmentBase):
+    appointment_id = models.AutoField(primary_key=True)
+    series = models.ForeignKey(AppointmentSeries, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='appointments')
+
+    class Meta:
+        ordering = ['date', 'time', 'appointment_id']
+        indexes = [
+            # Default ordering / list pages and date-range filters
+            models.Index(fields=['date', 'time', 'appointment_id'], name='appt_date_time_idx'),
+            # Therapist schedule and double-booking lookups
+            models.Index(fields=['therapist', 'date', 'time'], name='appt_therapist_date_time_idx'),
+            # A patient's appointment history
+            models.Index(fields=['patient', 'date'], name='appt_patient_date_idx'),
+            # Status filters such as upcoming pending appointments, and the reminder scheduler's window
+            models.Index(fields=['status', 'date', 'time'], name='appt_status_date_time_idx'),
+        ]
+        constraints = [
+            # A therapist can only hold one active appointment per slot
+            models.UniqueConstraint(fields=['therapist', 'date', 'time'], condition=~models.Q(status='Canceled'),
+                                    name='unique_active_therapist_slot',
+                                    violation_error_message="This therapist is already booked at that date and time."),
+        ]
+
+
+# One row per reminder sent, so catalog.reminders never sends the same one twice
+class Reminder(models.Model):
+    # No database constraint: archived appointments keep their reminders under the same id. Deleting an
+    # appointment, archived or not, deletes its reminders in catalog.signals.
+    appointment = models.ForeignKey(Appointment, on_delete=models.DO_NOTHING, db_constraint=False,
+                                    related_name='reminders')
+    kind = models.CharField(max_length=20)
+    # The scheduler run that claimed it
+    batch = models.CharField(max_length=32, db_index=True)
+    sent_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'kind'], name='unique_reminder'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} reminder for appointment {self.appointment_id} at {self.sent_at}"
+
+
+# Closed appointments moved out of Appointment by catalog.archive, under their original ids
+class ArchivedAppointment(AppointmentBase):
+    appointment_id = models.IntegerField(primary_key=True)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['date', 'time', 'appointment_id']
+        indexes = [
+            models.Index(fields=['date', 'time', 'appointment_id'], name='archived_appt_date_time_idx'),
+            models.Index(fields=['patient', 'date'], name='archived_appt_patient_date_idx'),
+        ]
+
+
+class WorkingHours(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    therapist = models.ForeignKey(Therapist, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['therapist', 'weekday', 'start_time']
+        verbose_name_plural = 'working hours'
+
+    def __str__(self):
+        return f"{self.therapist.name}: {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+
+# Precomputed open slots, maintained by catalog.availability
+class FreeSlot(models.Model):
+    therapist = models.ForeignKey(Therapist, on_delete=models.CASCADE, related_name='free_slots')
+    # Copied from the therapist so "next slot for a specialization" is one index range
+    specialization = models.CharField(max_length=100, blank=True)
+    date = models.DateField()
+    time = models.TimeField()
+
+    class Meta:
+        ordering = ['date', 'time', 'therapist_id']
+        indexes = [
+            models.Index(fields=['specialization', 'date', 'time', 'therapist'], name='freeslot_spec_date_time_idx'),
+            models.Index(fields=['date', 'time', 'therapist'], name='freeslot_date_time_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['therapist', 'date', 'time'], name='unique_free_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.therapist_id} free on {self.date} at {self.time}"
+
+
+# Row counts kept up to date by catalog.counters so pages don't run COUNT(*)
+class Counter(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+# Appointments per day, therapist, service and status, maintained by catalog.stats
+class AppointmentDailyStat(models.Model):
+    date = models.DateField()
+    therapist = models.ForeignKey(Therapist, on_delete=models.CASCADE, null=True, blank=True)
+    service = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['date', 'therapist', 'service', 'status'], name='apptstat_date_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.therapist_id} {self.service} {self.status}: {self.count}"
+
+
+# Rows committed so far by the import_catalog command, per source file
+class ImportProgress(models.Model):
+    source = models.CharField(max_length=500, unique=True)
+    rows_done = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows_done} rows"
+
+
+# Background work stored in the database and run by the run_worker command, see catalog.jobs
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Not run before this; pushed back after a failed attempt
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Set while a worker holds the job; once leased_until passes another worker may take it over
+    lease_token = models.CharField(max_length=32, blank=True, db_index=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Workers take the oldest due job of a queue
+            models.Index(fields=['queue', 'status', 'run_at'], name='job_queue_status_run_at_idx'),
+            # Expired leases, throughput and purging
+            models.Index(fields=['status', 'leased_until'], name='job_status_leased_until_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
@@ -0,0 +1,135 @@
+import base64
+import json
+
+from django.db.models import F, Q
+from django.http import Http404
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _get_field(model, name):
+    if name == 'pk':
+        return model._meta.pk
+    return model._meta.get_field(name)
+
+
+def encode_cursor(obj, fields):
+    # Serialize the ordering values of obj into an opaque url-safe token
+    values = []
+    for name in fields:
+        value = getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, fields):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [None if value is None else _get_field(model, name).to_python(value)
+                for name, value in zip(fields, values)]
+    except Exception:
+        raise Http404("Invalid cursor")
+
+
+def _seek(fields, values, forward):
+    # Build the "rows strictly after (or before) this cursor" filter.
+    # NULLs sort first, which is what SQLite does for ascending order.
+    name, value = fields[0], values[0]
+    if value is None:
+        past = Q(**{f'{name}__isnull': False}) if forward else Q(pk__in=[])
+        same = Q(**{f'{name}__isnull': True})
+    else:
+        if forward:
+            past = Q(**{f'{name}__gt': value})
+        else:
+            past = Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+        same = Q(**{name: value})
+    if len(fields) == 1:
+        return past
+    return past | (same & _seek(fields[1:], values[1:], forward))
+
+
+def _seek_range(fields, values, forward):
+    # Same rows as _seek, plus a plain range on the leading column that the
+    # database can use to start reading the index at the cursor position.
+    # Going backwards this leaves out rows whose leading value is NULL,
+    # keyset_paginate fetches those separately.
+    condition = _seek(fields, values, forward)
+    name, value = fields[0], values[0]
+    if value is None:
+        return condition
+    lookup = 'gte' if forward else 'lte'
+    return Q(**{f'{name}__{lookup}': value}) & condition
+
+
+def _page_queries(queryset, fields, after, before, per_page):
+    # The queries for one page: the seek query and, going backwards, the
+    # rows with a NULL leading value that come before everything else
+    model = queryset.model
+    if before is None:
+        ordering = [F(name).asc(nulls_first=True) for name in fields]
+        if after:
+            queryset = queryset.filter(_seek_range(fields, decode_cursor(after, model, fields), True))
+        return queryset.order_by(*ordering)[:per_page + 1], None
+
+    ordering = [F(name).desc(nulls_last=True) for name in fields]
+    values = decode_cursor(before, model, fields)
+    page_queryset = queryset.filter(_seek_range(fields, values, False)).order_by(*ordering)[:per_page + 1]
+    nulls_queryset = None
+    if values[0] is not None:
+        nulls_queryset = queryset.filter(**{f'{fields[0]}__isnull': True}).order_by(*ordering)
+    return page_queryset, nulls_queryset
+
+
+def _make_page(rows, fields, after, forward, per_page):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(rows[-1], fields)
+        if after or (has_more and not forward):
+            previous_cursor = encode_cursor(rows[0], fields)
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def keyset_paginate(queryset, fields, after=None, before=None, per_page=50):
+    """
+    Return one page of queryset ordered by fields, seeking from a cursor
+    instead of using OFFSET so every page costs the same to fetch.
+    The last field must be unique (normally the primary key).
+    """
+    page_queryset, nulls_queryset = _page_queries(queryset, fields, after, before, per_page)
+    # Fetch one extra row to find out whether there is another page
+    rows = list(page_queryset)
+    if nulls_queryset is not None and len(rows) <= per_page:
+        rows += list(nulls_queryset[:per_page + 1 - len(rows)])
+    return _make_page(rows, fields, after, before is None, per_page)
+
+
+async def akeyset_paginate(queryset, fields, after=None, before=None, per_page=50):
+    """Async version of keyset_paginate()."""
+    page_queryset, nulls_queryset = _page_queries(queryset, fields, after, before, per_page)
+    rows = [obj async for obj in page_queryset.aiterator()]
+    if nulls_queryset is not None and len(rows) <= per_page:
+        rows += [obj async for obj in nulls_queryset[:per_page + 1 - len(rows)].aiterator()]
+    return _make_page(rows, fields, after, before is None, per_page)
@@ -0,0 +1,169 @@
+"""
+Reminders for pending appointments coming up within the next window.
+send_reminders() walks the due appointments on the (status, date, time)
+index in batches: each batch is claimed with one INSERT ... SELECT into
+Reminder, rendered from one template and handed to the REMINDER_SENDER
+backend in a single call. An appointment gets at most one reminder of
+each kind, however often or concurrently the scheduler runs; what a
+sender reports as failed, or a batch whose sender raises, is released
+and tried again on the next run. Delivery is at most once: the claim is
+committed before the sender is called, so if the process dies in
+between, that batch stays marked as sent without having gone out.
+"""
+import json
+import sys
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DateTimeField, Exists, F, OuterRef, Q, Value
+from django.db.models.constants import OnConflict
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.formats import date_format, time_format
+from django.utils.module_loading import import_string
+
+from .models import Appointment, Reminder
+from .pagination import _seek_range
+
+KEYSET_FIELDS = ('date', 'time', 'appointment_id')
+# Payload key: the Reminder lookup it is read from
+PAYLOAD_FIELDS = {
+    'date': 'appointment__date',
+    'time': 'appointment__time',
+    'service': 'appointment__service',
+    'patient': 'appointment__patient__name',
+    'to': 'appointment__patient__contact',
+    'therapist': 'appointment__therapist__name',
+}
+
+
+class BaseSender:
+    def send_batch(self, payloads):
+        """Deliver a list of payload dicts. Returns the appointment ids of those that could not be sent."""
+        raise NotImplementedError
+
+
+class ConsoleSender(BaseSender):
+    """Writes the reminders to a stream, stdout by default. For development."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send_batch(self, payloads):
+        self.stream.write(''.join(f"To {payload['to']}: {payload['message']}\n" for payload in payloads))
+        self.stream.flush()
+        return []
+
+
+class FileSender(BaseSender):
+    """Appends the reminders to path as JSON lines. For tests and dry runs against real data."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send_batch(self, payloads):
+        with open(self.path, 'a') as f:
+            f.writelines(json.dumps(payload, default=str) + '\n' for payload in payloads)
+        return []
+
+
+def get_sender():
+    sender = getattr(settings, 'REMINDER_SENDER', 'catalog.reminders.ConsoleSender')
+    return import_string(sender)(**getattr(settings, 'REMINDER_SENDER_OPTIONS', {}))
+
+
+def reminder_window(window_hours=None, now=None):
+    if window_hours is None:
+        window_hours = getattr(settings, 'REMINDER_WINDOW_HOURS', 24)
+    start = timezone.localtime(now).replace(microsecond=0)
+    return start, start + timedelta(hours=window_hours)
+
+
+def due_reminders(start, end, kind='upcoming'):
+    """Pending appointments with a patient between start and end that have no reminder of kind yet."""
+    day, last_day = start.date(), end.date()
+    if day == last_day:
+        within = Q(time__gte=start.time(), time__lt=end.time())
+    else:
+        within = (Q(date=day, time__gte=start.time()) | Q(date__gt=day, date__lt=last_day, time__isnull=False)
+                  | Q(date=last_day, time__lt=end.time()))
+    # The plain date range is what the database seeks on appt_status_date_time_idx, the rest filters within it
+    return (Appointment.objects.filter(within, status='Pending', date__gte=day, date__lte=last_day,
+                                       patient__isnull=False)
+            .exclude(Exists(Reminder.objects.filter(appointment=OuterRef('pk'), kind=kind)))
+            .order_by(*KEYSET_FIELDS))
+
+
+def _claim(candidates, limit, kind, token, sent_at):
+    # One statement picks the batch and records it, so two runs never claim the same reminder
+    rows = candidates.annotate(kind_value=Value(kind), batch_value=Value(token),
+                               sent_at_value=Value(sent_at, output_field=DateTimeField()))
+    rows = rows.values('pk', 'kind_value', 'batch_value', 'sent_at_value')[:limit]
+    select, params = rows.query.sql_with_params()
+    quote = connection.ops.quote_name
+    fields = [Reminder._meta.get_field(name) for name in ('appointment', 'kind', 'batch', 'sent_at')]
+    columns = ', '.join(quote(field.column) for field in fields)
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    suffix = connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{insert} {quote(Reminder._meta.db_table)} ({columns}) {select} {suffix}', params)
+
+
+def _payloads(rows, kind, template):
+    services = dict(Appointment.SERVICE_CHOICES)
+    # A batch only spans a few dates and slot times; formatting them once each is most of the rendering saved
+    days, times = {}, {}
+    for row in rows:
+        day, at = row['date'], row['time']
+        if day not in days:
+            days[day] = date_format(day, 'l j F')
+        if at not in times:
+            times[at] = time_format(at, 'H:i')
+        row['kind'] = kind
+        row['service'] = services.get(row['service'], row['service'])
+        row['message'] = template.render(dict(row, day=days[day], at=times[at])).strip()
+    return rows
+
+
+def send_reminders(window_hours=None, kind='upcoming', batch_size=None, now=None, sender=None, progress=None):
+    """
+    Send a reminder of kind for every pending appointment in the next
+    window_hours (REMINDER_WINDOW_HOURS) that has not had one, batch_size
+    (REMINDER_BATCH_SIZE) at a time. Each batch costs two queries, plus a
+    third to release the reminders the sender could not deliver. Returns
+    the number of reminders sent and failed.
+    """
+    batch_size = batch_size or getattr(settings, 'REMINDER_BATCH_SIZE', 1000)
+    sender = sender or get_sender()
+    template = get_template('catalog/reminder.txt')
+    start, end = reminder_window(window_hours, now)
+    candidates = due_reminders(start, end, kind)
+    stats = {'sent': 0, 'failed': 0, 'batches': 0}
+    cursor = None
+    while True:
+        token = uuid.uuid4().hex
+        batch = candidates if cursor is None else candidates.filter(_seek_range(KEYSET_FIELDS, cursor, True))
+        with transaction.atomic():
+            _claim(batch, batch_size, kind, token, timezone.now())
+            rows = list(Reminder.objects.filter(batch=token)
+                        .order_by(*(f'appointment__{name}' for name in KEYSET_FIELDS))
+                        .values('appointment_id', **{key: F(name) for key, name in PAYLOAD_FIELDS.items()}))
+        if not rows:
+            break
+        # Failed reminders stay due, but behind the cursor until the next run
+        cursor = [rows[-1]['date'], rows[-1]['time'], rows[-1]['appointment_id']]
+        try:
+            failed = set(sender.send_batch(_payloads(rows, kind, template)) or ())
+        except Exception:
+            Reminder.objects.filter(batch=token).delete()
+            raise
+        if failed:
+            Reminder.objects.filter(batch=token, appointment_id__in=failed).delete()
+        stats['batches'] += 1
+        stats['sent'] += len(rows) - len(failed)
+        stats['failed'] += len(failed)
+        if progress:
+            progress(stats)
+    return stats
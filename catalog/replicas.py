@@ -0,0 +1,17 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def refresh_replica(alias):
+    """
+    Overwrite the SQLite database alias with a consistent copy of the
+    primary, using SQLite's online backup API. This stands in for
+    replication in development and tests; server databases replicate
+    by themselves.
+    """
+    primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ImproperlyConfigured("Replicas can only be refreshed by copying between SQLite databases.")
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
@@ -0,0 +1,68 @@
+"""
+Read/write splitting for the catalog models. Writes go to the primary
+("default"); reads go to one of settings.DATABASE_REPLICAS unless this
+request or thread has to see its own writes. PrimaryPinningMiddleware
+extends that to the browser's next requests for DATABASE_REPLICA_LAG
+seconds.
+"""
+import random
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = Local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_primary(wrote=False):
+    """Send the reads of the current request or thread to the primary from now on."""
+    _state.pinned = True
+    _state.wrote = getattr(_state, 'wrote', False) or wrote
+
+
+def unpin_primary():
+    _state.pinned = _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'catalog' or not replicas() or is_pinned():
+            return None
+        # Inside a transaction on the primary, reads must see what it has written so far
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Related objects come from the same database as the object they hang off
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'catalog':
+            return None
+        pin_primary(wrote=True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with the data
+        if db in replicas():
+            return False
+        return None
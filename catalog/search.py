@@ -0,0 +1,142 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Patient, Therapist
+
+# SQLite FTS5 shadow indexes over the searchable columns. They are
+# external-content tables: the text lives in the catalog tables and the
+# triggers below keep the index in sync, including for bulk_create and raw SQL.
+SEARCH_INDEXES = {
+    'patients': {
+        'model': Patient,
+        'table': 'catalog_patient',
+        'pk': 'patient_id',
+        'columns': ['name', 'contact'],
+        # Column weights for bm25(): a name match counts more than a phone number
+        'weights': [10.0, 1.0],
+    },
+    'therapists': {
+        'model': Therapist,
+        'table': 'catalog_therapist',
+        'pk': 'therapist_id',
+        'columns': ['name', 'contact', 'specialization'],
+        'weights': [10.0, 1.0, 5.0],
+    },
+}
+
+
+def _fts_table(spec):
+    return f"{spec['table']}_fts"
+
+
+def _install_statements(spec):
+    fts, table, pk = _fts_table(spec), spec['table'], spec['pk']
+    columns = ', '.join(spec['columns'])
+    new_values = ', '.join(f'new.{column}' for column in spec['columns'])
+    old_values = ', '.join(f'old.{column}' for column in spec['columns'])
+    return {
+        fts: f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {columns}, content='{table}', content_rowid='{pk}',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )""",
+        f'{fts}_ai': f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {new_values});
+            END""",
+        f'{fts}_ad': f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values});
+            END""",
+        f'{fts}_au': f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.{pk}, {old_values});
+                INSERT INTO {fts}(rowid, {columns}) VALUES (new.{pk}, {new_values});
+            END""",
+    }
+
+
+def install_search_indexes(using_connection=None, rebuild=False):
+    """
+    Create any missing FTS tables and triggers. Django rebuilds a SQLite
+    table to alter it, which drops its triggers, so this runs after every
+    migrate and rebuilds an index whenever something had to be recreated.
+    """
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for spec in SEARCH_INDEXES.values():
+            if spec['table'] not in existing:
+                continue
+            statements = _install_statements(spec)
+            missing = [name for name in statements if name not in existing]
+            for name in missing:
+                cursor.execute(statements[name])
+            if missing or rebuild:
+                fts = _fts_table(spec)
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_search_triggers(using_connection=None):
+    """
+    Drop the sync triggers before a bulk load; install_search_indexes()
+    puts them back and rebuilds the indexes in one pass afterwards.
+    """
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for spec in SEARCH_INDEXES.values():
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {_fts_table(spec)}_{suffix}')
+
+
+def match_expression(query):
+    # Every word must match as a prefix: "wan ot" -> "wan"* "ot"*
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _fallback_filter(spec, query):
+    condition = Q()
+    for word in re.findall(r'\w+', query):
+        condition &= Q(**{f"{spec['columns'][0]}__icontains": word})
+    return condition
+
+
+def search(kind, query, limit=20):
+    """Return up to limit objects matching query, best match first."""
+    spec = SEARCH_INDEXES[kind]
+    model = spec['model']
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if connection.vendor != 'sqlite':
+        return list(model.objects.filter(_fallback_filter(spec, query))[:limit])
+
+    fts = _fts_table(spec)
+    weights = ', '.join(str(weight) for weight in spec['weights'])
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s ORDER BY bm25({fts}, {weights}) LIMIT %s",
+                       [expression, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    objects = model.objects.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def filter_queryset(kind, queryset, query):
+    """Restrict queryset to rows matching query, keeping its own ordering."""
+    spec = SEARCH_INDEXES[kind]
+    expression = match_expression(query)
+    if not expression:
+        return queryset
+    if connection.vendor != 'sqlite':
+        return queryset.filter(_fallback_filter(spec, query))
+    fts = _fts_table(spec)
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [expression]))
@@ -0,0 +1,256 @@
+"""
+Deterministic synthetic data for benchmarks and load tests. The same
+sizes, seed and reference date always produce the same rows.
+"""
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import accumulate, repeat
+
+from django.db import connection, transaction
+from django.db.models import UniqueConstraint
+
+from .availability import rebuild_free_slots
+from .counters import COUNTED_MODELS, bump_version, rebuild_counters
+from .models import (Appointment, AppointmentDailyStat, AppointmentSeries, ArchivedAppointment, FreeSlot, Patient,
+                     Reminder, Therapist, WorkingHours)
+from .search import drop_search_triggers, install_search_indexes
+from .stats import rebuild_appointment_stats
+
+FIRST_NAMES = ['Amani', 'Wanjiru', 'Otieno', 'Akinyi', 'Kamau', 'Njeri', 'Mwangi', 'Achieng', 'Kiprop', 'Chebet',
+               'Baraka', 'Zawadi', 'Juma', 'Neema', 'Omondi', 'Wairimu', 'Mutua', 'Nafula', 'Kariuki', 'Atieno']
+LAST_NAMES = ['Kimani', 'Odhiambo', 'Wekesa', 'Mutiso', 'Kiplagat', 'Njoroge', 'Ochieng', 'Maina', 'Korir',
+              'Wambui', 'Onyango', 'Kibet', 'Muthoni', 'Barasa', 'Gitau', 'Cherono', 'Owino', 'Ndungu']
+
+# Relative weights, in the order of the model choices
+SPECIALIZATION_WEIGHTS = [15, 20, 25, 5, 15, 12, 8]
+GENDER_WEIGHTS = [42, 55, 3]
+# Past appointments are mostly completed, future ones mostly pending
+PAST_STATUS_WEIGHTS = {'Pending': 5, 'Completed': 80, 'Canceled': 15}
+FUTURE_STATUS_WEIGHTS = {'Pending': 90, 'Completed': 0, 'Canceled': 10}
+# Share of appointments booked for something other than the therapist's specialization
+OTHER_SERVICE = 0.15
+# Share of patients with no date of birth on file
+MISSING_BIRTH_DATE = 0.02
+
+# Every therapist works 09:00-17:00 on weekdays, one appointment per hour
+FIRST_HOUR = 9
+SLOTS_PER_DAY = 8
+
+BATCH_SIZE = 50000
+# Above this many appointments it is quicker to build the indexes once at the end
+DEFER_INDEXES_FROM = 100000
+
+# Only for the length of the load: no fsync, rollback journal in memory, a 256 MB page cache
+LOAD_PRAGMAS = {'synchronous': 'OFF', 'journal_mode': 'MEMORY', 'cache_size': -262144, 'temp_store': 'MEMORY'}
+
+THERAPIST_FIELDS = ['therapist_id', 'name', 'contact', 'specialization', 'availability']
+WORKING_HOURS_FIELDS = ['therapist', 'weekday', 'start_time', 'end_time']
+PATIENT_FIELDS = ['patient_id', 'name', 'contact', 'date_of_birth', 'gender']
+APPOINTMENT_FIELDS = ['appointment_id', 'therapist', 'patient', 'date', 'time', 'service', 'status']
+
+
+def _rng(seed, table):
+    # One generator per table, so changing one size leaves the other tables' rows alone
+    return random.Random(f'{seed}:{table}')
+
+
+def _names(rng, k, prefix=''):
+    return [f'{prefix}{first} {last}' for first, last in zip(rng.choices(FIRST_NAMES, k=k),
+                                                            rng.choices(LAST_NAMES, k=k))]
+
+
+def _contacts(rng, k):
+    return [f'07{rng.randrange(10 ** 8):08d}' for _ in range(k)]
+
+
+def _batch_ranges(count, first_id, batch_size):
+    for offset in range(0, count, batch_size):
+        yield range(first_id + offset, first_id + min(offset + batch_size, count))
+
+
+def therapist_batches(count, rng, first_id=1, batch_size=BATCH_SIZE):
+    specializations = [code for code, label in Therapist.SPECIALIZATION_CHOICES]
+    for ids in _batch_ranges(count, first_id, batch_size):
+        k = len(ids)
+        yield list(zip(ids, _names(rng, k, 'Dr. '), _contacts(rng, k),
+                       rng.choices(specializations, SPECIALIZATION_WEIGHTS, k=k), repeat('A')))
+
+
+def patient_batches(count, rng, today, first_id=1, batch_size=BATCH_SIZE):
+    genders = [code for code, label in Patient.GENDER_CHOICES]
+    # Patients are 18 to 85 years old
+    youngest = today.toordinal() - 18 * 365
+    span = (85 - 18) * 365
+    for ids in _batch_ranges(count, first_id, batch_size):
+        k = len(ids)
+        birth_dates = [None if rng.random() < MISSING_BIRTH_DATE
+                       else date.fromordinal(youngest - rng.randrange(span)).isoformat() for _ in range(k)]
+        yield list(zip(ids, _names(rng, k), _contacts(rng, k), birth_dates,
+                       rng.choices(genders, GENDER_WEIGHTS, k=k)))
+
+
+def appointment_batches(count, therapists, patient_ids, rng, start, today, first_id=1, batch_size=BATCH_SIZE):
+    """
+    Spread count appointments over the therapists' weekday slots from start
+    onwards. therapists is a list of (pk, specialization). Slots are handed
+    out in order, so no two appointments share a therapist, date and time.
+    """
+    services = [code for code, label in Appointment.SERVICE_CHOICES]
+    statuses = list(PAST_STATUS_WEIGHTS)
+    past_weights = list(accumulate(PAST_STATUS_WEIGHTS[status] for status in statuses))
+    future_weights = list(accumulate(FUTURE_STATUS_WEIGHTS[status] for status in statuses))
+    times = [f'{FIRST_HOUR + hour:02d}:00:00' for hour in range(SLOTS_PER_DAY)]
+    days = {}
+    width = len(therapists)
+
+    def day_of(working_day):
+        # Five working days per week
+        if working_day not in days:
+            week, weekday = divmod(working_day, 5)
+            day = start + timedelta(weeks=week, days=weekday)
+            days[working_day] = (day.isoformat(), past_weights if day < today else future_weights)
+        return days[working_day]
+
+    random_value = rng.random
+    for ids in _batch_ranges(count, first_id, batch_size):
+        rows = []
+        for pk in ids:
+            n = pk - first_id
+            therapist_id, specialization = therapists[n % width]
+            slot = n // width
+            day, weights = day_of(slot // SLOTS_PER_DAY)
+            service = rng.choice(services) if random_value() < OTHER_SERVICE else specialization
+            status = statuses[bisect(weights, random_value() * weights[-1])]
+            patient_id = patient_ids[int(random_value() * len(patient_ids))] if patient_ids else None
+            rows.append((pk, therapist_id, patient_id, day, times[slot % SLOTS_PER_DAY], service, status))
+        yield rows
+
+
+def _insert(cursor, model, field_names, rows):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+def _next_id(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+@contextmanager
+def load_pragmas():
+    """Relax SQLite durability for a bulk load and restore the settings afterwards."""
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Most of these cannot change inside a transaction
+        yield
+        return
+    saved = {}
+    with connection.cursor() as cursor:
+        for pragma, value in LOAD_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}')
+            saved[pragma] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for pragma, value in saved.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@contextmanager
+def deferred_indexes(model):
+    """Drop the secondary indexes and unique constraints of model, and build them again on exit."""
+    editor = connection.schema_editor()
+    indexes = list(model._meta.indexes) + [c for c in model._meta.constraints if isinstance(c, UniqueConstraint)]
+    with connection.cursor() as cursor:
+        for index in indexes:
+            cursor.execute(str(index.remove_sql(model, editor)))
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(str(index.create_sql(model, editor)))
+
+
+def flush_catalog():
+    """Delete every therapist, patient and appointment and the data derived from them."""
+    with load_pragmas():
+        drop_search_triggers()
+        # Without triggers or foreign key checks SQLite empties a table without visiting its rows
+        with connection.constraint_checks_disabled(), connection.cursor() as cursor:
+            for model in (FreeSlot, AppointmentDailyStat, Reminder, ArchivedAppointment, Appointment,
+                          AppointmentSeries, WorkingHours, Patient, Therapist):
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        install_search_indexes(rebuild=True)
+    rebuild_counters()
+    for kind in COUNTED_MODELS:
+        bump_version(kind)
+
+
+def seed_catalog(therapists, patients, appointments, seed=0, start=None, today=None, batch_size=BATCH_SIZE,
+                 defer_indexes=None, progress=None):
+    """
+    Insert synthetic therapists, patients and appointments with batched raw
+    INSERTs, bypassing signals and the search triggers, then rebuild the
+    search index, counters, rollups and free slots in one pass each. The
+    appointment schedule starts at start, by default so that today falls
+    in the middle of it. New appointments only use the new therapists, so
+    seeding on top of existing data cannot double-book anyone.
+    """
+    today = today or date.today()
+    if start is None:
+        # Half of the schedule lies in the past
+        weeks = -(-appointments // (max(therapists, 1) * SLOTS_PER_DAY * 5))
+        start = today - timedelta(weeks=weeks // 2)
+        start -= timedelta(days=start.weekday())
+    if defer_indexes is None:
+        defer_indexes = appointments >= DEFER_INDEXES_FROM
+
+    def insert(model, field_names, batches):
+        for rows in batches:
+            with transaction.atomic(), connection.cursor() as cursor:
+                _insert(cursor, model, field_names, rows)
+            if progress:
+                progress(model, len(rows))
+
+    first_therapist, first_patient = _next_id(Therapist), _next_id(Patient)
+    # The generated rows only point at rows generated before them, so foreign keys need no checking
+    with load_pragmas(), connection.constraint_checks_disabled():
+        drop_search_triggers()
+        try:
+            therapist_rows = []
+            for rows in therapist_batches(therapists, _rng(seed, 'therapists'), first_therapist, batch_size):
+                insert(Therapist, THERAPIST_FIELDS, [rows])
+                therapist_rows.extend((row[0], row[3]) for row in rows)
+            insert(WorkingHours, WORKING_HOURS_FIELDS,
+                   [[(pk, weekday, f'{FIRST_HOUR:02d}:00:00', f'{FIRST_HOUR + SLOTS_PER_DAY:02d}:00:00')
+                     for pk, specialization in therapist_rows for weekday in range(5)]])
+            insert(Patient, PATIENT_FIELDS,
+                   patient_batches(patients, _rng(seed, 'patients'), today, first_patient, batch_size))
+
+            if therapist_rows and appointments:
+                batches = appointment_batches(appointments, therapist_rows,
+                                              range(first_patient, first_patient + patients),
+                                              _rng(seed, 'appointments'), start, today,
+                                              max(_next_id(Appointment), _next_id(ArchivedAppointment)),
+                                              batch_size)
+                if defer_indexes:
+                    with deferred_indexes(Appointment):
+                        insert(Appointment, APPOINTMENT_FIELDS, batches)
+                else:
+                    insert(Appointment, APPOINTMENT_FIELDS, batches)
+        finally:
+            install_search_indexes(rebuild=True)
+
+        rebuild_counters()
+        rebuild_appointment_stats()
+        rebuild_free_slots()
+    for kind in COUNTED_MODELS:
+        bump_version(kind)
+    return {'therapists': therapists, 'patients': patients, 'appointments': appointments, 'seed': seed,
+            'start': start.isoformat(), 'today': today.isoformat()}
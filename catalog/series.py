@@ -0,0 +1,129 @@
+"""
+Recurring appointments. book_series() expands an AppointmentSeries into
+Appointment rows, checking the therapist's bookings on every date with
+one query and inserting them with one bulk_create. change_series() and
+cancel_series() rewrite the rest of a series with a single UPDATE.
+Bulk writes skip the model signals, so the counters, daily rollup and
+free-slot index are brought up to date here once per call rather than
+once per appointment.
+"""
+from django.db import IntegrityError, transaction
+
+from . import availability, counters, stats
+from .booking import SlotTaken
+from .models import Appointment, Therapist
+
+
+def series_conflicts(therapist_id, time, dates, exclude=()):
+    """The dates on which the therapist already has an active appointment at time."""
+    # One range per date on the unique_active_therapist_slot index
+    bookings = (Appointment.objects.filter(therapist_id=therapist_id, time=time, date__in=dates)
+                .exclude(status='Canceled').exclude(pk__in=exclude))
+    return sorted(bookings.values_list('date', flat=True))
+
+
+def _slot_taken(dates):
+    listed = ', '.join(day.isoformat() for day in dates)
+    return SlotTaken(f"This therapist is already booked at that time on {listed}.", code='slot_taken')
+
+
+def _sync(therapist_ids, dates):
+    # What the Appointment signal receivers would have done, for the whole batch at once
+    if not dates:
+        return
+    stats.rebuild_appointment_stats(therapist_ids, dates)
+    for therapist in Therapist.objects.filter(pk__in=therapist_ids):
+        availability.refresh_free_slots(therapist, min(dates), max(dates))
+    counters.bump_version('appointments')
+
+
+def book_series(series):
+    """
+    Save series and create its appointments, raising SlotTaken with the
+    clashing dates if the therapist is booked at that time on any of them.
+    As with book_appointment(), a booking that sneaks in after the check is
+    caught by the unique constraint and reported the same way.
+    """
+    dates = series.occurrences()
+    taken = series_conflicts(series.therapist_id, series.time, dates)
+    if taken:
+        raise _slot_taken(taken)
+    try:
+        with transaction.atomic():
+            series.save()
+            appointments = Appointment.objects.bulk_create([
+                Appointment(series=series, therapist_id=series.therapist_id, patient_id=series.patient_id,
+                            service=series.service, date=day, time=series.time)
+                for day in dates
+            ])
+            counters.increment('appointments', len(appointments))
+            _sync({series.therapist_id}, dates)
+    except IntegrityError:
+        series.pk = None
+        taken = series_conflicts(series.therapist_id, series.time, dates)
+        if taken:
+            raise _slot_taken(taken)
+        raise
+    return appointments
+
+
+def rest_of_series(series, from_date):
+    """The pending appointments of series on or after from_date."""
+    return Appointment.objects.filter(series=series, date__gte=from_date, status='Pending')
+
+
+def _move_conflicts(rows, therapist, time):
+    # Appointments changed one by one may not share a slot any more; usually this is one query
+    moves = {}
+    for pk, therapist_id, old_time, day in rows:
+        slot = (therapist.pk if therapist is not None else therapist_id, time or old_time)
+        moves.setdefault(slot, []).append(day)
+    pks = [row[0] for row in rows]
+    return sorted(day for (therapist_id, new_time), dates in moves.items()
+                  for day in series_conflicts(therapist_id, new_time, dates, exclude=pks))
+
+
+def change_series(series, from_date, therapist=None, time=None, service=None):
+    """
+    Move the rest of series to another therapist or time, or change its
+    service, from from_date on. The series itself is updated to match, and
+    SlotTaken lists the dates on which the new slot is already booked.
+    Returns the number of appointments changed.
+    """
+    changes = {name: value for name, value in (('therapist', therapist), ('time', time), ('service', service))
+               if value not in (None, '')}
+    rows = list(rest_of_series(series, from_date).values_list('pk', 'therapist_id', 'time', 'date'))
+    if not rows or not changes:
+        return 0
+    moving = therapist is not None or time is not None
+    taken = _move_conflicts(rows, therapist, time) if moving else []
+    if taken:
+        raise _slot_taken(taken)
+
+    therapist_ids = {row[1] for row in rows} | {series.therapist_id}
+    if therapist is not None:
+        therapist_ids.add(therapist.pk)
+    try:
+        with transaction.atomic():
+            changed = Appointment.objects.filter(pk__in=[row[0] for row in rows]).update(**changes)
+            for name, value in changes.items():
+                setattr(series, name, value)
+            series.save(update_fields=list(changes))
+            _sync(therapist_ids, sorted({row[3] for row in rows}))
+    except IntegrityError:
+        taken = _move_conflicts(rows, therapist, time) if moving else []
+        if taken:
+            raise _slot_taken(taken)
+        raise
+    return changed
+
+
+def cancel_series(series, from_date):
+    """Cancel the pending appointments of series from from_date on. Returns how many were canceled."""
+    rows = list(rest_of_series(series, from_date).values_list('pk', 'therapist_id', 'date'))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        canceled = Appointment.objects.filter(pk__in=[pk for pk, therapist_id, day in rows]).update(status='Canceled')
+        _sync({therapist_id for pk, therapist_id, day in rows}, sorted({day for pk, therapist_id, day in rows}))
+    return canceled
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import availability, counters, search, stats
+from .models import Appointment, ArchivedAppointment, Patient, Reminder, Therapist, WorkingHours
+
+
+# Keep the free-slot index and the daily rollup in step with bookings
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_appointment(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if instance.pk is not None and not raw:
+        instance._previous = (Appointment.objects.filter(pk=instance.pk)
+                              .values('therapist_id', 'date', 'service', 'status').first())
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = {'therapist_id': instance.therapist_id, 'date': instance.date, 'service': instance.service,
+               'status': instance.status}
+    previous = getattr(instance, '_previous', None)
+    if previous != current:
+        if previous:
+            stats.record(stats.appointment_key(**previous), -1)
+        stats.record(stats.appointment_key(**current), 1)
+
+    days = {(instance.therapist_id, instance.date)}
+    if previous:
+        days.add((previous['therapist_id'], previous['date']))
+    for therapist_id, day in days:
+        availability.refresh_day(therapist_id, day)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    stats.record(stats.appointment_key(instance.therapist_id, instance.date, instance.service, instance.status), -1)
+    availability.refresh_day(instance.therapist_id, instance.date)
+    # Reminder.appointment has no database constraint to cascade with
+    Reminder.objects.filter(appointment_id=instance.pk).delete()
+
+
+# Archived rows only leave with their therapist or patient; they are closed and in the past, so hold no slot
+@receiver(post_delete, sender=ArchivedAppointment)
+def archived_appointment_deleted(sender, instance, **kwargs):
+    stats.record(stats.appointment_key(instance.therapist_id, instance.date, instance.service, instance.status), -1)
+    Reminder.objects.filter(appointment_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Therapist)
+def therapist_saved(sender, instance, raw=False, **kwargs):
+    # Specialization and availability are part of every slot
+    if not raw:
+        availability.refresh_free_slots(instance)
+
+
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+def working_hours_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    therapist = Therapist.objects.filter(pk=instance.therapist_id).first()
+    if therapist is not None:
+        availability.refresh_free_slots(therapist)
+
+
+# Maintain the row counters read by index() and the dashboard
+
+def count_created(sender, instance, created, **kwargs):
+    kind = counters.counter_name(sender)
+    if created:
+        counters.increment(kind)
+    counters.bump_version(kind)
+
+
+def count_deleted(sender, instance, **kwargs):
+    kind = counters.counter_name(sender)
+    counters.increment(kind, -1)
+    counters.bump_version(kind)
+
+
+for counted_model in counters.COUNTED_MODELS.values():
+    post_save.connect(count_created, sender=counted_model, dispatch_uid=f'count_created_{counted_model.__name__}')
+    post_delete.connect(count_deleted, sender=counted_model, dispatch_uid=f'count_deleted_{counted_model.__name__}')
+for archived_model in counters.ARCHIVED_MODELS.values():
+    post_delete.connect(count_deleted, sender=archived_model, dispatch_uid=f'count_deleted_{archived_model.__name__}')
+
+
+@receiver(pre_save, sender=Patient)
+def remember_previous_gender(sender, instance, raw=False, **kwargs):
+    instance._previous_gender = None
+    if instance.pk is not None and not raw:
+        instance._previous_gender = Patient.objects.filter(pk=instance.pk).values_list('gender', flat=True).first()
+
+
+@receiver(post_save, sender=Patient)
+def count_gender_saved(sender, instance, created, raw=False, **kwargs):
+    if raw and not created:
+        return
+    previous = None if created else getattr(instance, '_previous_gender', None)
+    if previous == instance.gender:
+        return
+    if previous in counters.GENDER_COUNTERS:
+        counters.increment(counters.GENDER_COUNTERS[previous], -1)
+    if instance.gender in counters.GENDER_COUNTERS:
+        counters.increment(counters.GENDER_COUNTERS[instance.gender])
+
+
+@receiver(post_delete, sender=Patient)
+def count_gender_deleted(sender, instance, **kwargs):
+    if instance.gender in counters.GENDER_COUNTERS:
+        counters.increment(counters.GENDER_COUNTERS[instance.gender], -1)
+
+
+# Altering a table on SQLite rebuilds it and drops its search triggers
+
+@receiver(post_migrate)
+def restore_search_indexes(sender, using, **kwargs):
+    if sender.name == 'catalog':
+        search.install_search_indexes(connections[using])
+
+
+# Per-connection SQLite settings such as WAL and busy_timeout, see settings_production.py
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
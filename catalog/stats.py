@@ -0,0 +1,99 @@
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Appointment, AppointmentDailyStat, ArchivedAppointment
+
+STATUSES = [status for status, label in Appointment.APPOINTMENT_STATUS_CHOICES]
+
+
+def appointment_key(therapist_id, date, service, status):
+    if date is None:
+        # Undated appointments only show up in the overall total
+        return None
+    return {'therapist_id': therapist_id, 'date': date, 'service': service or '', 'status': status}
+
+
+def record(key, delta):
+    """Add delta to the rollup row for key."""
+    if key is None:
+        return
+    row = AppointmentDailyStat.objects.filter(count__gt=0, **key).values_list('pk', flat=True).first()
+    if row is None:
+        if delta > 0:
+            # Two racing inserts may both create a row; every reader sums, so that is harmless
+            AppointmentDailyStat.objects.create(count=delta, **key)
+        return
+    AppointmentDailyStat.objects.filter(pk=row).update(count=F('count') + delta)
+    if delta < 0:
+        # Drop emptied rows so the table only grows with real combinations
+        AppointmentDailyStat.objects.filter(pk=row, count__lte=0).delete()
+
+
+def rebuild_appointment_stats(therapist_ids=None, dates=None):
+    """Recompute the rollup, or only its rows for therapist_ids on dates after a bulk change."""
+    scope = Q()
+    if therapist_ids is not None:
+        ids = [pk for pk in therapist_ids if pk is not None]
+        therapists = Q(therapist_id__in=ids)
+        if len(ids) < len(therapist_ids):
+            # None stands for the unassigned appointments
+            therapists |= Q(therapist_id__isnull=True)
+        scope &= therapists
+    if dates is not None:
+        scope &= Q(date__in=dates)
+    table = connection.ops.quote_name(AppointmentDailyStat._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(AppointmentDailyStat._meta.get_field(name).column)
+                        for name in ('therapist', 'date', 'service', 'status', 'count'))
+    with transaction.atomic():
+        AppointmentDailyStat.objects.filter(scope).delete()
+        # Archived appointments stay in the rollup; a key found in both tables gets two rows, which readers sum
+        for model in (Appointment, ArchivedAppointment):
+            rows = (model.objects.filter(scope, date__isnull=False).order_by()
+                    .values('therapist_id', 'date', 'service', 'status').annotate(total=Count('pk')))
+            select, params = rows.query.sql_with_params()
+            # Aggregate inside the database instead of loading every group into Python
+            with connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {table} ({columns}) {select}', params)
+
+
+def _dashboard_rows(date_from, date_to, therapist=None):
+    rows = AppointmentDailyStat.objects.filter(date__gte=date_from, date__lte=date_to)
+    if therapist is not None:
+        rows = rows.filter(therapist=therapist)
+    per_status = {status: Sum('count', filter=Q(status=status), default=0) for status in STATUSES}
+    return rows.order_by('date').values('date', 'service').annotate(**per_status)
+
+
+def _summarise(rows):
+    by_status = dict.fromkeys(STATUSES, 0)
+    by_service = {}
+    by_day = OrderedDict()
+    for row in rows:
+        service = by_service.setdefault(row['service'], dict.fromkeys(STATUSES, 0))
+        day = by_day.setdefault(row['date'], dict.fromkeys(STATUSES, 0))
+        for status in STATUSES:
+            by_status[status] += row[status]
+            service[status] += row[status]
+            day[status] += row[status]
+
+    return {
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_service': sorted(by_service.items()),
+        'by_day': list(by_day.items()),
+    }
+
+
+def dashboard_stats(date_from, date_to, therapist=None):
+    """
+    Appointment totals by status, by service and by day for a date range,
+    from one conditional-aggregation query over the rollup table.
+    """
+    return _summarise(_dashboard_rows(date_from, date_to, therapist))
+
+
+async def adashboard_stats(date_from, date_to, therapist=None):
+    rows = _dashboard_rows(date_from, date_to, therapist)
+    return _summarise([row async for row in rows.aiterator()])
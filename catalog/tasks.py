@@ -0,0 +1,38 @@
+"""Maintenance jobs for the run_worker command; enqueue them with e.g. rebuild_free_slots.enqueue()."""
+from . import archive, assignment, availability, counters, reminders, stats
+from .jobs import purge_jobs, task
+
+
+@task(name='catalog.rebuild_counters')
+def rebuild_counters():
+    counters.rebuild_counters()
+
+
+@task(name='catalog.rebuild_appointment_stats')
+def rebuild_appointment_stats():
+    stats.rebuild_appointment_stats()
+
+
+@task(name='catalog.rebuild_free_slots')
+def rebuild_free_slots():
+    availability.rebuild_free_slots()
+
+
+@task(name='catalog.archive_appointments')
+def archive_appointments(older_than_days=None):
+    archive.archive_appointments(older_than_days)
+
+
+@task(name='catalog.purge_jobs')
+def purge_finished_jobs(older_than=None):
+    purge_jobs(older_than)
+
+
+@task(name='catalog.send_reminders')
+def send_reminders(window_hours=None, kind='upcoming'):
+    reminders.send_reminders(window_hours, kind)
+
+
+@task(name='catalog.assign_therapists')
+def assign_therapists(limit=None):
+    assignment.assign_therapists(limit)
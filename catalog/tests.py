@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+from contextlib import ExitStack
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F, QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import tasks
+from .archive import archive_appointments
+from .assignment import NO_FREE_THERAPIST, NO_SERVICE, assign_therapists, plan_assignments, therapist_loads
+from .booking import SlotTaken, book_appointment
+from .management.commands.bench_urls import build_routes
+from .cache import cache_stats, get_cache
+from .counters import get_counts
+from .jobs import FINISH_ATTEMPTS, claim, enqueue, job_metrics, run, task, work
+from .middleware import get_query_budget
+from .models import (Appointment, AppointmentSeries, ArchivedAppointment, Counter, FreeSlot, ImportProgress, Job,
+                     Patient, Reminder, Therapist, WorkingHours)
+from .pagination import _seek_range, encode_cursor, keyset_paginate
+from .reminders import BaseSender, FileSender, due_reminders, reminder_window, send_reminders
+from .replicas import refresh_replica
+from .routers import unpin_primary
+from .search import install_search_indexes, search
+from .seeding import seed_catalog
+from .series import book_series, cancel_series, change_series
+from .stats import dashboard_stats
+from .views import AppointmentDetailView, AppointmentListView, TherapistListView
+
+
+class AppointmentListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        for day in range(1, 8):
+            for hour in (9, 11):
+                Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=date(2024, 3, day),
+                                           time=time(hour), service='TRAUMA')
+        # Appointments with no date yet sort first
+        Appointment.objects.create(patient=cls.patient)
+        Appointment.objects.create(patient=cls.patient, status='Canceled')
+
+    def test_keyset_pages_cover_every_row_once(self):
+        fields = ('date', 'time', 'appointment_id')
+        seen = []
+        page = keyset_paginate(Appointment.objects.all(), fields, per_page=3)
+        seen.extend(page.object_list)
+        while page.has_next:
+            page = keyset_paginate(Appointment.objects.all(), fields, after=page.next_cursor, per_page=3)
+            seen.extend(page.object_list)
+        self.assertEqual([a.pk for a in seen], list(Appointment.objects.values_list('pk', flat=True)))
+
+        # Walking back from the last page returns the previous page
+        previous = keyset_paginate(Appointment.objects.all(), fields, before=page.previous_cursor, per_page=3)
+        self.assertEqual(previous.object_list, seen[-len(page.object_list) - 3:-len(page.object_list)])
+
+        # Including the undated appointments at the very start
+        second = keyset_paginate(Appointment.objects.all(), fields, after=encode_cursor(seen[2], fields), per_page=3)
+        first = keyset_paginate(Appointment.objects.all(), fields, before=second.previous_cursor, per_page=3)
+        self.assertEqual(first.object_list, seen[:3])
+        self.assertFalse(first.has_previous)
+
+    def test_list_does_not_query_per_row(self):
+        # The page, the row fragment version stamp and the therapist choices in the filter form
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('catalog:appointment_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['appointments']), 16)
+
+    def test_list_filters_and_keeps_them_across_pages(self):
+        url = reverse('catalog:appointment_list')
+        response = self.client.get(url, {'status': 'Pending', 'date_from': '2024-03-02', 'date_to': '2024-03-03'})
+        self.assertEqual(len(response.context['appointments']), 4)
+
+        with mock.patch.object(AppointmentListView, 'page_size', 2):
+            response = self.client.get(url, {'service': 'TRAUMA'})
+        self.assertIn('service=TRAUMA', response.context['next_query'])
+        self.assertIn('after=', response.context['next_query'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('catalog:appointment_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class AppointmentQueryPlanTests(TestCase):
+    keyset_fields = AppointmentListView.keyset_fields
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        for scan in re.findall(r'\bSCAN catalog_appointment\b.*', plan):
+            # Walking an index in order is fine when LIMIT stops it early,
+            # any other scan reads the whole table
+            if queryset.query.high_mark is None or ' USING ' not in scan:
+                self.fail(f'Full table scan:\n{queryset.query}\n{plan}')
+
+    def list_page(self, queryset, values=None, forward=True):
+        if forward:
+            ordering = [F(name).asc(nulls_first=True) for name in self.keyset_fields]
+        else:
+            ordering = [F(name).desc(nulls_last=True) for name in self.keyset_fields]
+        if values:
+            queryset = queryset.filter(_seek_range(self.keyset_fields, values, forward))
+        return queryset.order_by(*ordering)[:51]
+
+    def test_appointment_list_pages(self):
+        queryset = Appointment.objects.select_related('therapist', 'patient')
+        cursor = [date(2024, 3, 1), time(9), 500]
+        self.assertUsesIndex(self.list_page(queryset))
+        self.assertUsesIndex(self.list_page(queryset, cursor))
+        self.assertUsesIndex(self.list_page(queryset, cursor, forward=False))
+        self.assertUsesIndex(self.list_page(queryset.filter(date__gte=date(2024, 1, 1), date__lte=date(2024, 1, 31))))
+        self.assertUsesIndex(self.list_page(queryset.filter(status='Pending'), cursor))
+
+    def test_therapist_schedule_and_conflict_lookup(self):
+        self.assertUsesIndex(Appointment.objects.filter(therapist_id=1, date=date(2024, 3, 1)))
+        self.assertUsesIndex(Appointment.objects.filter(therapist_id=1, date=date(2024, 3, 1), time=time(9)))
+
+    def test_patient_history(self):
+        self.assertUsesIndex(Appointment.objects.filter(patient_id=1).order_by('date'))
+
+    def test_status_filters(self):
+        self.assertUsesIndex(Appointment.objects.filter(status='Pending', date__gte=date(2024, 1, 1)))
+        self.assertUsesIndex(Appointment.objects.filter(status='Completed'))
+
+    def test_reminder_window(self):
+        start = timezone.make_aware(datetime(2024, 3, 1, 10, 30))
+        self.assertUsesIndex(due_reminders(start, start + timedelta(hours=24))[:1000])
+        self.assertUsesIndex(due_reminders(start, start + timedelta(hours=3))[:1000])
+
+    def test_detects_full_scan(self):
+        with self.assertRaises(AssertionError):
+            self.assertUsesIndex(Appointment.objects.filter(service='TRAUMA'))
+
+
+class PatientAgeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, born in (('Leap', date(2000, 2, 29)), ('Today', date(1990, 6, 2)), ('Tomorrow', date(1990, 6, 3)),
+                           ('Child', date(2015, 1, 1)), ('Senior', date(1940, 12, 31)), ('Unknown', None)):
+            Patient.objects.create(name=name, date_of_birth=born, gender='F', contact='0711111111')
+
+    def test_age_in_sql_matches_python(self):
+        today = date(2025, 6, 2)
+        with mock.patch('catalog.models.date') as mock_date:
+            mock_date.today.return_value = today
+            expected = {patient.name: patient.calculate_age() for patient in Patient.objects.all()}
+        ages = {patient.name: patient.age for patient in Patient.objects.with_age(today)}
+        self.assertEqual(ages, expected)
+        self.assertEqual(ages, {'Leap': 25, 'Today': 35, 'Tomorrow': 34, 'Child': 10, 'Senior': 84, 'Unknown': None})
+        self.assertEqual(Patient.objects.with_age(date(2025, 2, 28)).get(name='Leap').age, 24)
+
+    def test_age_filters_and_bands(self):
+        today = date(2025, 6, 2)
+        self.assertEqual(sorted(Patient.objects.age_between(30, 64, today).values_list('name', flat=True)),
+                         ['Today', 'Tomorrow'])
+        self.assertEqual(list(Patient.objects.age_between(35, 35, today).values_list('name', flat=True)), ['Today'])
+        self.assertNotIn('SCAN catalog_patient', Patient.objects.age_between(18, 29, today).explain())
+        with self.assertNumQueries(1):
+            bands = Patient.objects.age_bands(today=today)
+        self.assertEqual(bands, [{'band': '0-17', 'count': 1}, {'band': '18-29', 'count': 1},
+                                 {'band': '30-44', 'count': 2}, {'band': '45-64', 'count': 0},
+                                 {'band': '65+', 'count': 1}, {'band': 'Unknown', 'count': 1}])
+
+    def test_detail_page_age_follows_the_date(self):
+        patient = Patient.objects.get(name='Today')
+        for today, age in ((date(2025, 6, 1), 34), (date(2025, 6, 2), 35)):
+            get_cache().clear()
+            with mock.patch('catalog.models.timezone.localdate', return_value=today):
+                response = self.client.get(reverse('catalog:patient_detail', args=[patient.pk]))
+            self.assertContains(response, f'Age: {age}')
+
+    def test_pages_without_date_of_birth(self):
+        unknown = Patient.objects.get(name='Unknown')
+        self.assertIsNone(unknown.age)
+        for name in ('patient_detail', 'async_patient_detail'):
+            self.assertContains(self.client.get(reverse(f'catalog:{name}', args=[unknown.pk])), 'Age: Unknown')
+        self.assertContains(self.client.get(reverse('catalog:therapist_dashboard')), 'Unknown (1)')
+        response = self.client.get(reverse('catalog:patient_list'), {'min_age': 65})
+        self.assertEqual([patient.name for patient in response.context['patients']], ['Senior'])
+
+
+class BookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        cls.booked = Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=date(2024, 3, 1),
+                                                time=time(9))
+
+    def test_double_booking_is_rejected(self):
+        with self.assertRaises(SlotTaken):
+            book_appointment(Appointment(therapist=self.therapist, date=date(2024, 3, 1), time=time(9)))
+
+    def test_canceled_slot_can_be_rebooked(self):
+        self.booked.status = 'Canceled'
+        book_appointment(self.booked)
+        book_appointment(Appointment(therapist=self.therapist, date=date(2024, 3, 1), time=time(9)))
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_update_keeps_own_slot(self):
+        self.booked.service = 'TRAUMA'
+        book_appointment(self.booked)
+
+    def test_create_view_reports_taken_slot(self):
+        response = self.client.post(reverse('catalog:create_appointment'), {
+            'therapist': self.therapist.pk, 'patient': self.patient.pk, 'date': '2024-03-01', 'time': '09:00',
+            'service': 'TRAUMA',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already booked')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class SeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.other = Therapist.objects.create(name='Dr. Baraka', contact='0700000001', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        today = timezone.localdate()
+        # Mondays, within the free-slot horizon
+        cls.start = today + timedelta(days=7 - today.weekday())
+        WorkingHours.objects.create(therapist=cls.therapist, weekday=0, start_time=time(9), end_time=time(12))
+
+    def series(self, **fields):
+        return AppointmentSeries(**{'therapist': self.therapist, 'patient': self.patient, 'service': 'TRAUMA',
+                                    'start_date': self.start, 'time': time(10), 'count': 4, **fields})
+
+    def weeks(self, *numbers):
+        return [self.start + timedelta(weeks=n) for n in numbers]
+
+    def test_books_whole_series_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            appointments = book_series(self.series())
+        inserts = [q['sql'] for q in queries if q['sql'].startswith('INSERT INTO "catalog_appointment"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(appointments), 4)
+        self.assertEqual(list(Appointment.objects.values_list('date', flat=True)), self.weeks(0, 1, 2, 3))
+
+        # The bookkeeping the signals would have done
+        self.assertEqual(get_counts()['appointments'], 4)
+        self.assertEqual(dashboard_stats(self.start, self.start + timedelta(weeks=3))['by_status']['Pending'], 4)
+        self.assertEqual(sorted(FreeSlot.objects.filter(date=self.start).values_list('time', flat=True)),
+                         [time(9), time(11)])
+
+    def test_occurrences(self):
+        self.assertEqual(self.series(count=None, until=self.start + timedelta(weeks=5),
+                                     frequency=AppointmentSeries.BIWEEKLY).occurrences(), self.weeks(0, 2, 4))
+        self.assertEqual(self.series(count=10, until=self.start + timedelta(days=8)).occurrences(), self.weeks(0, 1))
+        with self.assertRaises(ValidationError):
+            self.series(count=None).full_clean()
+        with self.assertRaises(ValidationError):
+            self.series(count=None, until=self.start + timedelta(weeks=200)).full_clean()
+
+    def test_conflicts_are_checked_for_the_whole_series(self):
+        for day in self.weeks(1, 3):
+            Appointment.objects.create(therapist=self.therapist, date=day, time=time(10))
+        with self.assertNumQueries(1), self.assertRaises(SlotTaken) as raised:
+            book_series(self.series())
+        self.assertIn(', '.join(day.isoformat() for day in self.weeks(1, 3)), raised.exception.message)
+        self.assertFalse(AppointmentSeries.objects.exists())
+
+    def test_change_and_cancel_the_rest(self):
+        series = self.series()
+        book_series(series)
+        Appointment.objects.create(therapist=self.other, date=self.weeks(3)[0], time=time(11))
+        with self.assertRaises(SlotTaken):
+            change_series(series, self.weeks(1)[0], therapist=self.other, time=time(11))
+
+        self.assertEqual(change_series(series, self.weeks(1)[0], time=time(11)), 3)
+        self.assertEqual(list(series.appointments.values_list('time', flat=True)), [time(10)] + [time(11)] * 3)
+        series.refresh_from_db()
+        self.assertEqual(series.time, time(11))
+
+        self.assertEqual(cancel_series(series, self.weeks(2)[0]), 2)
+        self.assertEqual(list(series.appointments.values_list('status', flat=True)),
+                         ['Pending', 'Pending', 'Canceled', 'Canceled'])
+        by_status = dashboard_stats(self.start, self.start + timedelta(weeks=3))['by_status']
+        self.assertEqual((by_status['Pending'], by_status['Canceled']), (3, 2))
+
+    def test_views(self):
+        response = self.client.post(reverse('catalog:create_series'), {
+            'therapist': self.therapist.pk, 'patient': self.patient.pk, 'service': 'TRAUMA',
+            'start_date': self.start.isoformat(), 'time': '10:00', 'frequency': 1, 'count': 3,
+        })
+        series = AppointmentSeries.objects.get()
+        self.assertRedirects(response, reverse('catalog:update_series', args=[series.pk]))
+        response = self.client.post(reverse('catalog:update_series', args=[series.pk]),
+                                    {'from_date': self.weeks(1)[0].isoformat(), 'action': 'cancel'}, follow=True)
+        self.assertContains(response, 'Canceled 2 appointments.')
+        self.assertContains(response, 'Canceled', count=3)
+
+
+class BookingStressTests(TransactionTestCase):
+    threads = 16
+    attempts = 2000
+    slots = 25
+
+    def test_parallel_bookings_never_double_book(self):
+        therapists = [Therapist.objects.create(name=f'Therapist {i}', contact='0700000000') for i in range(5)]
+        slots = [(therapists[i % 5].pk, date(2024, 3, 1 + i // 5), time(9)) for i in range(self.slots)]
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def worker(offset):
+            barrier.wait()
+            booked = taken = 0
+            try:
+                for i in range(offset, self.attempts, self.threads):
+                    therapist_id, day, hour = slots[i % self.slots]
+                    try:
+                        book_appointment(Appointment(therapist_id=therapist_id, date=day, time=hour))
+                        booked += 1
+                    except SlotTaken:
+                        taken += 1
+            finally:
+                connections.close_all()
+            results.append((booked, taken))
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(sum(booked for booked, taken in results), self.slots)
+        self.assertEqual(sum(booked + taken for booked, taken in results), self.attempts)
+        self.assertEqual(Appointment.objects.count(), self.slots)
+
+
+class FreeSlotIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        cls.monday = cls.today + timedelta(days=7 - cls.today.weekday())
+        cls.trauma = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.family = Therapist.objects.create(name='Dr. Baraka', contact='0700000001', specialization='FAMILY')
+        for therapist in (cls.trauma, cls.family):
+            WorkingHours.objects.create(therapist=therapist, weekday=0, start_time=time(9), end_time=time(12))
+
+    def next_slots(self, **params):
+        response = self.client.get(reverse('catalog:next_available'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(slot['therapist_id'], slot['date'], slot['time']) for slot in response.json()['slots']]
+
+    def test_working_hours_create_slots(self):
+        self.assertEqual(FreeSlot.objects.filter(therapist=self.trauma, date=self.monday).count(), 3)
+        self.assertEqual(self.next_slots(specialization='TRAUMA', limit=2), [
+            (self.trauma.pk, self.monday.isoformat(), '09:00:00'),
+            (self.trauma.pk, self.monday.isoformat(), '10:00:00'),
+        ])
+
+    def test_bookings_take_and_release_slots(self):
+        appointment = Appointment.objects.create(therapist=self.trauma, date=self.monday, time=time(9))
+        params = {'specialization': 'TRAUMA', 'date': self.monday.isoformat(), 'limit': 1}
+        self.assertEqual(self.next_slots(**params), [(self.trauma.pk, self.monday.isoformat(), '10:00:00')])
+
+        appointment.time = time(10)
+        appointment.save()
+        self.assertEqual(self.next_slots(**params), [(self.trauma.pk, self.monday.isoformat(), '09:00:00')])
+
+        appointment.status = 'Canceled'
+        appointment.save()
+        self.assertEqual(FreeSlot.objects.filter(therapist=self.trauma, date=self.monday).count(), 3)
+
+    def test_specialization_change_moves_slots(self):
+        self.family.specialization = 'TRAUMA'
+        self.family.save()
+        self.assertEqual(FreeSlot.objects.filter(specialization='TRAUMA', date=self.monday).count(), 6)
+
+    def test_invalid_query(self):
+        response = self.client.get(reverse('catalog:next_available'), {'specialization': 'NOPE'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CounterTests(TestCase):
+    def test_counters_follow_saves_and_deletes(self):
+        therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000')
+        patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        Appointment.objects.create(therapist=therapist, patient=patient)
+        Appointment.objects.create(patient=patient)
+        self.assertEqual(get_counts(), {'therapists': 1, 'patients': 1, 'appointments': 2,
+                                        'patients_M': 0, 'patients_F': 1, 'patients_O': 0})
+
+        # Cascades send post_delete for every appointment too
+        patient.delete()
+        self.assertEqual(get_counts(), {'therapists': 1, 'patients': 0, 'appointments': 0,
+                                        'patients_M': 0, 'patients_F': 0, 'patients_O': 0})
+
+    def test_rebuild_fixes_drift(self):
+        Therapist.objects.create(name='Dr. Amani', contact='0700000000')
+        Counter.objects.filter(name='therapists').update(value=42)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(get_counts()['therapists'], 1)
+
+    def test_index_reads_counters_in_one_query(self):
+        Therapist.objects.create(name='Dr. Amani', contact='0700000000')
+        get_counts()
+        response = self.client.get(reverse('catalog:index'))
+        self.assertEqual(response.context['num_therapists'], 1)
+        with self.assertNumQueries(1):
+            get_counts()
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        for day in (1, 1, 2):
+            Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=date(2024, 3, day),
+                                       service='TRAUMA')
+        Appointment.objects.create(patient=cls.patient, date=date(2024, 3, 2), service='FAMILY', status='Completed')
+
+    def range_stats(self):
+        return dashboard_stats(date(2024, 3, 1), date(2024, 3, 31))
+
+    def test_rollup_follows_appointment_changes(self):
+        stats = self.range_stats()
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual(stats['by_status'], {'Pending': 3, 'Completed': 1, 'Canceled': 0})
+        self.assertEqual(stats['by_day'], [
+            (date(2024, 3, 1), {'Pending': 2, 'Completed': 0, 'Canceled': 0}),
+            (date(2024, 3, 2), {'Pending': 1, 'Completed': 1, 'Canceled': 0}),
+        ])
+
+        appointment = Appointment.objects.filter(date=date(2024, 3, 1)).first()
+        appointment.status = 'Canceled'
+        appointment.save()
+        Appointment.objects.filter(service='FAMILY').delete()
+        stats = self.range_stats()
+        self.assertEqual(stats['by_status'], {'Pending': 2, 'Completed': 0, 'Canceled': 1})
+        self.assertEqual(stats['by_service'], [('TRAUMA', {'Pending': 2, 'Completed': 0, 'Canceled': 1})])
+
+    def test_rebuild_matches_incremental(self):
+        before = self.range_stats()
+        call_command('rebuild_appointment_stats', stdout=StringIO())
+        self.assertEqual(self.range_stats(), before)
+
+    def test_dashboard_renders_from_rollup(self):
+        response = self.client.get(reverse('catalog:therapist_dashboard'),
+                                   {'date_from': '2024-03-01', 'date_to': '2024-03-31'})
+        self.assertEqual(response.context['appointment_stats']['total'], 4)
+        self.assertEqual(response.context['gender_distribution'], [{'gender': 'F', 'count': 1, 'percent': 100.0}])
+
+
+class ImportCommandTests(TestCase):
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_import_validates_and_resolves_foreign_keys(self):
+        therapists = self.write('therapists.csv', 'therapist_id,name,contact,specialization,availability\n'
+                                                  '7,Dr. Amani,0700000000,TRAUMA,A\n'
+                                                  '8,Dr. Baraka,0700000001,ASTROLOGY,A\n')
+        patients = self.write('patients.jsonl', '{"patient_id": 3, "name": "Wanjiru", "gender": "F", "contact": "1"}\n'
+                                                '{"name": "Otieno", "gender": "M", "contact": "2", '
+                                                '"date_of_birth": "1990-02-30"}\n')
+        appointments = self.write('appointments.csv', 'therapist,patient,date,time,service,status\n'
+                                                      '7,3,2024-03-01,09:00,TRAUMA,Completed\n'
+                                                      '7,3,2024-03-01,09:00,TRAUMA,Pending\n'
+                                                      '99,3,2024-03-02,09:00,TRAUMA,Pending\n')
+        err = StringIO()
+        call_command('import_catalog', 'therapists', therapists, stdout=StringIO(), stderr=err)
+        call_command('import_catalog', 'patients', patients, stdout=StringIO(), stderr=err)
+        call_command('import_catalog', 'appointments', appointments, batch_size=2, stdout=StringIO(), stderr=err)
+
+        self.assertEqual(list(Therapist.objects.values_list('pk', flat=True)), [7])
+        self.assertEqual(list(Patient.objects.values_list('pk', flat=True)), [3])
+        appointment = Appointment.objects.get()
+        self.assertEqual((appointment.therapist_id, appointment.patient_id, appointment.status), (7, 3, 'Completed'))
+        self.assertIn('specialization', err.getvalue())
+        self.assertIn('date_of_birth', err.getvalue())
+        self.assertIn('Row rejected', err.getvalue())
+        self.assertIn('therapist', err.getvalue())
+
+        # Counters and the dashboard rollup see the imported rows
+        self.assertEqual(get_counts()['appointments'], 1)
+        self.assertEqual(get_counts()['patients_F'], 1)
+        self.assertEqual(dashboard_stats(date(2024, 3, 1), date(2024, 3, 1))['total'], 1)
+
+    def test_import_resumes_after_last_committed_batch(self):
+        rows = ''.join(f'{{"name": "Patient {i}", "gender": "O", "contact": "{i}"}}\n' for i in range(5))
+        path = self.write('patients.jsonl', rows)
+        source = f'patients:{os.path.abspath(path)}'
+        ImportProgress.objects.create(source=source, rows_done=3)
+
+        call_command('import_catalog', 'patients', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Patient.objects.order_by('contact').values_list('name', flat=True)),
+                         ['Patient 3', 'Patient 4'])
+        self.assertEqual(ImportProgress.objects.get(source=source).rows_done, 5)
+
+    def test_unreadable_rows_are_skipped(self):
+        jsonl = self.write('patients.jsonl', '{"name": "Wanjiru", "gender": "F", "contact": "1"}\n'
+                                             '{"name": "Otieno", "gender": \n'
+                                             '["Akinyi"]\n'
+                                             '{"name": "Kamau", "gender": "M", "contact": "2"}\n')
+        csv_path = os.path.join(self.tmpdir.name, 'patients.csv')
+        with open(csv_path, 'wb') as f:
+            f.write(b'name,gender,contact\nNjeri,F,3\nMwangi\xff,M,4\nChebet,F,5\n')
+        err = StringIO()
+        call_command('import_catalog', 'patients', jsonl, stdout=StringIO(), stderr=err)
+        call_command('import_catalog', 'patients', csv_path, stdout=StringIO(), stderr=err)
+        self.assertEqual(sorted(Patient.objects.values_list('name', flat=True)),
+                         ['Chebet', 'Kamau', 'Njeri', 'Wanjiru'])
+        self.assertIn('Row 2: ', err.getvalue())
+        self.assertIn('Not valid JSON', err.getvalue())
+        self.assertIn('Not a JSON object', err.getvalue())
+        self.assertIn('Row 3: ', err.getvalue())
+        self.assertIn('Not valid UTF-8', err.getvalue())
+        self.assertEqual(ImportProgress.objects.get(source=f'patients:{os.path.abspath(jsonl)}').rows_done, 4)
+
+    def test_batch_size_must_be_positive(self):
+        path = self.write('patients.jsonl', '{"name": "Wanjiru", "gender": "F", "contact": "1"}\n')
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', 'patients', path, batch_size=0, stdout=StringIO())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=date(2024, 3, 1), time=time(9),
+                                   service='TRAUMA')
+        Appointment.objects.create(patient=cls.patient, date=date(2024, 4, 1), status='Canceled')
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('catalog:export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_applies_list_filters(self):
+        self.assertEqual(self.export('appointments', status='Pending').splitlines(), [
+            'appointment_id,therapist,therapist_name,patient,patient_name,date,time,service,status',
+            f'{Appointment.objects.get(status="Pending").pk},{self.therapist.pk},Dr. Amani,{self.patient.pk},'
+            f'Wanjiru,2024-03-01,09:00:00,TRAUMA,Pending',
+        ])
+
+    def test_jsonl_export(self):
+        rows = [json.loads(line) for line in self.export('patients', format='jsonl').splitlines()]
+        self.assertEqual(rows, [{'patient_id': self.patient.pk, 'name': 'Wanjiru', 'date_of_birth': None,
+                                 'gender': 'F', 'contact': '0711111111'}])
+
+    def test_export_runs_one_query(self):
+        response = self.client.get(reverse('catalog:export', args=['appointments']))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+    def test_unknown_export(self):
+        self.assertEqual(self.client.get(reverse('catalog:export', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('catalog:export', args=['patients']), {'format': 'xml'}).status_code,
+                         400)
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        cls.today = date(2025, 6, 2)
+        for day, status in ((date(2024, 1, 8), 'Completed'), (date(2024, 1, 9), 'Canceled'),
+                            (date(2024, 1, 10), 'Pending'), (date(2025, 5, 5), 'Completed')):
+            Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=day, time=time(9),
+                                       service='TRAUMA', status=status)
+
+    def test_moves_old_closed_appointments(self):
+        old = list(Appointment.objects.filter(date__lt=date(2024, 1, 10)).values_list('pk', flat=True))
+        self.assertEqual(archive_appointments(older_than_days=365, today=self.today, batch_size=1), 2)
+        self.assertEqual(list(ArchivedAppointment.objects.values_list('pk', flat=True)), old)
+        self.assertEqual(sorted(Appointment.objects.values_list('status', flat=True)), ['Completed', 'Pending'])
+        self.assertEqual(archive_appointments(older_than_days=365, today=self.today), 0)
+
+        # Still counted everywhere
+        self.assertEqual(get_counts()['appointments'], 4)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(get_counts()['appointments'], 4)
+        call_command('rebuild_appointment_stats', stdout=StringIO())
+        self.assertEqual(dashboard_stats(date(2024, 1, 1), date(2024, 1, 31))['total'], 3)
+
+    def test_detail_and_export_find_archived_appointments(self):
+        archive_appointments(older_than_days=365, today=self.today)
+        archived = ArchivedAppointment.objects.first()
+        for name in ('appointment_detail', 'async_appointment_detail'):
+            response = self.client.get(reverse(f'catalog:{name}', args=[archived.pk]))
+            self.assertContains(response, 'Archived on')
+        response = self.client.get(reverse('catalog:api_detail', args=['appointments', archived.pk]))
+        self.assertEqual(response.json()['status'], archived.status)
+
+        response = self.client.get(reverse('catalog:export', args=['appointments']), {'date_to': '2024-12-31'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[-1] for line in lines[1:]], ['Completed', 'Canceled', 'Pending'])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.wanjiru = Patient.objects.create(name='Wanjiru Kamau', gender='F', contact='0711111111')
+        cls.wanja = Patient.objects.create(name='Wanja Otieno', gender='F', contact='0722222222')
+        cls.otieno = Patient.objects.create(name='Brian Otieno', gender='M', contact='0733333333')
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+
+    def test_prefix_search(self):
+        self.assertEqual(search('patients', 'wan'), [self.wanjiru, self.wanja])
+        self.assertEqual(search('patients', 'wan oti'), [self.wanja])
+        self.assertEqual(search('patients', '07222'), [self.wanja])
+        self.assertEqual(search('therapists', 'trau'), [self.therapist])
+        self.assertEqual(search('patients', '"*'), [])
+
+    def test_index_follows_updates_deletes_and_bulk_inserts(self):
+        self.wanja.name = 'Akinyi Otieno'
+        self.wanja.save()
+        self.otieno.delete()
+        Patient.objects.bulk_create([Patient(name='Wambui Njeri', gender='F', contact='0744444444')])
+        self.assertEqual([p.name for p in search('patients', 'wa')], ['Wanjiru Kamau', 'Wambui Njeri'])
+        self.assertEqual([p.name for p in search('patients', 'otieno')], ['Akinyi Otieno'])
+
+    def test_missing_triggers_are_restored(self):
+        # What a table rebuild during migrate leaves behind
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER catalog_patient_fts_ai')
+        Patient.objects.create(name='Nyokabi', gender='F', contact='0755555555')
+        self.assertEqual(search('patients', 'nyokabi'), [])
+
+        install_search_indexes()
+        self.assertEqual([p.name for p in search('patients', 'nyokabi')], ['Nyokabi'])
+
+    def test_name_matches_rank_first(self):
+        contact_match = Patient.objects.create(name='Zawadi', gender='F', contact='brian')
+        self.assertEqual(search('patients', 'brian'), [self.otieno, contact_match])
+
+    def test_search_endpoint_and_list_views(self):
+        response = self.client.get(reverse('catalog:search'), {'q': 'otieno', 'kind': 'patients'})
+        self.assertEqual([r['id'] for r in response.json()['patients']], [self.wanja.pk, self.otieno.pk])
+        response = self.client.get(reverse('catalog:patient_list'), {'q': 'kamau'})
+        self.assertEqual(list(response.context['patients']), [self.wanjiru])
+        self.assertEqual(self.client.get(reverse('catalog:search')).status_code, 400)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        cls.appointment = Appointment.objects.create(therapist=cls.therapist, patient=cls.patient,
+                                                     date=date(2024, 3, 1), time=time(9), service='TRAUMA')
+
+    def test_list_and_detail(self):
+        response = self.client.get(reverse('catalog:api_list', args=['appointments']))
+        self.assertEqual(response.json(), {'results': [{
+            'id': self.appointment.pk, 'therapist': self.therapist.pk, 'therapist_name': 'Dr. Amani',
+            'patient': self.patient.pk, 'patient_name': 'Wanjiru', 'date': '2024-03-01', 'time': '09:00:00',
+            'service': 'TRAUMA', 'status': 'Pending',
+        }], 'next': None, 'previous': None})
+        response = self.client.get(reverse('catalog:api_detail', args=['patients', self.patient.pk]))
+        self.assertEqual(response.json()['name'], 'Wanjiru')
+        self.assertEqual(self.client.get(reverse('catalog:api_detail', args=['patients', 999])).status_code, 404)
+
+    def test_matching_etag_is_304_without_querying_the_table(self):
+        url = reverse('catalog:api_list', args=['appointments'])
+        etag = self.client.get(url)['ETag']
+        self.assertTrue(etag.startswith('"'))
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # Renaming the therapist changes the appointment list
+        self.therapist.name = 'Dr. Amani Otieno'
+        self.therapist.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cursor_pagination(self):
+        Patient.objects.bulk_create(Patient(name=f'Patient {i}', gender='O', contact=str(i)) for i in range(60))
+        first = self.client.get(reverse('catalog:api_list', args=['patients'])).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 61)
+        self.assertIsNone(second['next'])
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_second_request_is_served_from_cache(self):
+        url = reverse('catalog:therapist_list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertContains(response, 'Dr. Amani')
+        stats = cache_stats(['catalog:therapist_list'])['catalog:therapist_list']
+        self.assertEqual((stats['hits'], stats['misses'], stats['ratio']), (1, 1, 0.5))
+
+    def test_save_invalidates(self):
+        url = reverse('catalog:therapist_detail', args=[self.therapist.pk])
+        self.client.get(url)
+        self.therapist.name = 'Dr. Amani Otieno'
+        self.therapist.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Dr. Amani Otieno')
+
+    def test_users_and_permissions_get_separate_entries(self):
+        url = reverse('catalog:therapist_list')
+        self.client.get(url)
+        user = User.objects.create_user('reception', password='secret-pass-123')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        user.user_permissions.add(Permission.objects.get(codename='can_view_therapist_list'))
+        self.client.force_login(User.objects.get(pk=user.pk))
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+
+class RowFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111')
+        Appointment.objects.create(therapist=cls.therapist, patient=cls.patient, date=date(2024, 3, 1), time=time(9))
+
+    def setUp(self):
+        caches['template_fragments'].clear()
+
+    def render(self, url):
+        # Past the response cache, so only the row fragments can be reused
+        get_cache().clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_rows_come_from_the_fragment_cache_until_a_rename(self):
+        # How each list shows the renamed object in a row, not elsewhere on the page such as the filter choices
+        for url, obj, row in ((reverse('catalog:appointment_list'), self.therapist, '{} - '),
+                              (reverse('catalog:therapist_list'), self.therapist, '>{}</a>'),
+                              (reverse('catalog:patient_list'), self.patient, '>{}</a>')):
+            with self.subTest(url):
+                caches['template_fragments'].clear()
+                old_name = obj.name
+                stamp = self.render(url).context['row_version']
+                try:
+                    # Changed behind the signals' back: the cached row is still shown
+                    type(obj).objects.filter(pk=obj.pk).update(name='Changed quietly')
+                    response = self.render(url)
+                    self.assertEqual(response.context['row_version'], stamp)
+                    self.assertContains(response, row.format(old_name))
+                    self.assertNotContains(response, row.format('Changed quietly'))
+
+                    obj.name = 'Renamed'
+                    obj.save()
+                    response = self.render(url)
+                    self.assertNotEqual(response.context['row_version'], stamp)
+                    self.assertContains(response, row.format('Renamed'))
+                finally:
+                    obj.name = old_name
+                    obj.save()
+
+
+class IndexVisitTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    @override_settings(VISIT_FLUSH_EVERY=3)
+    def test_visits_are_counted_without_session_writes(self):
+        for expected in range(1, 6):
+            response = self.client.get(reverse('catalog:index'))
+            self.assertEqual(response.context['num_visits'], expected)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+        # One batch of three has reached the database, two visits are still pending
+        self.assertEqual(Counter.objects.get(name='visits').value, 3)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.patient = Patient.objects.create(name='Wanjiru', gender='F', contact='0711111111',
+                                             date_of_birth=date(1990, 5, 1))
+        cls.appointments = [Appointment.objects.create(therapist=cls.therapist, patient=cls.patient,
+                                                       date=date(2024, 3, day), time=time(9), service='TRAUMA')
+                            for day in range(1, 4)]
+
+    async def test_async_views_render_the_same_pages(self):
+        pages = [
+            ('therapist_list', []), ('therapist_detail', [self.therapist.pk]),
+            ('patient_list', []), ('patient_detail', [self.patient.pk]),
+            ('appointment_list', []), ('appointment_detail', [self.appointments[0].pk]),
+            ('therapist_dashboard', []),
+        ]
+        for name, args in pages:
+            with self.subTest(name):
+                query = '?date_from=2024-03-01&date_to=2024-03-31' if name == 'therapist_dashboard' else ''
+                sync = await self.async_client.get(reverse(f'catalog:{name}', args=args) + query)
+                response = await self.async_client.get(reverse(f'catalog:async_{name}', args=args) + query)
+                self.assertEqual(response.status_code, 200)
+                # Forms submit to the page they are on, so only the paths differ
+                self.assertEqual(response.content.decode().replace('/async/', '/'), sync.content.decode())
+
+    async def test_async_list_filters_and_pages(self):
+        url = reverse('catalog:async_appointment_list')
+        response = await self.async_client.get(url, {'therapist': self.therapist.pk, 'date_from': '2024-03-02'})
+        self.assertEqual([a.date for a in response.context['appointments']], [date(2024, 3, 2), date(2024, 3, 3)])
+        self.assertContains(response, f'<option value="{self.therapist.pk}" selected>')
+
+    async def test_async_detail_404(self):
+        response = await self.async_client.get(reverse('catalog:async_patient_detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SeedingTests(TestCase):
+    def test_seed_is_deterministic_and_keeps_derived_data(self):
+        summary = seed_catalog(therapists=4, patients=30, appointments=200, seed=7, today=date(2024, 6, 1))
+        rows = list(Appointment.objects.order_by('pk').values_list('therapist_id', 'patient_id', 'date', 'time',
+                                                                    'service', 'status'))
+        self.assertEqual(len(rows), 200)
+        self.assertTrue(all(day.weekday() < 5 for therapist, patient, day, *rest in rows))
+        self.assertEqual(get_counts()['appointments'], 200)
+        self.assertEqual(sum(dashboard_stats(date(2000, 1, 1), date(2100, 1, 1))['by_status'].values()), 200)
+
+        Appointment.objects.all().delete()
+        Patient.objects.all().delete()
+        Therapist.objects.all().delete()
+        seed_catalog(therapists=4, patients=30, appointments=200, seed=7, today=date(2024, 6, 1))
+        again = list(Appointment.objects.order_by('pk').values_list('therapist_id', 'patient_id', 'date', 'time',
+                                                                     'service', 'status'))
+        # Same rows apart from the primary keys, which carry on from the deleted ones
+        self.assertEqual([row[2:] for row in again], [row[2:] for row in rows])
+        self.assertEqual(summary['start'], '2024-05-20')
+
+    def test_seed_command_rebuilds_indexes_and_flushes(self):
+        call_command('seed', therapists=2, patients=10, appointments=50, stdout=StringIO())
+        seed_catalog(therapists=2, patients=10, appointments=50, defer_indexes=True)
+        with connection.cursor() as cursor:
+            indexes = set(connection.introspection.get_constraints(cursor, 'catalog_appointment'))
+        for index in Appointment._meta.indexes + Appointment._meta.constraints:
+            self.assertIn(index.name, indexes)
+        self.assertEqual(Appointment.objects.count(), 100)
+        self.assertEqual(search('patients', Patient.objects.first().name)[0].name, Patient.objects.first().name)
+        AppointmentSeries.objects.create(therapist=Therapist.objects.first(), patient=Patient.objects.first(),
+                                         start_date=date.today(), time=time(10), count=2)
+
+        call_command('seed', therapists=1, patients=3, appointments=5, flush=True, stdout=StringIO())
+        self.assertEqual((Therapist.objects.count(), Patient.objects.count(), Appointment.objects.count()), (1, 3, 5))
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(get_counts()['patients'], 3)
+
+    def test_benchmark_covers_every_url(self):
+        seed_catalog(therapists=2, patients=5, appointments=10)
+        labels = [route[0] for route in build_routes()]
+        self.assertIn('logout', labels)
+        self.assertEqual(len(labels), len(set(labels)))
+
+
+class QueryBudgetMixin:
+    """Fails a test when the view behind a URL runs more queries than its declared query_budget."""
+
+    def assertWithinQueryBudget(self, url):
+        match = resolve(url.split('?')[0])
+        budget = get_query_budget(match.func)
+        self.assertIsNotNone(budget, f"{match.view_name} declares no query_budget")
+        # Measure the uncached path
+        get_cache().clear()
+        # Every database, as QueryTimingMiddleware counts them, so that reads routed to a replica count too
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in connections if alias in self.databases]
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        queries = [query for context in captured for query in context.captured_queries]
+        self.assertLess(response.status_code, 400)
+        self.assertLessEqual(len(queries), budget, f"{match.view_name} ran {len(queries)} queries, its budget is "
+                             f"{budget}:\n" + '\n'.join(query['sql'] for query in queries))
+        return response
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(therapists=3, patients=20, appointments=60, seed=1)
+        cls.therapist = Therapist.objects.first()
+        cls.patient = Patient.objects.exclude(date_of_birth=None).first()
+        cls.appointment = Appointment.objects.first()
+
+    def test_read_views_stay_within_budget(self):
+        urls = [
+            reverse('catalog:index'),
+            reverse('catalog:therapist_list'),
+            reverse('catalog:therapist_list') + '?q=dr',
+            reverse('catalog:therapist_detail', args=[self.therapist.pk]),
+            reverse('catalog:patient_list'),
+            reverse('catalog:patient_list') + f'?q={self.patient.name.split()[0]}',
+            reverse('catalog:patient_detail', args=[self.patient.pk]),
+            reverse('catalog:appointment_list'),
+            reverse('catalog:appointment_list') + f'?therapist={self.therapist.pk}&status=Pending',
+            reverse('catalog:appointment_detail', args=[self.appointment.pk]),
+            reverse('catalog:therapist_dashboard'),
+            reverse('catalog:next_available'),
+            reverse('catalog:search') + '?q=dr',
+            reverse('catalog:api_list', args=['appointments']),
+            reverse('catalog:api_detail', args=['appointments', self.appointment.pk]),
+            reverse('catalog:export', args=['appointments']),
+        ]
+        for name in ('therapist_list', 'patient_list', 'appointment_list', 'therapist_dashboard'):
+            urls.append(reverse(f'catalog:async_{name}'))
+        urls.append(reverse('catalog:async_appointment_list') + f'?therapist={self.therapist.pk}')
+        for name, obj in (('therapist_detail', self.therapist), ('patient_detail', self.patient),
+                          ('appointment_detail', self.appointment)):
+            urls.append(reverse(f'catalog:async_{name}', args=[obj.pk]))
+        for url in urls:
+            with self.subTest(url):
+                self.assertWithinQueryBudget(url)
+
+    def test_budget_catches_lazy_foreign_keys(self):
+        url = reverse('catalog:appointment_detail', args=[self.appointment.pk])
+        with mock.patch.object(AppointmentDetailView, 'queryset', Appointment.objects.all()):
+            with self.assertRaises(AssertionError):
+                self.assertWithinQueryBudget(url)
+
+    def test_middleware_reports_queries(self):
+        with self.assertLogs('catalog.requests', 'INFO') as logs:
+            response = self.client.get(reverse('catalog:appointment_detail', args=[self.appointment.pk]))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", db-slowest;dur=[\d.]+, '
+                                                    r'total;dur=[\d.]+$')
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['view'], 'catalog:appointment_detail')
+        self.assertEqual(entry['query_budget'], 3)
+        self.assertLessEqual(entry['queries'], 2)
+        self.assertIn('SELECT', entry['slowest_sql'])
+
+    async def test_middleware_reports_queries_of_async_views(self):
+        with self.assertLogs('catalog.requests', 'INFO') as logs:
+            response = await self.async_client.get(reverse('catalog:async_therapist_list'))
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(entry['view'], 'catalog:async_therapist_list')
+        self.assertGreater(entry['queries'], 0)
+        self.assertIn(f'desc="{entry["queries"]} queries"', response['Server-Timing'])
+
+    def test_middleware_chain_stays_async_under_asgi(self):
+        with mock.patch.object(BaseHandler, 'adapt_method_mode', autospec=True,
+                               side_effect=BaseHandler.adapt_method_mode) as adapt:
+            ASGIHandler()
+        # (mode wanted, mode of the handler) for each middleware and the chain as a whole
+        modes = [call.args[1:4:2] for call in adapt.call_args_list if len(call.args) > 3]
+        self.assertTrue(modes)
+        self.assertEqual(set(modes), {(True, True)})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaQueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    # Inside a TestCase transaction every read goes to the primary
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        refresh_replica('replica')
+        unpin_primary()
+
+    def test_budget_counts_replica_reads(self):
+        with mock.patch.object(TherapistListView, 'query_budget', 0), self.assertRaises(AssertionError):
+            self.assertWithinQueryBudget(reverse('catalog:therapist_list'))
+
+
+class SQLiteProfileTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite only")
+    def test_pragmas_applied_to_new_connections(self):
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -1234, 'busy_timeout': 4321}):
+            new_connection = connections.create_connection('default')
+            try:
+                with new_connection.cursor() as cursor:
+                    cursor.execute('PRAGMA cache_size')
+                    self.assertEqual(cursor.fetchone()[0], -1234)
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 4321)
+            finally:
+                new_connection.close()
+
+    def test_production_profile(self):
+        from merakitherapy import settings_production
+
+        self.assertEqual(settings_production.SQLITE_PRAGMAS['journal_mode'], 'WAL')
+        self.assertGreater(settings_production.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        refresh_replica('replica')
+        unpin_primary()
+
+    def tearDown(self):
+        unpin_primary()
+
+    def test_reads_from_replica_until_refreshed(self):
+        therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        self.assertEqual(therapist._state.db, 'default')
+        unpin_primary()
+        self.assertFalse(Therapist.objects.filter(pk=therapist.pk).exists())
+
+        refresh_replica('replica')
+        self.assertEqual(Therapist.objects.get(pk=therapist.pk)._state.db, 'replica')
+        # Other apps stay on the primary
+        self.assertEqual(User.objects.all().db, 'default')
+
+    def test_reads_after_a_write_use_the_primary(self):
+        therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        self.assertEqual(Therapist.objects.get(pk=therapist.pk)._state.db, 'default')
+
+    def test_session_reads_its_own_writes(self):
+        response = self.client.post(reverse('catalog:patient_registration'), {
+            'name': 'Wanjiru', 'date_of_birth': '1990-01-01', 'gender': 'F', 'contact': '0711111111'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('read_primary', response.cookies)
+
+        self.assertContains(self.client.get(reverse('catalog:patient_list')), 'Wanjiru')
+        self.assertNotContains(self.client_class().get(reverse('catalog:patient_list')), 'Wanjiru')
+
+
+JOB_CALLS = []
+
+
+@task(name='tests.record')
+def record_job_call(value):
+    JOB_CALLS.append(value)
+
+
+@task(name='tests.fail', max_attempts=2)
+def failing_job():
+    raise ValueError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_worker_runs_due_jobs(self):
+        for value in range(3):
+            record_job_call.enqueue(value=value)
+        later = record_job_call.enqueue({'delay': 3600}, value='later')
+        call_command('run_worker', '--burst', processes=1, stdout=StringIO())
+
+        self.assertEqual(JOB_CALLS, [0, 1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+        metrics = job_metrics(window=60)
+        self.assertEqual((metrics['queued'], metrics['due'], metrics['lag_s']), (1, 0, 0.0))
+        self.assertEqual(metrics['done_per_s'], 0.05)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = failing_job.enqueue()
+        [claimed] = claim('worker')
+        with self.assertLogs('catalog.jobs', 'WARNING'):
+            self.assertFalse(run(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertEqual(claim('worker'), [])
+
+        [claimed] = claim('worker', now=job.run_at)
+        with self.assertLogs('catalog.jobs', 'ERROR'):
+            run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_expired_lease_is_taken_over(self):
+        record_job_call.enqueue(value=1)
+        [stale] = claim('first')
+        self.assertEqual(claim('second'), [])
+        [job] = claim('second', now=stale.leased_until + timedelta(seconds=1))
+        self.assertEqual((job.worker, job.attempts), ('second', 2))
+
+        # The first worker finishing late does not touch the new lease
+        run(stale)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.RUNNING, 'second'))
+        run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_locked_database_does_not_stop_the_worker(self):
+        update = QuerySet.update
+        locked = []
+
+        def locked_while(fails):
+            def side_effect(queryset, **fields):
+                # Only the UPDATE that records the outcome
+                if fields.get('lease_token') == '' and len(locked) < fails:
+                    locked.append(fields)
+                    raise OperationalError('database is locked')
+                return update(queryset, **fields)
+            return side_effect
+
+        for value in range(2):
+            record_job_call.enqueue(value=value)
+        with mock.patch('catalog.jobs.time.sleep'), \
+                mock.patch.object(QuerySet, 'update', autospec=True, side_effect=locked_while(1)):
+            self.assertEqual(work('worker', burst=True), 2)
+        self.assertEqual(JOB_CALLS, [0, 1])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+        # Locked for good: logged, and the worker moves on to the next job
+        locked.clear()
+        for value in range(2, 4):
+            record_job_call.enqueue(value=value)
+        with mock.patch('catalog.jobs.time.sleep'), self.assertLogs('catalog.jobs', 'ERROR'), \
+                mock.patch.object(QuerySet, 'update', autospec=True, side_effect=locked_while(FINISH_ATTEMPTS)):
+            self.assertEqual(work('worker', burst=True), 2)
+        self.assertEqual(JOB_CALLS, [0, 1, 2, 3])
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 1)
+
+    def test_tasks_enqueue_their_arguments(self):
+        job = tasks.send_reminders.enqueue({'queue': 'reminders', 'delay': 60}, window_hours=6)
+        self.assertEqual((job.task, job.kwargs, job.queue),
+                         ('catalog.send_reminders', {'window_hours': 6}, 'reminders'))
+        [claimed] = claim('worker', queue='reminders', now=job.run_at)
+        with mock.patch('catalog.tasks.reminders.send_reminders') as send:
+            self.assertTrue(run(claimed))
+        send.assert_called_once_with(6, 'upcoming')
+
+    def test_queue_lag(self):
+        enqueue('tests.record', {'value': 1}, run_at=timezone.now() - timedelta(seconds=90))
+        self.assertGreaterEqual(job_metrics()['lag_s'], 90)
+
+
+class ReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        therapist = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        patient = Patient.objects.create(name="Wanjiru O'Neil", gender='F', contact='0711111111')
+        cls.now = timezone.make_aware(datetime(2025, 6, 2, 10, 30))
+        cls.due = []
+        for day, at, status, due in ((2, 10, 'Pending', False), (2, 11, 'Pending', True), (2, 15, 'Canceled', False),
+                                     (3, 9, 'Pending', True), (3, 11, 'Pending', False)):
+            appointment = Appointment.objects.create(therapist=therapist, patient=patient, date=date(2025, 6, day),
+                                                     time=time(at), service='TRAUMA', status=status)
+            if due:
+                cls.due.append(appointment.pk)
+        Appointment.objects.create(therapist=therapist, date=date(2025, 6, 2), time=time(16), service='TRAUMA')
+
+    def test_sends_each_due_reminder_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reminders.jsonl')
+            # Two queries per batch and one to find there is nothing left, each in a savepoint
+            with self.assertNumQueries(12):
+                stats = send_reminders(window_hours=24, now=self.now, batch_size=1, sender=FileSender(path))
+            self.assertEqual(stats, {'sent': 2, 'failed': 0, 'batches': 2})
+            with open(path) as f:
+                payloads = [json.loads(line) for line in f]
+        self.assertEqual([payload['appointment_id'] for payload in payloads], self.due)
+        self.assertEqual(payloads[0]['to'], '0711111111')
+        self.assertIn("Hello Wanjiru O'Neil, this is a reminder of your TRAUMA appointment with Dr. Amani on "
+                      "Monday 2 June at 11:00.", payloads[0]['message'])
+
+        sender = mock.Mock(spec=BaseSender)
+        sender.send_batch.return_value = []
+        self.assertEqual(send_reminders(now=self.now, sender=sender)['sent'], 0)
+        # Another kind is sent independently
+        self.assertEqual(send_reminders(kind='day_before', now=self.now, sender=sender)['sent'], 2)
+        self.assertEqual(Reminder.objects.count(), 4)
+
+    def test_failed_reminders_are_sent_next_run(self):
+        sender = mock.Mock(spec=BaseSender)
+        sender.send_batch.side_effect = lambda payloads: [payloads[0]['appointment_id']]
+        self.assertEqual(send_reminders(now=self.now, sender=sender), {'sent': 1, 'failed': 1, 'batches': 1})
+        sender.send_batch.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            send_reminders(now=self.now, sender=sender)
+        self.assertEqual(list(Reminder.objects.values_list('appointment_id', flat=True)), self.due[1:])
+
+        sender.send_batch.side_effect = None
+        sender.send_batch.return_value = []
+        self.assertEqual(send_reminders(now=self.now, sender=sender)['sent'], 1)
+        self.assertEqual(sorted(Reminder.objects.values_list('appointment_id', flat=True)), self.due)
+
+    def test_deleted_appointments_take_their_reminders(self):
+        sender = mock.Mock(spec=BaseSender)
+        sender.send_batch.return_value = []
+        send_reminders(now=self.now, sender=sender)
+        Appointment.objects.get(pk=self.due[0]).delete()
+        self.assertEqual(list(Reminder.objects.values_list('appointment_id', flat=True)), self.due[1:])
+        # And through the cascade from the therapist
+        Therapist.objects.get().delete()
+        self.assertFalse(Reminder.objects.exists())
+
+    def test_dry_run(self):
+        out = StringIO()
+        with mock.patch('catalog.management.commands.send_reminders.reminder_window',
+                        lambda window: reminder_window(window, self.now)):
+            call_command('send_reminders', '--dry-run', stdout=out)
+        self.assertIn('2 upcoming reminders due', out.getvalue())
+        self.assertFalse(Reminder.objects.exists())
+
+
+class AssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.monday = today + timedelta(days=7 - today.weekday())
+        cls.amani = Therapist.objects.create(name='Dr. Amani', contact='0700000000', specialization='TRAUMA')
+        cls.baraka = Therapist.objects.create(name='Dr. Baraka', contact='0700000001', specialization='TRAUMA')
+        cls.chebet = Therapist.objects.create(name='Dr. Chebet', contact='0700000002', specialization='FAMILY')
+        busy = Therapist.objects.create(name='Dr. Juma', contact='0700000003', specialization='TRAUMA',
+                                        availability='B')
+        for therapist in (cls.amani, cls.baraka, cls.chebet, busy):
+            WorkingHours.objects.create(therapist=therapist, weekday=0, start_time=time(9), end_time=time(12))
+        Appointment.objects.create(therapist=cls.amani, date=cls.monday, time=time(11), service='TRAUMA')
+
+        def unassigned(service, day, hour, status='Pending'):
+            return Appointment.objects.create(date=day, time=time(hour), service=service, status=status).pk
+
+        tuesday = cls.monday + timedelta(days=1)
+        cls.first, cls.second, cls.third, cls.family = (
+            unassigned('TRAUMA', cls.monday, 9), unassigned('TRAUMA', cls.monday, 10),
+            unassigned('TRAUMA', cls.monday, 11), unassigned('FAMILY', cls.monday, 9))
+        cls.no_service, cls.no_hours = unassigned('', cls.monday, 10), unassigned('TRAUMA', tuesday, 9)
+        unassigned('TRAUMA', cls.monday, 10, status='Canceled')
+
+    def test_plan_picks_least_loaded_free_therapist(self):
+        with CaptureQueriesContext(connection) as queries:
+            plan = plan_assignments()
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        # Amani starts with one appointment and is not free at 11; ties go to the lower id
+        self.assertEqual([(pk, therapist_id) for pk, therapist_id, day, at in plan['assignments']], [
+            (self.first, self.baraka.pk), (self.family, self.chebet.pk), (self.second, self.amani.pk),
+            (self.third, self.baraka.pk),
+        ])
+        self.assertEqual(plan['unassigned'], {self.no_service: NO_SERVICE, self.no_hours: NO_FREE_THERAPIST})
+        self.assertEqual(plan['load'], {self.amani.pk: 2, self.baraka.pk: 2, self.chebet.pk: 1})
+        self.assertEqual(len(plan_assignments(limit=2)['assignments']), 2)
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('assign_therapists', '--dry-run', stdout=out)
+        self.assertIn('Would assign 4 of 6 appointments', out.getvalue())
+        self.assertIn('1 appointments left unassigned: no service', out.getvalue())
+        self.assertEqual(Appointment.objects.filter(therapist__isnull=True).count(), 7)
+
+    def test_assigns_and_updates_slots_and_rollup(self):
+        plan = assign_therapists()
+        self.assertEqual((plan['assigned'], plan['conflicts']), (4, []))
+        self.assertEqual(Appointment.objects.get(pk=self.second).therapist, self.amani)
+        self.assertEqual(Appointment.objects.get(pk=self.family).therapist, self.chebet)
+        self.assertEqual(sorted(FreeSlot.objects.filter(date=self.monday, specialization='TRAUMA')
+                                .values_list('therapist__name', 'time')),
+                         [('Dr. Amani', time(9)), ('Dr. Baraka', time(10))])
+        self.assertEqual(therapist_loads(), {self.amani.pk: 2, self.baraka.pk: 2, self.chebet.pk: 1})
+        # Nothing left to do
+        self.assertEqual(assign_therapists()['assignments'], [])
+
+    def test_appointments_changed_meanwhile_are_left_alone(self):
+        def plan_then_cancel(*args, **kwargs):
+            plan = plan_assignments(*args, **kwargs)
+            Appointment.objects.filter(pk=self.third).update(status='Canceled')
+            return plan
+
+        with mock.patch('catalog.assignment.plan_assignments', plan_then_cancel):
+            plan = assign_therapists()
+        self.assertEqual((plan['assigned'], plan['conflicts']), (3, [self.third]))
+        self.assertIsNone(Appointment.objects.get(pk=self.third).therapist)
+        self.assertTrue(FreeSlot.objects.filter(therapist=self.baraka, date=self.monday, time=time(11)).exists())
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import api, async_views, views
 
 app_name = 'catalog'
 
@@ -27,6 +27,30 @@ urlpatterns = [
     path('appointment/<int:pk>/', views.AppointmentDetailView.as_view(), name='appointment_detail'),
     path('update_appointment/<int:appointment_id>/', views.update_appointment, name='update_appointment'),
     path('delete_appointment/<int:appointment_id>/', views.appointment_delete, name='delete_appointment'),
+    path('next_available/', views.next_available, name='next_available'),
+
+    # Recurring appointments
+    path('create_series/', views.create_series, name='create_series'),
+    path('series/<int:series_id>/', views.update_series, name='update_series'),
+
+    # Search over patients and therapists
+    path('search/', views.search_catalog, name='search'),
+
+    # Read-only JSON API
+    path('api/<slug:kind>/', api.resource_list, name='api_list'),
+    path('api/<slug:kind>/<int:pk>/', api.resource_detail, name='api_detail'),
+
+    # Async versions of the read views, for serving under ASGI
+    path('async/therapist/', async_views.therapist_list, name='async_therapist_list'),
+    path('async/therapist/<int:pk>/', async_views.therapist_detail, name='async_therapist_detail'),
+    path('async/patient/', async_views.patient_list, name='async_patient_list'),
+    path('async/patient/<int:pk>/', async_views.patient_detail, name='async_patient_detail'),
+    path('async/appointment/', async_views.appointment_list, name='async_appointment_list'),
+    path('async/appointment/<int:pk>/', async_views.appointment_detail, name='async_appointment_detail'),
+    path('async/therapist_dashboard/', async_views.therapist_dashboard, name='async_therapist_dashboard'),
+
+    # Streaming CSV/JSONL exports
+    path('export/<slug:kind>/', views.export, name='export'),
 
     # Logging in and out
     path('login/', views.login_user, name='login'),
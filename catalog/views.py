@@ -1,24 +1,45 @@
+from datetime import datetime, time, timedelta
+
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import Count, Avg
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.views import generic
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from .forms import PatientRegistrationForm, TherapistRegistrationForm, AppointmentForm
-from .models import Appointment, Patient, Therapist
-
-
+from .availability import next_free_slots
+from .booking import SlotTaken, book_appointment
+from .cache import cache_catalog_view, version_stamp
+from .counters import GENDER_COUNTERS, get_counts
+from .exports import CONTENT_TYPES, EXPORTS, stream_export
+from .middleware import query_budget
+from .forms import (PatientRegistrationForm, TherapistRegistrationForm, AppointmentForm, AppointmentFilterForm,
+                    AppointmentSeriesForm, SeriesChangeForm, NextAvailableForm, DashboardRangeForm, PatientAgeForm,
+                    SearchForm)
+from .models import Appointment, AppointmentSeries, ArchivedAppointment, Patient, Therapist
+from .pagination import keyset_paginate
+from .search import filter_queryset as search_filter, search
+from .series import book_series, cancel_series, change_series
+from .stats import dashboard_stats
+from .visits import record_visit, total_visits
+
+
+@query_budget(3)
 def index(request):
-    # Generate counts of some of the main objects
-    num_appointments = Appointment.objects.all().count()
-    num_patients = Patient.objects.all().count()
-    num_therapists = Therapist.objects.count()
+    # Counts of the main objects, kept up to date by signals
+    counts = get_counts()
+    num_appointments = counts['appointments']
+    num_patients = counts['patients']
+    num_therapists = counts['therapists']
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 1)
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, counted in the cache and stored in batches
+    # so that viewing the page never writes a session row
+    record_visit()
+    num_visits = total_visits()
 
     # Render the HTML template catalog/index.html with the data in the context variable.
     return render(request, 'catalog/index.html',
@@ -57,67 +78,196 @@ def logout_user(request):
     return redirect('index')
 
 
-class AppointmentListView(generic.ListView):
+class RowVersionMixin:
+    # Tables the cached per-row template fragments depend on
+    row_version_kinds = ()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['row_version'] = version_stamp(self.row_version_kinds)
+        return context
+
+
+class AppointmentListView(RowVersionMixin, generic.ListView):
     model = Appointment
     template_name = 'catalog/appointment_list.html'
     context_object_name = 'appointments'
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-
-
+    # The page, the row fragment version stamp, the therapist filter choices
+    # and looking up the chosen therapist
+    query_budget = 4
+    page_size = 50
+    row_version_kinds = ('appointments', 'therapists')
+    # Must match Appointment.Meta.ordering and end with a unique column
+    keyset_fields = ('date', 'time', 'appointment_id')
+
+    def get_queryset(self):
+        self.filter_form = AppointmentFilterForm(self.request.GET)
+        queryset = Appointment.objects.select_related('therapist', 'patient')
+        if self.filter_form.is_valid():
+            queryset = self.filter_form.filter_queryset(queryset)
+
+        self.page = keyset_paginate(queryset, self.keyset_fields,
+                                    after=self.request.GET.get('after'),
+                                    before=self.request.GET.get('before'),
+                                    per_page=self.page_size)
+        return self.page.object_list
+
+    def get_page_query(self, key, cursor):
+        # Keep the active filters when moving between pages
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[key] = cursor
+        return query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        context['page'] = self.page
+        if self.page.has_next:
+            context['next_query'] = self.get_page_query('after', self.page.next_cursor)
+        if self.page.has_previous:
+            context['previous_query'] = self.get_page_query('before', self.page.previous_cursor)
+        return context
+
+
+@method_decorator(cache_catalog_view('appointments', 'therapists', 'patients'), name='dispatch')
 class AppointmentDetailView(generic.DetailView):
     model = Appointment
+    # The template shows the therapist and patient names
+    queryset = Appointment.objects.select_related('therapist', 'patient')
+    # One more when the appointment has been archived
+    query_budget = 3
     template_name = 'catalog/appointment_detail.html'
     context_object_name = 'appointment'
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Archived appointments keep their ids
+            return get_object_or_404(ArchivedAppointment.objects.select_related('therapist', 'patient'),
+                                     pk=self.kwargs['pk'])
 
-class PatientListView(generic.ListView):
+
+@method_decorator(cache_catalog_view('patients'), name='dispatch')
+class PatientListView(RowVersionMixin, generic.ListView):
     model = Patient
     template_name = 'catalog/patient_list.html'
     context_object_name = 'patients'
-
-
+    # Cache key and row versions, plus two for a search
+    query_budget = 4
+    row_version_kinds = ('patients',)
+
+    def get_queryset(self):
+        # Ranked matches from the search index when a query is given
+        query = self.request.GET.get('q', '').strip()
+        self.age_form = PatientAgeForm(self.request.GET)
+        if query:
+            return search('patients', query, limit=50)
+        queryset = super().get_queryset()
+        if self.age_form.is_valid():
+            # A date_of_birth range, so the database filters on its index
+            queryset = queryset.age_between(self.age_form.cleaned_data['min_age'],
+                                            self.age_form.cleaned_data['max_age'])
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(age_form=self.age_form, **kwargs)
+
+
+@method_decorator(cache_catalog_view('patients'), name='dispatch')
 class PatientDetailView(generic.DetailView):
     model = Patient
     template_name = 'catalog/patient_detail.html'
     context_object_name = 'patient'
+    query_budget = 2
+
+    def get_queryset(self):
+        # Not a class attribute: the age is computed for the day of the request
+        return Patient.objects.with_age()
 
 
-class TherapistListView(generic.ListView):
+@method_decorator(cache_catalog_view('therapists'), name='dispatch')
+class TherapistListView(RowVersionMixin, generic.ListView):
     model = Therapist
     template_name = 'catalog/therapist_list.html'
     context_object_name = 'therapists'
+    # Cache key and row versions, plus two for a search
+    query_budget = 4
+    row_version_kinds = ('therapists',)
+
+    def get_queryset(self):
+        # Ranked matches from the search index when a query is given
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            return search('therapists', query, limit=50)
+        return super().get_queryset()
 
 
+@method_decorator(cache_catalog_view('therapists'), name='dispatch')
 class TherapistDetailView(generic.DetailView):
     model = Therapist
     template_name = 'catalog/therapist_detail.html'
     context_object_name = 'therapist'
+    query_budget = 2
 
 
-def therapist_dashboard(request):
-    # Number of patients
-    num_patients = Patient.objects.count()
-
-    # Number of appointments
-    num_appointments = Appointment.objects.count()
-
-    # Gender distribution
-    gender_distribution = Patient.objects.values('gender').annotate(count=Count('gender'))
-    total_gender_count = sum(entry['count'] for entry in gender_distribution)
+def gender_distribution(counts):
+    # Gender distribution from the per-gender counters
+    distribution = []
+    for code, label in Patient.GENDER_CHOICES:
+        count = counts[GENDER_COUNTERS[code]]
+        if count:
+            distribution.append({'gender': code, 'count': count})
+    total_gender_count = sum(entry['count'] for entry in distribution)
 
     # Calculate percentage for each gender
-    for entry in gender_distribution:
+    for entry in distribution:
         entry['percent'] = (entry['count'] / total_gender_count) * 100
+    return distribution
+
+
+def age_distribution(bands):
+    # Share of patients per age band, from Patient.objects.age_bands()
+    total = sum(entry['count'] for entry in bands)
+    return [dict(entry, percent=entry['count'] / total * 100 if total else 0) for entry in bands]
+
 
-    # Most chosen specialization
-    most_chosen_specialization = Therapist.objects.values('specialization').annotate(
-        count=Count('specialization')).order_by('-count').first()
+def most_chosen_specialization_queryset():
+    return Therapist.objects.values('specialization').annotate(count=Count('specialization')).order_by('-count')
+
+
+def dashboard_range(request):
+    # Appointment volume for the selected range, 30 days either side of today by default
+    range_form = DashboardRangeForm(request.GET)
+    today = timezone.localdate()
+    date_from, date_to = today - timedelta(days=30), today + timedelta(days=30)
+    if range_form.is_valid():
+        date_from = range_form.cleaned_data['date_from'] or date_from
+        date_to = range_form.cleaned_data['date_to'] or date_to
+    return range_form, date_from, date_to
+
+
+@query_budget(4)
+def therapist_dashboard(request):
+    counts = get_counts()
+    range_form, date_from, date_to = dashboard_range(request)
 
     context = {
-        'num_patients': num_patients,
-        'num_appointments': num_appointments,
-        'gender_distribution': gender_distribution,
-        'most_chosen_specialization': most_chosen_specialization,
+        # Number of patients
+        'num_patients': counts['patients'],
+        # Number of appointments
+        'num_appointments': counts['appointments'],
+        'gender_distribution': gender_distribution(counts),
+        'age_distribution': age_distribution(Patient.objects.age_bands()),
+        # Most chosen specialization
+        'most_chosen_specialization': most_chosen_specialization_queryset().first(),
+        'range_form': range_form,
+        'date_from': date_from,
+        'date_to': date_to,
+        'appointment_stats': dashboard_stats(date_from, date_to),
     }
 
     return render(request, 'catalog/therapist_dashboard.html', context)
@@ -199,9 +349,12 @@ def create_appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            appointment = form.save()
-
-            return redirect('catalog:appointment_detail', pk=appointment.pk)
+            try:
+                appointment = book_appointment(form.save(commit=False))
+            except SlotTaken as e:
+                form.add_error(None, e)
+            else:
+                return redirect('catalog:appointment_detail', pk=appointment.pk)
     else:
         form = AppointmentForm()
 
@@ -215,8 +368,12 @@ def update_appointment(request, appointment_id):
     if request.method == 'POST':
         form = AppointmentForm(request.POST, instance=appointment)
         if form.is_valid():
-            form.save()
-            return redirect('appointment-detail', appointment_id=appointment.pk)
+            try:
+                book_appointment(form.save(commit=False))
+            except SlotTaken as e:
+                form.add_error(None, e)
+            else:
+                return redirect('catalog:appointment_detail', pk=appointment.pk)
     else:
         form = AppointmentForm(instance=appointment)
 
@@ -227,3 +384,116 @@ def appointment_delete(request, appointment_id):
     appointment = Appointment.objects.get(pk=appointment_id)
     appointment.delete()
     return redirect('catalog:appointment_list')
+
+
+# Recurring appointments
+def create_series(request):
+    if request.method == 'POST':
+        form = AppointmentSeriesForm(request.POST)
+        if form.is_valid():
+            try:
+                series = form.save(commit=False)
+                book_series(series)
+            except SlotTaken as e:
+                form.add_error(None, e)
+            else:
+                return redirect('catalog:update_series', series_id=series.pk)
+    else:
+        form = AppointmentSeriesForm()
+
+    return render(request, 'catalog/create_series.html', {'form': form})
+
+
+def update_series(request, series_id):
+    series = get_object_or_404(AppointmentSeries.objects.select_related('therapist', 'patient'), pk=series_id)
+
+    if request.method == 'POST':
+        form = SeriesChangeForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            try:
+                if request.POST.get('action') == 'cancel':
+                    changed = cancel_series(series, data['from_date'])
+                    messages.success(request, f"Canceled {changed} appointments.")
+                else:
+                    changed = change_series(series, data['from_date'], data['therapist'], data['time'],
+                                            data['service'])
+                    messages.success(request, f"Updated {changed} appointments.")
+            except SlotTaken as e:
+                form.add_error(None, e)
+            else:
+                return redirect('catalog:update_series', series_id=series.pk)
+    else:
+        form = SeriesChangeForm(initial={'from_date': timezone.localdate()})
+
+    appointments = series.appointments.select_related('therapist')
+    return render(request, 'catalog/update_series.html',
+                  {'series': series, 'form': form, 'appointments': appointments})
+
+
+@query_budget(1)
+def next_available(request):
+    form = NextAvailableForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    data = form.cleaned_data
+    after = None
+    if data['date']:
+        after = datetime.combine(data['date'], data['time'] or time.min)
+    slots = next_free_slots(data['specialization'], after, data['limit'] or 10)
+
+    return JsonResponse({
+        'slots': [
+            {
+                'therapist_id': slot.therapist_id,
+                'therapist': slot.therapist.name,
+                'specialization': slot.specialization,
+                'date': slot.date,
+                'time': slot.time,
+            }
+            for slot in slots
+        ],
+    })
+
+
+@query_budget(1)
+def export(request, kind):
+    if kind not in EXPORTS:
+        raise Http404("No such export")
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in CONTENT_TYPES:
+        return JsonResponse({'errors': {'format': ['Use csv or jsonl.']}}, status=400)
+
+    queryset = archived = None
+    if kind == 'appointments':
+        # Same filters as the appointment list, applied to archived appointments too
+        filter_form = AppointmentFilterForm(request.GET)
+        if not filter_form.is_valid():
+            return JsonResponse({'errors': filter_form.errors}, status=400)
+        queryset = filter_form.filter_queryset(Appointment.objects.all())
+        archived = filter_form.filter_queryset(ArchivedAppointment.objects.all())
+    elif request.GET.get('q', '').strip():
+        # Same search as the patient and therapist lists
+        queryset = search_filter(kind, EXPORTS[kind]['model'].objects.all(), request.GET['q'])
+
+    response = StreamingHttpResponse(stream_export(kind, fmt, queryset, archived), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@query_budget(4)
+def search_catalog(request):
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    data = form.cleaned_data
+    kinds = [data['kind']] if data['kind'] else ['patients', 'therapists']
+    results = {}
+    for kind in kinds:
+        results[kind] = [
+            {'id': obj.pk, 'name': obj.name, 'url': obj.get_absolute_url()}
+            for obj in search(kind, data['q'], data['limit'] or 20)
+        ]
+    return JsonResponse(results)
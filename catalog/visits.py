@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import Counter
+
+PENDING_KEY = 'catalog:visits:pending'
+STORED_KEY = 'catalog:visits:stored'
+COUNTER_NAME = 'visits'
+
+
+def _flush_every():
+    return getattr(settings, 'VISIT_FLUSH_EVERY', 100)
+
+
+def _incr(cache, key, delta=1):
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+def record_visit():
+    """
+    Count a visit in the cache and write to the database once per
+    VISIT_FLUSH_EVERY visits. At most that many visits are lost if the
+    cache is cleared before they are flushed.
+    """
+    cache = get_cache()
+    batch = _flush_every()
+    if _incr(cache, PENDING_KEY) < batch:
+        return
+    # Claim one batch; if another request got there first the count goes negative, so give it back
+    if _incr(cache, PENDING_KEY, -batch) < 0:
+        _incr(cache, PENDING_KEY, batch)
+        return
+    if not Counter.objects.filter(name=COUNTER_NAME).update(value=F('value') + batch, updated=timezone.now()):
+        Counter.objects.create(name=COUNTER_NAME, value=batch)
+    cache.delete(STORED_KEY)
+
+
+def total_visits():
+    cache = get_cache()
+    stored = cache.get(STORED_KEY)
+    if stored is None:
+        stored = Counter.objects.filter(name=COUNTER_NAME).values_list('value', flat=True).first() or 0
+        cache.set(STORED_KEY, stored, timeout=60)
+    return stored + max(cache.get(PENDING_KEY, 0), 0)
@@ -22,6 +22,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it also counts the queries of the middleware below
+    'catalog.middleware.QueryTimingMiddleware',
+    'catalog.middleware.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -29,7 +32,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, but able to run async so that the chain stays async under ASGI
+    'catalog.middleware.StaticFilesMiddleware',
 ]
 
 ROOT_URLCONF = 'merakitherapy.urls'
@@ -38,8 +42,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parse each template once per process instead of on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -56,9 +66,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Read-only copy of default, kept up to date by "manage.py refresh_replicas --interval 5"
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
 }
 
+# Reads of the catalog models go to these aliases, writes to default. Empty reads from default too.
+DATABASE_ROUTERS = ['catalog.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# Seconds a browser keeps reading from default after a write, at least the replicas' refresh interval
+DATABASE_REPLICA_LAG = 10
+
+# PRAGMAs run on every new SQLite connection; settings_production.py turns on WAL
+SQLITE_PRAGMAS = {}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'merakitherapy',
+    },
+    # Used by {% cache %} for the per-row fragments of the list templates
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'merakitherapy-fragments',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Response cache for the catalog list and detail views (catalog/cache.py).
+# Local memory is per process; point the alias at a FileBasedCache to share
+# entries between worker processes.
+CATALOG_CACHE_ENABLED = True
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+
+# Sessions are read from the cache and written to the database only when they
+# change. Use 'django.contrib.sessions.backends.signed_cookies' to keep them
+# out of the database entirely.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# index() counts visits in the cache and adds them to the database in batches of this size
+VISIT_FLUSH_EVERY = 100
+
+# archive_appointments moves Completed and Canceled appointments dated more than this many days ago
+APPOINTMENT_ARCHIVE_AFTER_DAYS = 365
+
+# send_reminders reminds patients of pending appointments in the next REMINDER_WINDOW_HOURS through
+# REMINDER_SENDER, built with REMINDER_SENDER_OPTIONS. catalog.reminders.FileSender takes {'path': ...}.
+REMINDER_SENDER = 'catalog.reminders.ConsoleSender'
+REMINDER_SENDER_OPTIONS = {}
+REMINDER_WINDOW_HOURS = 24
+REMINDER_BATCH_SIZE = 1000
+
+# Background jobs (catalog.jobs): a worker holds a job for JOB_LEASE_SECONDS before another may take it over.
+# Failed jobs are retried after JOB_BACKOFF_SECONDS, doubling each time up to JOB_BACKOFF_MAX_SECONDS.
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF_SECONDS = 10
+JOB_BACKOFF_MAX_SECONDS = 3600
+# Finished jobs are kept this long for job_stats, then removed by the catalog.purge_jobs task
+JOB_KEEP_SECONDS = 86400
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,3 +177,20 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# One JSON line per request with its SQL query count and time, shown on the console while DEBUG is on
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'require_debug_true': {'()': 'django.utils.log.RequireDebugTrue'},
+    },
+    'handlers': {
+        'request_stats': {'class': 'logging.StreamHandler', 'filters': ['require_debug_true']},
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'catalog.requests': {'handlers': ['request_stats'], 'level': 'INFO', 'propagate': False},
+        'catalog.jobs': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
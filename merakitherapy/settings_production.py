@@ -0,0 +1,31 @@
+"""
+Production profile. Run with DJANGO_SETTINGS_MODULE=merakitherapy.settings_production.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'default': {
+        **DATABASES['default'],
+        # Write transactions wait for the lock instead of failing, see merakitherapy/sqlite3/base.py
+        'ENGINE': 'merakitherapy.sqlite3',
+        # Keep connections open between requests instead of reconnecting every time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
+# Applied to every new SQLite connection by catalog.signals.configure_sqlite_connection
+SQLITE_PRAGMAS = {
+    # Readers keep reading while a writer commits
+    'journal_mode': 'WAL',
+    # Safe with WAL: a power cut can lose the last commits but never corrupts the file
+    'synchronous': 'NORMAL',
+    # 64 MB page cache and up to 256 MB of the file memory-mapped
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    # Wait up to 5s for a lock instead of failing with "database is locked"
+    'busy_timeout': 5000,
+}
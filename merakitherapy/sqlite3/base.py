@@ -0,0 +1,12 @@
+"""
+SQLite backend that starts transactions with BEGIN IMMEDIATE, like the
+"transaction_mode" option added in Django 5.1.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        # Take the write lock up front. A deferred transaction that reads and then writes fails at once with
+        # "database is locked" if another connection wrote in between, and busy_timeout cannot help it.
+        self.cursor().execute('BEGIN IMMEDIATE')